@@ -0,0 +1,216 @@
+"""Benchmark de carga end-to-end para /oauth/consent y /oauth/token.
+
+Levanta la app FastAPI en proceso (ASGI, sin sockets), con un stand-in local
+de Supabase y Redis falso (o uno real vía --redis-url), ejecuta flujos
+consent → token concurrentes y emite un reporte JSON por endpoint.
+
+Uso:
+    python -m benchmarks.oauth_load --concurrency 50 --flows 2000
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+
+import httpx
+import jwt
+
+from src.oauth.audit import AuditSink, audit_pipeline
+from src.oauth.code_store import RedisCodeStore
+from src.oauth.consent import app
+from src.oauth.rate_limit import rate_limiter
+from src.oauth.session import SessionValidator
+
+FAKE_SUPABASE_URL = "http://supabase.local"
+FAKE_SUPABASE_SECRET = "bench-supabase-secret"
+CLIENT_ID = "bench-client"
+REDIRECT_URI = "https://bench.local/callback"
+SCOPES = "invoices.read payments.read"
+
+class CountingAuditSink(AuditSink):
+    """Sink que descarta las entradas (solo cuenta) para no medir stdout"""
+
+    def __init__(self):
+        self.written = 0
+
+    async def write_batch(self, entries: list) -> None:
+        self.written += len(entries)
+
+
+def make_fake_supabase(latency_ms: float):
+    """Stand-in de {SUPABASE_URL}/auth/v1/user: acepta JWT firmados con el secreto local"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        token = request.headers.get("Authorization", "").replace("Bearer ", "")
+        try:
+            claims = jwt.decode(token, FAKE_SUPABASE_SECRET, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return httpx.Response(401, json={"msg": "invalid token"})
+        return httpx.Response(200, json={"id": claims["sub"]})
+
+    return httpx.MockTransport(handler)
+
+
+def make_session_token(user_id: str) -> str:
+    return jwt.encode({"sub": user_id, "exp": int(time.time()) + 3600},
+                      FAKE_SUPABASE_SECRET, algorithm="HS256")
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Percentil nearest-rank sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = 0
+
+    def record(self, started: float, ok: bool) -> None:
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors += 1
+
+    def report(self, duration_s: float) -> dict:
+        values = sorted(self.latencies_ms)
+        requests = len(values)
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "error_rate": self.errors / requests if requests else 0.0,
+            "throughput_rps": requests / duration_s if duration_s else 0.0,
+            "latency_ms": {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "mean": sum(values) / requests if requests else 0.0,
+                "max": values[-1] if values else 0.0,
+            },
+        }
+
+
+async def run_flow(client: httpx.AsyncClient, session_token: str, stats: dict) -> None:
+    """Un flujo completo consent → token"""
+    started = time.perf_counter()
+    try:
+        response = await client.get(
+            "/oauth/consent",
+            params={"client_id": CLIENT_ID, "redirect_uri": REDIRECT_URI,
+                    "scope": SCOPES, "state": "bench"},
+            headers={"Authorization": f"Bearer {session_token}"},
+        )
+        location = response.headers.get("location", "")
+        ok = response.status_code == 307 and "code=" in location
+    except Exception:
+        ok = False
+    stats["/oauth/consent"].record(started, ok)
+    if not ok:
+        return
+
+    code = location.split("code=")[1].split("&")[0]
+    started = time.perf_counter()
+    try:
+        response = await client.post("/oauth/token", params={"code": code, "client_id": CLIENT_ID})
+        ok = response.status_code == 200
+    except Exception:
+        ok = False
+    stats["/oauth/token"].record(started, ok)
+
+
+async def run_benchmark(args) -> dict:
+    if args.redis_url:
+        code_store = RedisCodeStore.from_url(args.redis_url)
+    else:
+        import fakeredis.aioredis
+        code_store = RedisCodeStore(fakeredis.aioredis.FakeRedis())
+
+    # Mismo cableado que el lifespan, con dependencias locales
+    app.state.code_store = code_store
+    app.state.session_validator = SessionValidator(
+        httpx.AsyncClient(transport=make_fake_supabase(args.supabase_latency_ms)),
+        FAKE_SUPABASE_URL, "bench-anon-key",
+    )
+    audit_sink = CountingAuditSink()
+    await audit_pipeline.start(audit_sink)
+    # El limitador se mide activo (sync incluido) pero sin throttling del propio benchmark
+    rate_limiter.client_limit = rate_limiter.user_limit = 4 * (args.flows + args.warmup)
+    await rate_limiter.start(code_store.client)
+
+    session_tokens = [make_session_token(f"bench-user-{i}") for i in range(args.users)]
+    stats = {"/oauth/consent": EndpointStats(), "/oauth/token": EndpointStats()}
+    transport = httpx.ASGITransport(app=app)
+
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp.local") as client:
+            for i in range(args.warmup):
+                await run_flow(client, session_tokens[i % args.users], {
+                    "/oauth/consent": EndpointStats(), "/oauth/token": EndpointStats()})
+
+            remaining = iter(range(args.flows))
+
+            async def worker():
+                for i in remaining:
+                    await run_flow(client, session_tokens[i % args.users], stats)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            duration_s = time.perf_counter() - started
+    finally:
+        await rate_limiter.stop()
+        await audit_pipeline.stop()
+        await app.state.session_validator.close()
+        await code_store.close()
+
+    completed = len(stats["/oauth/token"].latencies_ms) - stats["/oauth/token"].errors
+    return {
+        "config": {
+            "flows": args.flows,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "warmup": args.warmup,
+            "supabase_latency_ms": args.supabase_latency_ms,
+            "redis": args.redis_url or "fakeredis",
+        },
+        "duration_s": duration_s,
+        "completed_flows": completed,
+        "flows_per_s": completed / duration_s if duration_s else 0.0,
+        "audit_entries_written": audit_sink.written,
+        "endpoints": {endpoint: s.report(duration_s) for endpoint, s in stats.items()},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga OAuth consent → token")
+    parser.add_argument("--flows", type=int, default=2000, help="flujos consent → token a ejecutar")
+    parser.add_argument("--concurrency", type=int, default=50, help="flujos concurrentes")
+    parser.add_argument("--users", type=int, default=100, help="sesiones Supabase distintas")
+    parser.add_argument("--warmup", type=int, default=50, help="flujos de calentamiento (no medidos)")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0,
+                        help="latencia simulada del stand-in de Supabase")
+    parser.add_argument("--redis-url", default=None, help="Redis real (por defecto fakeredis)")
+    parser.add_argument("--output", default=None, help="archivo JSON de salida (por defecto stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(payload + "\n")
+    else:
+        sys.stdout.write(payload + "\n")
+    failed = any(e["errors"] for e in report["endpoints"].values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Microbenchmark de firma en el camino de /oauth/token.
+
+Compara la emisión de access + refresh token con jwt.encode genérico
+(implementación previa) contra el codec HS256 de src.oauth.token_codec.
+
+Uso:
+    python -m benchmarks.token_codec_bench --iterations 20000
+"""
+import argparse
+import json
+import sys
+import timeit
+import warnings
+from datetime import datetime, timedelta
+
+import jwt
+
+from src.oauth.token import (
+    MCP_ACCESS_TOKEN_SECRET,
+    MCP_REFRESH_TOKEN_SECRET,
+    generate_access_token,
+    generate_refresh_token,
+)
+from src.oauth.token_codec import now_ts
+
+USER_ID = "bench-user"
+CLIENT_ID = "bench-client"
+SCOPES = ["invoices.read", "payments.read"]
+
+def pyjwt_token_path():
+    """Implementación previa: jwt.encode + datetime.utcnow() por token"""
+    access = jwt.encode({
+        "sub": USER_ID,
+        "client_id": CLIENT_ID,
+        "scopes": SCOPES,
+        "exp": datetime.utcnow() + timedelta(hours=1),
+        "type": "access_token"
+    }, MCP_ACCESS_TOKEN_SECRET, algorithm="HS256")
+    refresh = jwt.encode({
+        "sub": USER_ID,
+        "client_id": CLIENT_ID,
+        "exp": datetime.utcnow() + timedelta(days=30),
+        "type": "refresh_token"
+    }, MCP_REFRESH_TOKEN_SECRET, algorithm="HS256")
+    return access, refresh
+
+def codec_token_path():
+    """Camino actual de exchange_code_for_token"""
+    now = now_ts()
+    return (generate_access_token(USER_ID, SCOPES, CLIENT_ID, now=now),
+            generate_refresh_token(USER_ID, CLIENT_ID, now=now))
+
+def measure(fn, iterations: int, repeat: int) -> float:
+    """Mejor tiempo por llamada en microsegundos"""
+    best = min(timeit.repeat(fn, number=iterations, repeat=repeat))
+    return best / iterations * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmark de firma de tokens")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # InsecureKeyLengthWarning con secretos de desarrollo
+        # El camino nuevo debe seguir verificándose con PyJWT
+        access, _ = codec_token_path()
+        jwt.decode(access, MCP_ACCESS_TOKEN_SECRET, algorithms=["HS256"])
+
+        pyjwt_us = measure(pyjwt_token_path, args.iterations, args.repeat)
+        codec_us = measure(codec_token_path, args.iterations, args.repeat)
+
+    report = {
+        "path": "/oauth/token (access + refresh)",
+        "iterations": args.iterations,
+        "pyjwt_us_per_request": pyjwt_us,
+        "codec_us_per_request": codec_us,
+        "speedup": pyjwt_us / codec_us,
+    }
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,6 +32,7 @@ setup(
         "dev": [
             "pytest>=8.0",
             "pytest-asyncio>=0.23",
+            "fakeredis>=2.20",
             "black>=24.0",
             "flake8>=7.0",
         ],
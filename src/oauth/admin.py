@@ -0,0 +1,15 @@
+import hmac
+import os
+
+from fastapi import HTTPException, Request
+
+# Configuración
+MCP_ADMIN_TOKEN = os.getenv("MCP_ADMIN_TOKEN")
+
+def check_admin_token(request: Request) -> None:
+    """Operaciones de administración (provisioning, revocación por sujeto, auditoría): MCP_ADMIN_TOKEN"""
+    if not MCP_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Operación de administración no configurada")
+    presented = request.headers.get("Authorization", "").replace("Bearer ", "")
+    if not hmac.compare_digest(presented.encode(), MCP_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Operación de administración no autorizada")
@@ -0,0 +1,266 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+
+from .metrics import Counter, Gauge, registry
+
+# Configuración
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "32"))  # requests concurrentes
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "512"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+ADMISSION_DEADLINE_SECONDS = float(os.getenv("ADMISSION_DEADLINE_SECONDS", "2.0"))  # desde la llegada
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))  # × latencia base
+ADMISSION_BACKOFF = 0.9  # factor de reducción multiplicativa
+BASELINE_DRIFT = 0.001  # la latencia base sube despacio para seguir cambios reales del servicio
+
+# Prioridad por endpoint (menor = antes): canjear un code ya emitido va antes que emitir otro
+ENDPOINT_PRIORITIES = {
+    "/oauth/token": 0,
+    "/oauth/consent": 1,
+}
+
+admission_limit = registry.register(Gauge(
+    "mcp_admission_limit", "Límite de concurrencia adaptativo", ("group",)
+))
+admission_inflight = registry.register(Gauge(
+    "mcp_admission_inflight", "Requests admitidos en curso", ("group",)
+))
+admission_rejected = registry.register(Counter(
+    "mcp_admission_rejected_total", "Requests rechazados por admisión", ("endpoint", "reason")
+))
+
+
+class AdmissionRejected(Exception):
+    """El request no puede admitirse a tiempo (cola llena, desplazado o sin tiempo)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("future", "controller", "priority", "deadline", "endpoint")
+
+    def __init__(self, future, controller, priority: int, deadline: float, endpoint: str):
+        self.future = future
+        self.controller = controller
+        self.priority = priority
+        self.deadline = deadline
+        self.endpoint = endpoint
+
+
+# === COLA DE ESPERA COMPARTIDA ===
+class AdmissionQueue:
+    """Cola acotada por (prioridad, deadline) compartida por los limitadores de varios endpoints.
+
+    La prioridad solo decide a quién se entrega un hueco liberado (cada
+    waiter, dentro del límite de su propio endpoint) y a quién se desplaza
+    con la cola llena; no comparte límites ni latencias entre endpoints.
+    """
+
+    def __init__(self, queue_size: int = ADMISSION_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._heap = []  # heap de (prioridad, deadline, seq, waiter)
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._controllers = set()
+
+    def push(self, waiter: _Waiter) -> None:
+        if self._waiting >= self.queue_size:
+            self._evict(waiter.priority, waiter.deadline)
+        heapq.heappush(self._heap, (waiter.priority, waiter.deadline, next(self._seq), waiter))
+        self._controllers.add(waiter.controller)
+        self._waiting += 1
+        waiter.controller._waiting += 1
+
+    def abandon(self, waiter: _Waiter) -> None:
+        if not waiter.future.done():
+            waiter.future.cancel()
+            self._discard(waiter)
+
+    def _discard(self, waiter: _Waiter) -> None:
+        self._waiting -= 1
+        waiter.controller._waiting -= 1
+
+    def _evict(self, priority: int, deadline: float) -> None:
+        """Cola llena: desplaza al peor en espera si el nuevo va antes; si no, rechaza al nuevo"""
+        live = [entry for entry in self._heap if not entry[3].future.done()]
+        worst = max(live, key=lambda entry: entry[:2], default=None)
+        if worst is None or worst[:2] <= (priority, deadline):
+            raise AdmissionRejected("queue_full")
+        self._reject(worst[3], "evicted")
+
+    def _reject(self, waiter: _Waiter, reason: str) -> None:
+        waiter.future.set_exception(AdmissionRejected(reason))
+        self._discard(waiter)
+
+    def dispatch(self) -> None:
+        """Entrega los huecos libres en orden de (prioridad, deadline), cada uno en el límite de su endpoint"""
+        deferred = []
+        blocked = set()
+        while self._heap and len(blocked) < len(self._controllers):
+            entry = heapq.heappop(self._heap)
+            waiter = entry[3]
+            if waiter.future.done():
+                continue
+            controller = waiter.controller
+            if controller in blocked or not controller.has_room():
+                blocked.add(controller)
+                deferred.append(entry)
+                continue
+            if controller.clock() + controller.average > waiter.deadline:
+                self._reject(waiter, "deadline")
+                continue
+            self._discard(waiter)
+            controller._admit()
+            waiter.future.set_result(None)
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+
+
+# === LIMITADOR DE CONCURRENCIA ADAPTATIVO (AIMD) ===
+class AdmissionController:
+    """Límite de concurrencia AIMD de un endpoint según su propia latencia observada.
+
+    Si la latencia de un request supera la latencia base × tolerancia, el límite
+    baja multiplicativamente (como mucho una vez por latencia media); si no,
+    crece en 1/límite mientras se esté usando. Cada endpoint tiene su límite,
+    su latencia base y su media: un endpoint lento no reduce el límite de uno
+    rápido. Lo que excede el límite espera en la AdmissionQueue (propia o
+    compartida): pasa el primero que aún puede terminar antes de su deadline
+    según la latencia media; el resto se rechaza en cuanto deja de poder hacerlo.
+    """
+
+    def __init__(self, group: str, initial_limit: int = ADMISSION_INITIAL_LIMIT,
+                 min_limit: int = ADMISSION_MIN_LIMIT, max_limit: int = ADMISSION_MAX_LIMIT,
+                 queue_size: int = ADMISSION_QUEUE_SIZE, tolerance: float = ADMISSION_LATENCY_TOLERANCE,
+                 clock=time.monotonic, queue: AdmissionQueue = None):
+        self.group = group
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.clock = clock
+        self.queue = queue if queue is not None else AdmissionQueue(queue_size)
+        self.inflight = 0
+        self.baseline = None  # latencia sin carga estimada (mínimo con deriva)
+        self.average = 0.0  # EWMA de latencia: tiempo esperado de servicio
+        self._last_decrease = 0.0
+        self._waiting = 0  # waiters de este endpoint en la cola
+        admission_limit.set(self.limit, group)
+
+    def has_room(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    # --- admisión ---
+    async def acquire(self, priority: int, deadline: float, endpoint: str = "") -> None:
+        """Espera un hueco; AdmissionRejected si no llega a tiempo"""
+        now = self.clock()
+        if self.has_room() and not self._waiting:
+            self._admit()
+            return
+        if now + self.average > deadline:
+            raise AdmissionRejected("deadline")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), self, priority, deadline, endpoint)
+        self.queue.push(waiter)
+        try:
+            # Pasado este punto ya no terminaría antes del deadline
+            await asyncio.wait({waiter.future}, timeout=max(0.0, deadline - self.average - now))
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(None)  # el hueco llegó junto con la cancelación
+            else:
+                self.queue.abandon(waiter)
+            raise
+        if not waiter.future.done():
+            self.queue.abandon(waiter)
+            raise AdmissionRejected("deadline")
+        waiter.future.result()  # AdmissionRejected si fue desplazado o descartado
+
+    def _admit(self) -> None:
+        self.inflight += 1
+        admission_inflight.set(self.inflight, self.group)
+
+    def release(self, latency) -> None:
+        """Libera el hueco; `latency` (segundos) ajusta el límite, None no cuenta como muestra"""
+        self.inflight -= 1
+        if latency is not None:
+            self._observe(latency)
+        self.queue.dispatch()
+        admission_inflight.set(self.inflight, self.group)
+
+    # --- ajuste del límite ---
+    def _observe(self, latency: float) -> None:
+        if self.baseline is None:
+            self.baseline = self.average = latency
+        self.baseline = min(latency, self.baseline * (1 + BASELINE_DRIFT))
+        self.average += 0.1 * (latency - self.average)
+        now = self.clock()
+        if latency > self.baseline * self.tolerance:
+            # Una reducción por "ronda": los requests lentos de la misma ráfaga no la repiten
+            if now - self._last_decrease >= self.average:
+                self.limit = max(self.min_limit, self.limit * ADMISSION_BACKOFF)
+                self._last_decrease = now
+        elif self.inflight + 1 >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        admission_limit.set(self.limit, self.group)
+
+
+# Un limitador por endpoint; la cola (y con ella la prioridad) es común
+admission_queue = AdmissionQueue()
+admission_controllers = {
+    path: AdmissionController(path, queue=admission_queue) for path in ENDPOINT_PRIORITIES
+}
+
+# === MIDDLEWARE ASGI ===
+class AdmissionMiddleware:
+    """Aplica el control de admisión a los endpoints de ENDPOINT_PRIORITIES (503 si se rechaza)"""
+
+    def __init__(self, app, controllers: dict = None,
+                 deadline_seconds: float = ADMISSION_DEADLINE_SECONDS):
+        self.app = app
+        self.controllers = controllers
+        self.deadline_seconds = deadline_seconds
+
+    async def __call__(self, scope, receive, send):
+        priority = ENDPOINT_PRIORITIES.get(scope.get("path")) if scope["type"] == "http" else None
+        if priority is None or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        controllers = self.controllers if self.controllers is not None else admission_controllers
+        controller = controllers[scope["path"]]
+        arrived = controller.clock()
+        try:
+            await controller.acquire(priority, arrived + self.deadline_seconds, scope["path"])
+        except AdmissionRejected as e:
+            admission_rejected.inc(scope["path"], e.reason)
+            await _send_overloaded(send)
+            return
+
+        started = controller.clock()
+        latency = None
+        try:
+            await self.app(scope, receive, send)
+            latency = controller.clock() - started
+        finally:
+            controller.release(latency)
+
+
+async def _send_overloaded(send) -> None:
+    body = json.dumps({"detail": "Servicio saturado, reintentar"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", b"1"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,291 @@
+import asyncio
+import glob
+import json
+import os
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import httpx
+
+from .audit_rollups import audit_rollups
+from .metrics import current_latency_ms
+
+# Configuración
+AUDIT_QUEUE_MAX_SIZE = int(os.getenv("AUDIT_QUEUE_MAX_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))  # segundos
+AUDIT_SPILL_PATH = os.getenv("AUDIT_SPILL_PATH", "audit_spill.ndjson")
+
+# Columnas de la tabla audit_log en Supabase (las entradas llevan además client_id para el almacén local)
+AUDIT_LOG_COLUMNS = ("id", "timestamp", "request_id", "service_account_id", "scope", "action",
+                     "mcp_endpoint", "status", "http_status", "latency_ms", "error_code", "error_message")
+
+# === SINKS DE AUDITORÍA ===
+class AuditSink(ABC):
+    """Destino de escritura en lote de entradas de audit_log"""
+
+    @abstractmethod
+    async def write_batch(self, entries: list) -> None:
+        """Escribe un lote completo; debe lanzar excepción si no se pudo"""
+
+
+class PrintAuditSink(AuditSink):
+    """Sink de desarrollo: imprime cada entrada"""
+
+    async def write_batch(self, entries: list) -> None:
+        for entry in entries:
+            print(f"Audit event: {entry}")
+
+
+class SupabaseAuditSink(AuditSink):
+    """Inserta lotes en la tabla audit_log vía PostgREST (un POST por lote)"""
+
+    def __init__(self, client: httpx.AsyncClient, supabase_url: str, service_key: str):
+        self.client = client
+        self.url = f"{supabase_url}/rest/v1/audit_log"
+        self.headers = {
+            "apikey": service_key,
+            "Authorization": f"Bearer {service_key}",
+            "Prefer": "return=minimal",
+        }
+
+    async def write_batch(self, entries: list) -> None:
+        rows = [{column: entry.get(column) for column in AUDIT_LOG_COLUMNS} for entry in entries]
+        response = await self.client.post(self.url, json=rows, headers=self.headers)
+        response.raise_for_status()
+
+
+def create_audit_sink(client: httpx.AsyncClient) -> AuditSink:
+    """Supabase si hay credenciales configuradas; si no, stdout"""
+    supabase_url = os.getenv("SUPABASE_URL")
+    service_key = os.getenv("SUPABASE_KEY")
+    if supabase_url and service_key:
+        return SupabaseAuditSink(client, supabase_url, service_key)
+    return PrintAuditSink()
+
+
+# === PIPELINE ASYNC EN LOTES ===
+class AuditPipeline:
+    """Cola acotada en proceso que vacía por tamaño o tiempo y derrama a disco si el sink falla"""
+
+    def __init__(self, max_size: int = AUDIT_QUEUE_MAX_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, spill_path: str = AUDIT_SPILL_PATH):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.sink = None
+        self.store = None
+        self._queue = None
+        self._worker = None
+        self._spilled = False
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    async def start(self, sink: AuditSink, store=None) -> None:
+        """Reenvía lo derramado en ejecuciones previas y arranca el worker.
+
+        `store` (AuditStore opcional) recibe cada lote una sola vez, antes del
+        sink; los reenvíos del archivo de derrame no vuelven a pasar por él.
+        """
+        self.sink = sink
+        self.store = store
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        await asyncio.to_thread(self._recover_orphaned_claims)
+        self._spilled = not await self._replay_spill()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Vacía la cola pendiente y detiene el worker"""
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def enqueue(self, entry: dict) -> None:
+        """Encola una entrada; espera (backpressure) si la cola está llena"""
+        await self._queue.put(entry)
+
+    async def enqueue_batch(self, entries: list) -> None:
+        """Encola un lote como un único elemento: se escribe en la misma llamada al sink"""
+        if entries:
+            await self._queue.put(list(entries))
+
+    async def join(self) -> None:
+        """Espera a que todo lo encolado haya sido escrito o derramado"""
+        await self._queue.join()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = item if isinstance(item, list) else [item]
+            items = 1
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items += 1
+                if item is None:
+                    stopping = True
+                    break
+                if isinstance(item, list):
+                    batch.extend(item)
+                else:
+                    batch.append(item)
+            if self.store is not None:
+                await self._archive(batch)
+            await self._flush(batch)
+            for _ in range(items):
+                self._queue.task_done()
+            if stopping:
+                return
+
+    async def _archive(self, batch: list) -> None:
+        try:
+            await asyncio.to_thread(self.store.append_batch, batch)
+        except Exception as e:
+            print(f"Audit store unavailable ({e}); {len(batch)} entries not archived locally")
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            await self.sink.write_batch(batch)
+        except Exception as e:
+            print(f"Audit sink unavailable ({e}); spilling {len(batch)} entries to {self.spill_path}")
+            await asyncio.to_thread(self._spill, batch)
+            self._spilled = True
+            return
+        if self._spilled:
+            # El sink volvió: reenviar lo derramado
+            self._spilled = not await self._replay_spill()
+
+    def _spill(self, batch: list) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as fh:
+            for entry in batch:
+                fh.write(json.dumps(entry) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _claim_spill(self):
+        """Reclama el archivo de derrame renombrándolo (atómico): solo un worker lo reenvía.
+
+        Lo que otros workers derramen mientras tanto va a un archivo nuevo.
+        None si no hay nada que reenviar (o otro worker ya lo reclamó).
+        """
+        claimed = f"{self.spill_path}.replay-{os.getpid()}"
+        try:
+            os.rename(self.spill_path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _recover_orphaned_claims(self) -> None:
+        """Devuelve al archivo de derrame lo reclamado por workers que murieron a mitad de un reenvío"""
+        for path in glob.glob(f"{glob.escape(self.spill_path)}.replay-*"):
+            pid = path.rsplit("-", 1)[1]
+            # El pid propio también: al arrancar no hay reenvío en curso (pid reutilizado tras reinicio)
+            if not pid.isdigit() or (int(pid) != os.getpid() and _process_alive(int(pid))):
+                continue
+            adopted = f"{path}.adopted-{os.getpid()}"
+            try:
+                os.rename(path, adopted)  # otro worker puede estar adoptándolo a la vez
+            except FileNotFoundError:
+                continue
+            with open(adopted, "r", encoding="utf-8") as fh:
+                self._spill([json.loads(line) for line in fh if line.strip()])
+            os.remove(adopted)
+
+    async def _replay_spill(self) -> bool:
+        """Reenvía el archivo de derrame; True si no quedó nada pendiente"""
+        claimed = await asyncio.to_thread(self._claim_spill)
+        if claimed is None:
+            return True
+        with open(claimed, "r", encoding="utf-8") as fh:
+            entries = [json.loads(line) for line in fh if line.strip()]
+        sent = 0
+        try:
+            for sent in range(0, len(entries), self.batch_size):
+                await self.sink.write_batch(entries[sent:sent + self.batch_size])
+        except Exception as e:
+            # Devolver solo los lotes no enviados: reenviar los ya escritos duplicaría filas
+            print(f"Audit sink unavailable ({e}); keeping {len(entries) - sent} entries in "
+                  f"{self.spill_path} for later replay")
+            await asyncio.to_thread(self._spill, entries[sent:])
+            return False
+        finally:
+            os.remove(claimed)
+        return True
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # existe, de otro usuario
+    return True
+
+
+audit_pipeline = AuditPipeline()
+
+# === LOGGING DE AUDITORÍA ===
+def build_audit_entry(user_id: str, client_id: str, requested_scopes: list,
+                      status: str, action: str, reason: str = None, latency_ms: float = None) -> dict:
+    """Construye una entrada de audit_log (latencia: la medida del request actual)"""
+    if latency_ms is None:
+        latency_ms = current_latency_ms() or 0
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.utcnow().isoformat(),
+        "request_id": str(uuid.uuid4()),
+        "service_account_id": user_id,
+        "client_id": client_id,
+        "scope": " ".join(requested_scopes),
+        "action": action,
+        "mcp_endpoint": f"/oauth/{'consent' if 'consent' in action else 'token'}",
+        "status": status,
+        "http_status": 200 if status == "granted" else 403,
+        "latency_ms": latency_ms,
+        "error_code": reason,
+        "error_message": reason
+    }
+
+async def log_audit_event(user_id: str, client_id: str, requested_scopes: list,
+                        status: str, action: str, reason: str = None):
+    """Registra evento en audit_log (solo encola; el pipeline escribe en lote)"""
+
+    audit_entry = build_audit_entry(user_id, client_id, requested_scopes, status, action, reason)
+    if audit_rollups.running:
+        # Sin worker de volcado (scripts, benchmark) los conteos solo se acumularían
+        audit_rollups.record(audit_entry)
+
+    if audit_pipeline.running:
+        await audit_pipeline.enqueue(audit_entry)
+    else:
+        # Sin lifespan (scripts, tests): escritura directa
+        print(f"Audit event: {audit_entry}")
+
+async def log_audit_batch(entries: list):
+    """Registra varias entradas ya construidas como un solo lote"""
+    if audit_rollups.running:
+        for audit_entry in entries:
+            audit_rollups.record(audit_entry)
+    if audit_pipeline.running:
+        await audit_pipeline.enqueue_batch(entries)
+    else:
+        for audit_entry in entries:
+            print(f"Audit event: {audit_entry}")
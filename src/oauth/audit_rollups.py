@@ -0,0 +1,244 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, HTTPException, Request
+
+from .admin import check_admin_token
+from .metrics import Counter, registry
+
+# Configuración
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "1.0"))  # segundos
+ROLLUP_MINUTE_RETENTION = int(os.getenv("ROLLUP_MINUTE_RETENTION", str(6 * 3600)))
+ROLLUP_HOUR_RETENTION = int(os.getenv("ROLLUP_HOUR_RETENTION", str(14 * 86400)))
+ROLLUP_DAY_RETENTION = int(os.getenv("ROLLUP_DAY_RETENTION", str(400 * 86400)))
+ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "100000"))  # contadores (bucket, campo) sin volcar
+
+# (nombre, tamaño del bucket en segundos, retención en segundos), de fino a grueso
+RESOLUTIONS = (
+    ("minute", 60, ROLLUP_MINUTE_RETENTION),
+    ("hour", 3600, ROLLUP_HOUR_RETENTION),
+    ("day", 86400, ROLLUP_DAY_RETENTION),
+)
+DIMENSIONS = ("client_id", "scope", "status", "action")
+FIELD_SEPARATOR = "\x1f"  # no aparece en client_id/scope/status/action
+
+rollup_dropped = registry.register(Counter(
+    "mcp_audit_rollup_dropped_total", "Incrementos de rollup descartados por límite de pendientes", ("reason",)
+))
+
+router = APIRouter()
+
+def _entry_time(entry: dict) -> float:
+    """timestamp ISO naive UTC de la entrada -> epoch"""
+    return datetime.fromisoformat(entry["timestamp"]).replace(tzinfo=timezone.utc).timestamp()
+
+# === ROLLUPS INCREMENTALES ===
+class AuditRollups:
+    """Conteos por (client_id, scope, status, action) en buckets de minuto/hora/día.
+
+    record() solo incrementa contadores locales (pre-agregación); un worker en
+    segundo plano los vuelca a Redis (HINCRBY en pipeline, un hash por bucket con
+    EXPIRE según la retención de su resolución). Las consultas leen buckets, no
+    eventos: su coste depende del rango pedido, no del volumen de auditoría.
+    Sin Redis los buckets viven en el proceso.
+    """
+
+    KEY_PREFIX = "rollup:"
+
+    def __init__(self, flush_interval: float = ROLLUP_FLUSH_INTERVAL, max_pending: int = ROLLUP_MAX_PENDING,
+                 clock=time.time):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.clock = clock
+        self.client = None
+        self._pending = {}  # (resolución, inicio del bucket) -> {campo: conteo}
+        self._pending_count = 0  # contadores en _pending; acotado por max_pending
+        self._local = {}  # sin Redis: igual que _pending, ya consolidado
+        self._worker = None
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None
+
+    # --- escritura ---
+    def record(self, entry: dict) -> None:
+        """Cuenta una entrada de auditoría en las tres resoluciones (sin I/O).
+
+        Con max_pending contadores sin volcar (Redis caído, o nadie vaciando)
+        los campos nuevos se descartan y se cuentan en la métrica.
+        """
+        at = _entry_time(entry)
+        for scope in (entry.get("scope") or "").split() or [""]:
+            field = FIELD_SEPARATOR.join(
+                str(entry.get(dimension) or "") if dimension != "scope" else scope
+                for dimension in DIMENSIONS
+            )
+            for name, size, _ in RESOLUTIONS:
+                slot = (name, int(at // size) * size)
+                bucket = self._pending.get(slot)
+                if bucket is None or field not in bucket:
+                    if self._pending_count >= self.max_pending:
+                        rollup_dropped.inc("pending_full")
+                        continue
+                    self._pending_count += 1
+                    if bucket is None:
+                        bucket = self._pending[slot] = {}
+                bucket[field] = bucket.get(field, 0) + 1
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._pending_count = 0
+        if self.client is None:
+            for slot, counts in pending.items():
+                bucket = self._local.setdefault(slot, {})
+                for field, count in counts.items():
+                    bucket[field] = bucket.get(field, 0) + count
+            self._expire_local()
+            return
+        now = self.clock()
+        sizes = {name: (size, keep) for name, size, keep in RESOLUTIONS}
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for (name, start), counts in pending.items():
+                key = f"{self.KEY_PREFIX}{name}:{start}"
+                for field, count in counts.items():
+                    pipe.hincrby(key, field, count)
+                size, keep = sizes[name]
+                pipe.expire(key, max(1, int(start + size + keep - now)))
+            await pipe.execute()
+        except Exception:
+            # Redis no disponible: reintentar en el siguiente volcado
+            for slot, counts in pending.items():
+                bucket = self._pending.setdefault(slot, {})
+                for field, count in counts.items():
+                    bucket[field] = bucket.get(field, 0) + count
+            self._pending_count = sum(len(bucket) for bucket in self._pending.values())
+            raise
+
+    def _expire_local(self) -> None:
+        now = self.clock()
+        sizes = {name: (size, keep) for name, size, keep in RESOLUTIONS}
+        for name, start in list(self._local):
+            size, keep = sizes[name]
+            if start + size + keep < now:
+                del self._local[(name, start)]
+
+    # --- lectura ---
+    def plan(self, start: float, end: float) -> list:
+        """Buckets que cubren [start, end): días completos, luego horas, luego minutos.
+
+        Los bordes cuya resolución fina ya expiró se redondean al bucket más
+        grueso que los contiene (aproximación por exceso).
+        """
+        now = self.clock()
+        buckets = []
+        at = int(start // 60) * 60
+        while at < end:
+            level = 0
+            for index in range(len(RESOLUTIONS) - 1, -1, -1):
+                _, size, _ = RESOLUTIONS[index]
+                if at % size == 0 and at + size <= end:
+                    level = index
+                    break
+            while level < len(RESOLUTIONS) - 1 and at + RESOLUTIONS[level][1] + RESOLUTIONS[level][2] < now:
+                level += 1
+            name, size, _ = RESOLUTIONS[level]
+            bucket = at // size * size
+            buckets.append((name, bucket))
+            at = bucket + size
+        return buckets
+
+    async def _read(self, buckets: list) -> list:
+        if self.client is None:
+            stored = [self._local.get(slot, {}) for slot in buckets]
+        else:
+            pipe = self.client.pipeline(transaction=False)
+            for name, start in buckets:
+                pipe.hgetall(f"{self.KEY_PREFIX}{name}:{start}")
+            stored = await pipe.execute()
+        # Lo aún no volcado de este worker también cuenta
+        return [(counts, self._pending.get(slot, {})) for slot, counts in zip(buckets, stored)]
+
+    async def query(self, start: float, end: float, group_by=("client_id", "scope", "status"),
+                    **filters) -> list:
+        """Conteos agregados en [start, end) agrupados por `group_by`, filtrando por dimensión"""
+        positions = [DIMENSIONS.index(dimension) for dimension in group_by]
+        totals = {}
+        for sources in await self._read(self.plan(start, end)):
+            for counts in sources:
+                for field, count in counts.items():
+                    if isinstance(field, bytes):
+                        field = field.decode()
+                    values = field.split(FIELD_SEPARATOR)
+                    if any(values[DIMENSIONS.index(d)] != v for d, v in filters.items() if v is not None):
+                        continue
+                    group = tuple(values[p] for p in positions)
+                    totals[group] = totals.get(group, 0) + int(count)
+        return [dict(zip(group_by, group), count=count) for group, count in sorted(totals.items())]
+
+    # --- ciclo de vida ---
+    async def start(self, client=None) -> None:
+        self.client = client
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Audit rollups: último volcado fallido ({e})")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Audit rollups: volcado a Redis fallido ({e}); se reintenta")
+
+
+audit_rollups = AuditRollups()
+
+# === ENDPOINT DE CONSULTA ===
+def _parse_time(value: str, default: float) -> float:
+    """ISO-8601 -> epoch; sin offset se asume UTC"""
+    if not value:
+        return default
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end deben ser ISO-8601")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+@router.get("/audit/rollups")
+async def query_rollups(
+    request: Request,
+    start: str = None,
+    end: str = None,
+    group_by: str = "client_id,scope,status",
+    client_id: str = None,
+    scope: str = None,
+    status: str = None,
+    action: str = None
+):
+    """Conteos de auditoría por rango (por defecto, últimas 24h) desde los rollups"""
+    check_admin_token(request)
+    now = audit_rollups.clock()
+    start_ts, end_ts = _parse_time(start, now - 86400), _parse_time(end, now)
+    dimensions = tuple(d for d in group_by.split(",") if d)
+    if not set(dimensions) <= set(DIMENSIONS) or end_ts <= start_ts:
+        raise HTTPException(status_code=400, detail="Consulta de rollups inválida")
+    rows = await audit_rollups.query(start_ts, end_ts, group_by=dimensions, client_id=client_id,
+                                     scope=scope, status=status, action=action)
+    return {"start": start_ts, "end": end_ts, "rows": rows}
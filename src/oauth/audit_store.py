@@ -0,0 +1,328 @@
+import base64
+import fcntl
+import heapq
+import json
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .admin import check_admin_token
+
+# Configuración
+AUDIT_STORE_DIR = os.getenv("AUDIT_STORE_DIR")  # sin definir: sin almacén local
+AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+AUDIT_INDEX_EVERY = int(os.getenv("AUDIT_INDEX_EVERY", "256"))  # registros por bloque indexado
+AUDIT_EXPORT_MAX_LIMIT = int(os.getenv("AUDIT_EXPORT_MAX_LIMIT", "10000"))
+
+router = APIRouter()
+
+# === CODIFICACIÓN DE REGISTROS ===
+# Cabecera fija: longitud total, timestamp (µs UTC), latency_ms, http_status y la
+# longitud de cada campo de texto (0xFFFF = None); después, los textos en UTF-8.
+# client_id va primero para poder filtrar sin decodificar el resto del registro.
+STRING_FIELDS = ("client_id", "id", "request_id", "service_account_id", "scope", "action",
+                 "mcp_endpoint", "status", "error_code", "error_message")
+RECORD_HEADER = struct.Struct("<IqfH" + "H" * len(STRING_FIELDS))
+NONE_LENGTH = 0xFFFF
+MAX_STRING_BYTES = NONE_LENGTH - 1
+
+# Índice disperso: un registro por bloque cerrado (offset inicio, offset fin, ts mínimo, ts máximo)
+INDEX_ENTRY = struct.Struct("<QQqq")
+
+_EPOCH = datetime(1970, 1, 1)
+
+def timestamp_us(timestamp: str) -> int:
+    """ISO-8601 -> µs desde epoch; sin offset se asume UTC (datetime.utcnow().isoformat())"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+def encode_record(entry: dict) -> bytes:
+    texts = []
+    lengths = []
+    for field in STRING_FIELDS:
+        value = entry.get(field)
+        if value is None:
+            lengths.append(NONE_LENGTH)
+            continue
+        data = str(value).encode()[:MAX_STRING_BYTES]
+        texts.append(data)
+        lengths.append(len(data))
+    body = b"".join(texts)
+    header = RECORD_HEADER.pack(
+        RECORD_HEADER.size + len(body), timestamp_us(entry["timestamp"]),
+        float(entry.get("latency_ms") or 0), int(entry.get("http_status") or 0), *lengths
+    )
+    return header + body
+
+def decode_record(buffer, offset: int) -> dict:
+    fields = RECORD_HEADER.unpack_from(buffer, offset)
+    _, ts_us, latency_ms, http_status = fields[:4]
+    entry = {
+        "timestamp": (_EPOCH + timedelta(microseconds=ts_us)).isoformat(),
+        "http_status": http_status,
+        "latency_ms": round(latency_ms, 3),
+    }
+    position = offset + RECORD_HEADER.size
+    for field, length in zip(STRING_FIELDS, fields[4:]):
+        if length == NONE_LENGTH:
+            entry[field] = None
+            continue
+        entry[field] = bytes(buffer[position:position + length]).decode()
+        position += length
+    return entry
+
+def _record_client_id(buffer, offset: int):
+    """client_id sin decodificar el registro completo (bytes o None)"""
+    length = struct.unpack_from("<H", buffer, offset + RECORD_HEADER.size - 2 * len(STRING_FIELDS))[0]
+    if length == NONE_LENGTH:
+        return None
+    start = offset + RECORD_HEADER.size
+    return bytes(buffer[start:start + length])
+
+
+# === ALMACÉN SEGMENTADO ===
+class AuditStore:
+    """Segmentos append-only rotados por tamaño, con índice temporal disperso.
+
+    Cada proceso escribe en su propio stream (subdirectorio reclamado con flock),
+    así varios workers comparten AUDIT_STORE_DIR sin entrelazar escrituras. Las
+    lecturas recorren con mmap solo los bloques cuyo rango temporal intersecta
+    la consulta y decodifican únicamente los registros que coinciden.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = AUDIT_SEGMENT_BYTES,
+                 index_every: int = AUDIT_INDEX_EVERY):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.index_every = index_every
+        self._lock_fd = None
+        self._stream = None
+        self._data_fd = None
+        self._index_fd = None
+        self._segment = -1
+        self._size = 0
+        self._block = None  # [offset inicio, ts mínimo, ts máximo, registros]
+
+    # --- escritura ---
+    def open(self) -> None:
+        """Reclama un stream libre y abre un segmento nuevo"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        number = 0
+        while True:
+            stream = self.directory / f"stream-{number:03d}"
+            stream.mkdir(exist_ok=True)
+            fd = os.open(stream / "LOCK", os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                number += 1
+                continue
+            self._lock_fd, self._stream = fd, stream
+            break
+        segments = _segments(self._stream)
+        # Tras un reinicio se empieza segmento nuevo: la cola del anterior puede estar truncada
+        self._open_segment(segments[-1] + 1 if segments else 0)
+
+    def _open_segment(self, number: int) -> None:
+        self._close_segment()
+        self._segment = number
+        base = self._stream / f"{number:010d}"
+        flags = os.O_CREAT | os.O_WRONLY | os.O_APPEND
+        self._data_fd = os.open(f"{base}.seg", flags, 0o644)
+        self._index_fd = os.open(f"{base}.idx", flags, 0o644)
+        self._size = os.fstat(self._data_fd).st_size
+        self._block = None
+
+    def _close_segment(self) -> None:
+        if self._data_fd is None:
+            return
+        self._close_block()
+        os.fsync(self._index_fd)
+        os.close(self._data_fd)
+        os.close(self._index_fd)
+        self._data_fd = self._index_fd = None
+
+    def _close_block(self) -> None:
+        if self._block is None:
+            return
+        start, min_ts, max_ts, _ = self._block
+        os.write(self._index_fd, INDEX_ENTRY.pack(start, self._size, min_ts, max_ts))
+        self._block = None
+
+    def append_batch(self, entries: list) -> None:
+        """Añade un lote con una escritura y un fsync (bloqueante: llamar desde un hilo)"""
+        chunk = bytearray()
+        for entry in entries:
+            record = encode_record(entry)
+            if self._size + len(chunk) + len(record) > self.segment_bytes and self._size + len(chunk) > 0:
+                self._flush(chunk)
+                chunk = bytearray()
+                self._open_segment(self._segment + 1)
+            ts_us = RECORD_HEADER.unpack_from(record)[1]
+            if self._block is None:
+                self._block = [self._size + len(chunk), ts_us, ts_us, 0]
+            block = self._block
+            block[1], block[2], block[3] = min(block[1], ts_us), max(block[2], ts_us), block[3] + 1
+            chunk += record
+            if block[3] >= self.index_every:
+                self._flush(chunk)
+                chunk = bytearray()
+                self._close_block()
+        self._flush(chunk)
+        os.fsync(self._data_fd)
+        os.fsync(self._index_fd)
+
+    def _flush(self, chunk: bytearray) -> None:
+        if chunk:
+            os.write(self._data_fd, chunk)
+            self._size += len(chunk)
+
+    def close(self) -> None:
+        self._close_segment()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # --- lectura ---
+    def query(self, client_id: str = None, start_us: int = None, end_us: int = None, cursor: dict = None):
+        """Itera (cursor, entry) en orden temporal aproximado; `end_us` exclusivo.
+
+        El cursor devuelto con cada entrada reanuda justo después de ella.
+        """
+        position = dict(cursor or {})
+        wanted = client_id.encode() if client_id is not None else None
+        streams = sorted(p.name for p in self.directory.glob("stream-*") if p.is_dir())
+        iterators = [
+            self._scan_stream(name, wanted, start_us, end_us, position.get(name)) for name in streams
+        ]
+        # Merge perezoso: en memoria solo hay una entrada pendiente por stream
+        for ts, name, resume_at, entry in heapq.merge(*iterators, key=lambda item: item[0]):
+            position[name] = resume_at
+            yield dict(position), entry
+
+    def _scan_stream(self, name: str, wanted, start_us, end_us, resume):
+        stream = self.directory / name
+        resume_segment, resume_offset = resume if resume else (-1, 0)
+        for number in _segments(stream):
+            if number < resume_segment:
+                continue
+            skip_before = resume_offset if number == resume_segment else 0
+            base = stream / f"{number:010d}"
+            for next_offset, ts, entry in _scan_segment(base, wanted, start_us, end_us, skip_before):
+                yield ts, name, (number, next_offset), entry
+
+
+def _segments(stream: Path) -> list:
+    return sorted(int(p.stem) for p in stream.glob("*.seg"))
+
+def _read_index(base: Path) -> list:
+    try:
+        raw = Path(f"{base}.idx").read_bytes()
+    except FileNotFoundError:
+        return []
+    usable = len(raw) - len(raw) % INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(raw, i) for i in range(0, usable, INDEX_ENTRY.size)]
+
+def _scan_segment(base: Path, wanted, start_us, end_us, skip_before: int):
+    """(offset siguiente, ts, entry) de los registros que coinciden en un segmento"""
+    size = os.path.getsize(f"{base}.seg")
+    if size == 0:
+        return
+    index = _read_index(base)
+    # Bloques indexados que intersectan el rango + la cola aún sin indexar (siempre se recorre)
+    ranges = [
+        (block_start, block_end) for block_start, block_end, min_ts, max_ts in index
+        if (start_us is None or max_ts >= start_us) and (end_us is None or min_ts < end_us)
+    ]
+    tail = index[-1][1] if index else 0
+    if tail < size:
+        ranges.append((tail, size))
+
+    with open(f"{base}.seg", "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for block_start, block_end in ranges:
+            offset = block_start
+            while offset + RECORD_HEADER.size <= min(block_end, size):
+                length, ts_us = struct.unpack_from("<Iq", data, offset)
+                if length < RECORD_HEADER.size or offset + length > size:
+                    break  # cola truncada (caída a mitad de escritura)
+                next_offset = offset + length
+                if (offset >= skip_before
+                        and (start_us is None or ts_us >= start_us)
+                        and (end_us is None or ts_us < end_us)
+                        and (wanted is None or _record_client_id(data, offset) == wanted)):
+                    yield next_offset, ts_us, decode_record(data, offset)
+                offset = next_offset
+
+
+def create_audit_store():
+    """AuditStore en AUDIT_STORE_DIR, o None si no está configurado"""
+    if not AUDIT_STORE_DIR:
+        return None
+    store = AuditStore(AUDIT_STORE_DIR)
+    store.open()
+    return store
+
+def get_audit_store(request: Request):
+    """Almacén creado en el lifespan (404 si no hay)"""
+    store = getattr(request.app.state, "audit_store", None)
+    if store is None:
+        raise HTTPException(status_code=404, detail="Almacén de auditoría no configurado")
+    return store
+
+# === CURSORES ===
+def encode_cursor(position: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode()
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {name: (int(segment), int(offset)) for name, (segment, offset) in position.items()}
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+# === ENDPOINT DE EXPORTACIÓN ===
+@router.get("/audit/export")
+async def export_audit(
+    request: Request,
+    client_id: str = None,
+    start: str = None,
+    end: str = None,
+    limit: int = 1000,
+    cursor: str = None
+):
+    """Exporta entradas en NDJSON (streaming); la última línea trae next_cursor"""
+    # Credencial antes que nada: sin ella no se revela si el almacén está configurado
+    check_admin_token(request)
+    store = get_audit_store(request)
+    if not 0 < limit <= AUDIT_EXPORT_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail="limit fuera de rango")
+    try:
+        start_us = timestamp_us(start) if start else None
+        end_us = timestamp_us(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end deben ser ISO-8601")
+    position = decode_cursor(cursor) if cursor else None
+
+    def stream():
+        entries = store.query(client_id=client_id, start_us=start_us, end_us=end_us, cursor=position)
+        next_cursor = None
+        try:
+            for count, (resume_at, entry) in enumerate(entries, start=1):
+                yield json.dumps(entry) + "\n"
+                if count >= limit:
+                    next_cursor = encode_cursor(resume_at)
+                    break
+        finally:
+            entries.close()
+        yield json.dumps({"next_cursor": next_cursor}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .admin import check_admin_token
+from .audit import build_audit_entry, log_audit_batch
+from .code_store import CodeStore, get_code_store
+from .metrics import start_request
+from .scopes import KNOWN_SCOPES
+from .token import REFRESH_TOKEN_TTL_SECONDS, issue_token_pair
+from .token_codec import new_token_id
+
+# Configuración
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "1000"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "50"))
+BULK_SIGNING_WORKERS = int(os.getenv("BULK_SIGNING_WORKERS", "4"))
+
+router = APIRouter()
+
+# Pool de firma: los chunks se firman fuera del event loop
+signing_pool = ThreadPoolExecutor(max_workers=BULK_SIGNING_WORKERS, thread_name_prefix="mcp-signing")
+
+def _parse_items(body) -> list:
+    """Valida [{"user_id", "client_id", "scopes": [...]}, ...]"""
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items debe ser una lista no vacía")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail="Lote demasiado grande")
+
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=400, detail="Item inválido")
+        user_id, client_id, scopes = item.get("user_id"), item.get("client_id"), item.get("scopes")
+        if not (isinstance(user_id, str) and user_id and isinstance(client_id, str) and client_id):
+            raise HTTPException(status_code=400, detail="user_id y client_id requeridos")
+        if not (isinstance(scopes, list) and scopes and all(isinstance(s, str) for s in scopes)):
+            raise HTTPException(status_code=400, detail="scopes debe ser una lista de strings")
+        # Contra el catálogo configurado: igual en todos los workers, sin depender de lo internado
+        if not KNOWN_SCOPES.issuperset(scopes):
+            raise HTTPException(status_code=400, detail="Scopes desconocidos")
+        parsed.append((user_id, client_id, scopes))
+    return parsed
+
+def _sign_chunk(chunk: list) -> list:
+    """Firma un chunk de pares (se ejecuta en el pool)"""
+    signed = []
+    for user_id, client_id, scopes in chunk:
+        family_id, jti = new_token_id(), new_token_id()
+        pair = issue_token_pair(user_id, scopes, client_id, family_id, jti)
+        signed.append((user_id, client_id, scopes, family_id, jti, pair))
+    return signed
+
+# === ENDPOINT DE EMISIÓN MASIVA ===
+@router.post("/oauth/token/bulk")
+async def bulk_issue_tokens(request: Request, code_store: CodeStore = Depends(get_code_store)):
+    """Emite N pares access/refresh en una llamada; respuesta NDJSON en streaming"""
+    start_request("token_bulk")
+    check_admin_token(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    items = _parse_items(body)
+
+    # Todos los chunks se reparten en el pool de una vez; se emiten en orden
+    loop = asyncio.get_running_loop()
+    futures = [
+        loop.run_in_executor(signing_pool, _sign_chunk, items[i:i + BULK_CHUNK_SIZE])
+        for i in range(0, len(items), BULK_CHUNK_SIZE)
+    ]
+
+    async def stream():
+        audit_entries = []
+        index = 0
+        try:
+            for future in futures:
+                signed = await future
+                await code_store.start_families(
+                    [(family_id, jti) for _, _, _, family_id, jti, _ in signed],
+                    REFRESH_TOKEN_TTL_SECONDS
+                )
+                for user_id, client_id, scopes, _, _, pair in signed:
+                    audit_entries.append(build_audit_entry(
+                        user_id, client_id, scopes, status="granted", action="bulk_token_issue"
+                    ))
+                    yield json.dumps({"index": index, "user_id": user_id, "client_id": client_id,
+                                      **pair}) + "\n"
+                    index += 1
+        finally:
+            # Una sola entrada al pipeline para todo lo emitido
+            await log_audit_batch(audit_entries)
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"X-Token-Count": str(len(items))}
+    )
@@ -0,0 +1,313 @@
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from enum import Enum
+
+import redis.asyncio as aioredis
+from fastapi import Request
+
+from .timing_wheel import TimingWheel
+
+# Configuración
+MCP_CODE_STORE = os.getenv("MCP_CODE_STORE", "redis")  # redis | memory
+MEMORY_STORE_SHARDS = int(os.getenv("MEMORY_STORE_SHARDS", "16"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+JTI_BUCKET_SECONDS = 60  # los jti de codes se agrupan por minuto de expiración
+JTI_BUCKET_GRACE_SECONDS = 30  # margen sobre el fin del bucket (desfase de relojes)
+
+# === ESTADOS DE UN CODE: issued → redeemed → expired ===
+class CodeState(str, Enum):
+    ISSUED = "issued"
+    REDEEMED = "redeemed"
+    EXPIRED = "expired"  # clave ausente: expiró o nunca se emitió
+
+def code_state(value) -> CodeState:
+    """Traduce el valor almacenado (bytes/str/None) a CodeState"""
+    if value is None:
+        return CodeState.EXPIRED
+    if isinstance(value, bytes):
+        value = value.decode()
+    if value == "1":
+        # Codes emitidos antes del modelo de estados (TTL de 2 min)
+        return CodeState.ISSUED
+    return CodeState(value)
+
+# === JTI DE CODES EN SETS POR MINUTO DE EXPIRACIÓN ===
+# Un set de emitidos y otro de canjeados por minuto, con un TTL por set en vez de
+# una clave con TTL por code. El miembro es el jti en binario (16 bytes).
+ISSUED_JTI_PREFIX = "jti:i:"
+REDEEMED_JTI_PREFIX = "jti:r:"
+LEGACY_JTI_PREFIX = "used_jti:"  # una clave por code (codes emitidos antes de los buckets)
+
+def jti_member(jti: str) -> bytes:
+    """jti hex de 128 bits → 16 bytes; cualquier otro formato se guarda tal cual"""
+    try:
+        return bytes.fromhex(jti) if len(jti) == 32 else jti.encode()
+    except ValueError:
+        return jti.encode()
+
+def jti_bucket(exp: float) -> int:
+    return int(exp // JTI_BUCKET_SECONDS)
+
+def jti_bucket_ttl(bucket: int, now: float) -> int:
+    """Segundos hasta que vence el último code del bucket, más el margen"""
+    return max(1, int((bucket + 1) * JTI_BUCKET_SECONDS - now) + JTI_BUCKET_GRACE_SECONDS)
+
+def queue_issue(pipe, jti: str, exp: float, now: float) -> None:
+    """Añade a `pipe` (sync o async) el alta de un jti emitido en el bucket de su exp"""
+    bucket = jti_bucket(exp)
+    pipe.sadd(f"{ISSUED_JTI_PREFIX}{bucket}", jti_member(jti))
+    pipe.expire(f"{ISSUED_JTI_PREFIX}{bucket}", jti_bucket_ttl(bucket, now))
+
+def queue_redeem(pipe, jti: str, exp: float, now: float) -> None:
+    """Añade a `pipe` el canje atómico issued → redeemed y la comprobación de replay"""
+    bucket = jti_bucket(exp)
+    member = jti_member(jti)
+    # SMOVE es atómico: de varios canjes concurrentes solo uno mueve el miembro
+    pipe.smove(f"{ISSUED_JTI_PREFIX}{bucket}", f"{REDEEMED_JTI_PREFIX}{bucket}", member)
+    pipe.expire(f"{REDEEMED_JTI_PREFIX}{bucket}", jti_bucket_ttl(bucket, now))
+    pipe.sismember(f"{REDEEMED_JTI_PREFIX}{bucket}", member)
+
+def redeemed_state(results: list) -> CodeState:
+    """Estado previo a partir de las respuestas de queue_redeem (None: buscar formato antiguo)"""
+    moved, _, redeemed = results
+    if moved:
+        return CodeState.ISSUED
+    if redeemed:
+        return CodeState.REDEEMED
+    return None
+
+# === ROTACIÓN DE FAMILIAS DE REFRESH TOKENS ===
+class RotationResult(str, Enum):
+    ROTATED = "rotated"  # el jti presentado era el vigente; ahora lo es el nuevo
+    REUSED = "reused"  # jti antiguo: reuso detectado, la familia queda revocada
+    REVOKED = "revoked"  # la familia ya estaba revocada
+    EXPIRED = "expired"  # familia desconocida o expirada
+
+FAMILY_REVOKED = "revoked"
+
+def rotation_result(previous, presented_jti: str) -> RotationResult:
+    """Interpreta el valor previo de la familia frente al jti presentado"""
+    if previous is None:
+        return RotationResult.EXPIRED
+    if isinstance(previous, bytes):
+        previous = previous.decode()
+    if previous == FAMILY_REVOKED:
+        return RotationResult.REVOKED
+    if previous == presented_jti:
+        return RotationResult.ROTATED
+    return RotationResult.REUSED
+
+# === INTERFAZ DEL CODE STORE ===
+class CodeStore(ABC):
+    """Almacén de jti de authorization codes (one-time use) y familias de refresh tokens"""
+
+    @abstractmethod
+    async def issue(self, jti: str, ttl: int, exp: float = None) -> None:
+        """Registra un jti recién emitido (estado issued) con su TTL en segundos.
+
+        `exp` es el exp (epoch) del code; por defecto ahora + ttl.
+        """
+
+    @abstractmethod
+    async def redeem(self, jti: str, exp: float) -> CodeState:
+        """Consume un jti de forma atómica y devuelve el estado previo.
+
+        ISSUED significa que esta llamada lo canjeó; REDEEMED es un replay;
+        EXPIRED que ya no existe. El jti queda como redeemed al menos hasta
+        `exp`, el mismo exp con el que se emitió.
+        """
+
+    @abstractmethod
+    async def start_family(self, family_id: str, jti: str, ttl: int) -> None:
+        """Crea una familia de refresh tokens cuyo jti vigente es `jti`"""
+
+    async def start_families(self, families: list, ttl: int) -> None:
+        """Crea varias familias [(family_id, jti), ...]; los backends pueden agruparlas"""
+        for family_id, jti in families:
+            await self.start_family(family_id, jti, ttl)
+
+    @abstractmethod
+    async def rotate_family(self, family_id: str, presented_jti: str, new_jti: str,
+                            ttl: int) -> RotationResult:
+        """Sustituye el jti vigente si coincide con el presentado; si no, revoca la familia"""
+
+    @abstractmethod
+    async def revoke_family(self, family_id: str) -> None:
+        """Revoca la familia (se conserva hasta su TTL para seguir detectando reuso)"""
+
+    async def close(self) -> None:
+        """Libera los recursos del backend"""
+
+
+# === BACKEND REDIS (asyncio + pool) ===
+class RedisCodeStore(CodeStore):
+    """Code store sobre redis.asyncio con un pool de conexiones compartido.
+
+    Los jti de codes viven en sets por minuto de expiración (ver queue_issue);
+    las familias de refresh tokens, una clave por familia.
+    """
+
+    FAMILY_PREFIX = "rt_family:"
+
+    def __init__(self, client: aioredis.Redis, clock=time.time):
+        self.client = client
+        self.clock = clock
+
+    @classmethod
+    def from_url(cls, url: str = REDIS_URL,
+                 max_connections: int = REDIS_MAX_CONNECTIONS) -> "RedisCodeStore":
+        pool = aioredis.ConnectionPool.from_url(url, max_connections=max_connections)
+        return cls(aioredis.Redis(connection_pool=pool))
+
+    async def issue(self, jti: str, ttl: int, exp: float = None) -> None:
+        now = self.clock()
+        pipe = self.client.pipeline(transaction=False)
+        queue_issue(pipe, jti, now + ttl if exp is None else exp, now)
+        await pipe.execute()
+
+    async def redeem(self, jti: str, exp: float) -> CodeState:
+        # Un round trip: SMOVE issued → redeemed + comprobación de replay
+        pipe = self.client.pipeline(transaction=False)
+        queue_redeem(pipe, jti, exp, self.clock())
+        state = redeemed_state(await pipe.execute())
+        if state is not None:
+            return state
+        # Codes emitidos con una clave propia antes del despliegue (viven como mucho su TTL)
+        previous = await self.client.set(
+            f"{LEGACY_JTI_PREFIX}{jti}", CodeState.REDEEMED.value, xx=True, keepttl=True, get=True
+        )
+        return code_state(previous)
+
+    async def start_family(self, family_id: str, jti: str, ttl: int) -> None:
+        await self.client.set(f"{self.FAMILY_PREFIX}{family_id}", jti, ex=ttl)
+
+    async def start_families(self, families: list, ttl: int) -> None:
+        # Un solo round trip para todo el lote
+        pipe = self.client.pipeline(transaction=False)
+        for family_id, jti in families:
+            pipe.set(f"{self.FAMILY_PREFIX}{family_id}", jti, ex=ttl)
+        await pipe.execute()
+
+    async def rotate_family(self, family_id: str, presented_jti: str, new_jti: str,
+                            ttl: int) -> RotationResult:
+        key = f"{self.FAMILY_PREFIX}{family_id}"
+        # Camino feliz en un round trip: instala el nuevo jti y devuelve el anterior
+        previous = await self.client.set(key, new_jti, xx=True, ex=ttl, get=True)
+        result = rotation_result(previous, presented_jti)
+        if result in (RotationResult.REUSED, RotationResult.REVOKED):
+            # Nadie recibió new_jti: dejar la familia revocada
+            await self.client.set(key, FAMILY_REVOKED, xx=True, keepttl=True)
+        return result
+
+    async def revoke_family(self, family_id: str) -> None:
+        await self.client.set(f"{self.FAMILY_PREFIX}{family_id}", FAMILY_REVOKED, xx=True, keepttl=True)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+# === BACKEND EN MEMORIA (un solo nodo) ===
+class MemoryCodeStore(CodeStore):
+    """Code store en proceso: shards con lock propio y expiración por timing wheel.
+
+    El estado vive en el proceso, así que solo sirve con un único worker
+    (p. ej. uvicorn o gunicorn -w 1); con varios workers usar Redis.
+    """
+
+    def __init__(self, shards: int = MEMORY_STORE_SHARDS, tick: float = 1.0, clock=time.monotonic):
+        self.clock = clock
+        self._shards = [{} for _ in range(shards)]  # clave -> [valor, deadline_tick]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._wheel = TimingWheel(tick=tick, now=clock())
+        self._wheel_lock = threading.Lock()
+
+    def _shard(self, jti: str) -> int:
+        return zlib.crc32(jti.encode()) % len(self._shards)
+
+    def _expire(self) -> None:
+        """Avanza la rueda y elimina los jti vencidos (O(1) amortizado por jti)"""
+        with self._wheel_lock:
+            expired = self._wheel.advance(self.clock())
+        for jti, deadline in expired:
+            index = self._shard(jti)
+            with self._locks[index]:
+                entry = self._shards[index].get(jti)
+                if entry is not None and entry[1] == deadline:
+                    del self._shards[index][jti]
+
+    def _schedule(self, key: str, ttl: int) -> int:
+        with self._wheel_lock:
+            deadline = self._wheel.to_tick(self.clock() + ttl)
+            self._wheel.schedule(key, deadline)
+        return deadline
+
+    async def issue(self, jti: str, ttl: int, exp: float = None) -> None:
+        self._expire()
+        deadline = self._schedule(jti, ttl)
+        index = self._shard(jti)
+        with self._locks[index]:
+            self._shards[index][jti] = [CodeState.ISSUED, deadline]
+
+    async def redeem(self, jti: str, exp: float) -> CodeState:
+        self._expire()
+        index = self._shard(jti)
+        with self._locks[index]:
+            entry = self._shards[index].get(jti)
+            if entry is None:
+                return CodeState.EXPIRED
+            previous = entry[0]
+            entry[0] = CodeState.REDEEMED
+            return previous
+
+    async def start_family(self, family_id: str, jti: str, ttl: int) -> None:
+        self._expire()
+        key = f"fam:{family_id}"
+        deadline = self._schedule(key, ttl)
+        index = self._shard(key)
+        with self._locks[index]:
+            self._shards[index][key] = [jti, deadline]
+
+    async def rotate_family(self, family_id: str, presented_jti: str, new_jti: str,
+                            ttl: int) -> RotationResult:
+        self._expire()
+        key = f"fam:{family_id}"
+        index = self._shard(key)
+        with self._locks[index]:
+            entry = self._shards[index].get(key)
+            result = rotation_result(entry[0] if entry else None, presented_jti)
+            if result is RotationResult.ROTATED:
+                # TTL deslizante: el nuevo refresh token vive `ttl` desde ahora
+                entry[0] = new_jti
+                entry[1] = self._schedule(key, ttl)
+            elif result is RotationResult.REUSED:
+                entry[0] = FAMILY_REVOKED
+        return result
+
+    async def revoke_family(self, family_id: str) -> None:
+        key = f"fam:{family_id}"
+        index = self._shard(key)
+        with self._locks[index]:
+            entry = self._shards[index].get(key)
+            if entry is not None:
+                entry[0] = FAMILY_REVOKED
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+# === FACTORY Y DEPENDENCIA FASTAPI ===
+def create_code_store() -> CodeStore:
+    """Crea el code store configurado (una vez por proceso, en el lifespan)"""
+    if MCP_CODE_STORE == "memory":
+        return MemoryCodeStore()
+    if MCP_CODE_STORE == "redis":
+        return RedisCodeStore.from_url()
+    raise ValueError(f"MCP_CODE_STORE desconocido: {MCP_CODE_STORE}")
+
+def get_code_store(request: Request) -> CodeStore:
+    """Dependencia FastAPI: devuelve el code store creado en el lifespan"""
+    return request.app.state.code_store
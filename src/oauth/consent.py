@@ -1,85 +1,77 @@
-import os
-import jwt
-import redis
-from datetime import datetime, timedelta
-from fastapi import FastAPI, Request, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-import httpx
-import uuid
 
-# Configuración
-MCP_JWT_SECRET = os.getenv("MCP_JWT_SECRET", "dev-secret-change-in-production")
-MCP_ACCESS_TOKEN_SECRET = os.getenv("MCP_ACCESS_TOKEN_SECRET", "access-dev-secret")
-MCP_REFRESH_TOKEN_SECRET = os.getenv("MCP_REFRESH_TOKEN_SECRET", "refresh-dev-secret")
+from .admin import check_admin_token
+from .admission import AdmissionMiddleware
+from .audit import audit_pipeline, create_audit_sink, log_audit_event
+from .audit_rollups import audit_rollups, router as audit_rollups_router
+from .audit_store import create_audit_store, router as audit_store_router
+from .bulk import router as bulk_router
+from .code_store import CodeStore, RedisCodeStore, create_code_store, get_code_store
+from .consent_grants import consent_grants
+from .introspect import router as introspect_router
+from .jwt_handler import (
+    generate_authorization_code,
+    generate_authorization_code_async,
+    verify_authorization_code,
+)
+from .keys import router as jwks_router
+from .metrics import MetricsMiddleware, router as metrics_router, stage, start_request
+from .rate_limit import rate_limiter
+from .revocation import revocation_list
+from .rules import router as rules_router, rule_engine
+from .scopes import GrantedScopes, allowed_scopes_cache, scope_registry
+from .session import SessionValidator, create_session_validator, get_session_validator
+from .singleflight import SingleFlight
+from .token import generate_access_token, generate_refresh_token, router as token_router
 
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
-
-app = FastAPI()
-
-# === GENERACIÓN DE AUTHORIZATION CODE ===
-def generate_authorization_code(user_id: str, client_id: str, scopes: list) -> str:
-    """Genera un authorization_code firmado con todas las validaciones"""
-    payload = {
-        "user_id": user_id,
-        "client_id": client_id,
-        "scopes": scopes,
-        "exp": datetime.utcnow() + timedelta(minutes=2),  # 2 min
-        "iat": datetime.utcnow(),
-        "type": "authorization_code",
-        "jti": os.urandom(16).hex(),  # Anti-replay
-        "aud": client_id  # Audience validation
-    }
-    
-    code = jwt.encode(payload, MCP_JWT_SECRET, algorithm="HS256")
-    
-    # Registrar jti para one-time use (opcional v1)
-    redis_client.setex(f"used_jti:{payload['jti']}", 120, "1")
-    
-    return code
-
-def verify_authorization_code(code: str, expected_client_id: str) -> dict:
-    """Verifica y decodifica un authorization_code"""
+# === LIFESPAN: recursos compartidos por proceso ===
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.code_store = create_code_store()
+    app.state.session_validator = create_session_validator()
+    app.state.audit_store = create_audit_store()
+    await audit_pipeline.start(create_audit_sink(app.state.session_validator.client),
+                               store=app.state.audit_store)
+    # Rate limiter, revocaciones, rollups y consentimientos comparten el pool de Redis del code store
+    code_store = app.state.code_store
+    redis_client = code_store.client if isinstance(code_store, RedisCodeStore) else None
+    await rate_limiter.start(redis_client)
+    await revocation_list.start(redis_client)
+    await audit_rollups.start(redis_client)
+    await rule_engine.start()
+    await consent_grants.start(redis_client)
     try:
-        payload = jwt.decode(
-            code,
-            MCP_JWT_SECRET,
-            algorithms=["HS256"],
-            audience=expected_client_id  # Validar audience
-        )
-        
-        # Verificar que no haya sido usado (si implementaste one-time)
-        jti = payload["jti"]
-        if redis_client.exists(f"used_jti:{jti}"):
-            raise HTTPException(status_code=400, detail="Code already used")
-        
-        return payload
-        
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=400, detail="Authorization code expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=400, detail="Invalid authorization code")
+        yield
+    finally:
+        await rule_engine.stop()
+        await audit_rollups.stop()
+        await revocation_list.stop()
+        await rate_limiter.stop()
+        await audit_pipeline.stop()
+        if app.state.audit_store is not None:
+            app.state.audit_store.close()
+        await app.state.session_validator.close()
+        await app.state.code_store.close()
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(token_router)
+app.include_router(introspect_router)
+app.include_router(bulk_router)
+app.include_router(jwks_router)
+app.include_router(metrics_router)
+app.include_router(audit_store_router)
+app.include_router(audit_rollups_router)
+app.include_router(rules_router)
+# Admisión por dentro de las métricas: los 503 por sobrecarga también se miden
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # === VALIDACIÓN DE SESIÓN EN SUPABASE ===
-async def validate_session_token(access_token: str) -> dict:
-    """Valida token de sesión en Supabase"""
-    SUPABASE_URL = os.getenv("SUPABASE_URL")
-    SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "apikey": SUPABASE_ANON_KEY
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{SUPABASE_URL}/auth/v1/user",
-            headers=headers
-        )
-        
-    if response.status_code != 200:
-        raise HTTPException(status_code=401, detail="Token inválido")
-    
-    return response.json()
+async def validate_session_token(access_token: str, validator: SessionValidator) -> dict:
+    """Valida token de sesión en Supabase (cliente compartido + cache de sesiones)"""
+    return await validator.validate(access_token)
 
 # === VALIDACIÓN DE SCOPES DESDE SUPABASE ===
 async def get_allowed_scopes(user_id: str, client_id: str) -> list:
@@ -88,9 +80,52 @@ async def get_allowed_scopes(user_id: str, client_id: str) -> list:
     # Ejemplo simulado:
     return ["invoices.read", "payments.read", "partners.read"]
 
+allowed_scopes_flight = SingleFlight()
+
+async def _load_granted_scopes(user_id: str, client_id: str) -> GrantedScopes:
+    granted = scope_registry.grants(await get_allowed_scopes(user_id, client_id))
+    allowed_scopes_cache.put(user_id, client_id, granted)
+    return granted
+
+async def get_granted_scopes(user_id: str, client_id: str) -> GrantedScopes:
+    """Grants compilados (bitmask + comodines), cacheados por (user, client); una consulta en vuelo por clave"""
+    granted = allowed_scopes_cache.get(user_id, client_id)
+    if granted is None:
+        granted = await allowed_scopes_flight.do(
+            (user_id, client_id), lambda: _load_granted_scopes(user_id, client_id)
+        )
+    return granted
+
+async def invalidate_grants(user_id: str, client_id: str = None) -> None:
+    """Los scopes permitidos cambiaron: olvidar grants cacheados y consentimientos registrados"""
+    allowed_scopes_cache.invalidate(user_id, client_id)
+    await consent_grants.invalidate(user_id, client_id)
+
+@app.post("/oauth/grants/invalidate")
+async def invalidate_grants_endpoint(request: Request):
+    """Aviso de cambio de grants en Supabase: {user_id, client_id?} (requiere MCP_ADMIN_TOKEN)"""
+    check_admin_token(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if not isinstance(body, dict) or not isinstance(body.get("user_id"), str) or not body["user_id"]:
+        raise HTTPException(status_code=400, detail="user_id requerido")
+    client_id = body.get("client_id")
+    if client_id is not None and not isinstance(client_id, str):
+        raise HTTPException(status_code=400, detail="client_id inválido")
+    await invalidate_grants(body["user_id"], client_id)
+    return {}
+
 # === ENDPOINT DE CONSENTIMIENTO ===
 @app.get("/oauth/consent", response_class=HTMLResponse)
-async def oauth_consent(request: Request):
+async def oauth_consent(
+    request: Request,
+    code_store: CodeStore = Depends(get_code_store),
+    session_validator: SessionValidator = Depends(get_session_validator)
+):
+    start_request("oauth_consent")
+
     # Parámetros OAuth
     client_id = request.query_params.get("client_id")
     redirect_uri = request.query_params.get("redirect_uri")
@@ -99,39 +134,49 @@ async def oauth_consent(request: Request):
     
     if not all([client_id, redirect_uri]):
         raise HTTPException(status_code=400, detail="Parámetros requeridos faltantes")
+    rate_limiter.check_client(client_id)
     
     # Validar token de sesión
     access_token = request.headers.get("Authorization", "").replace("Bearer ", "")
     if not access_token:
         return RedirectResponse(f"{redirect_uri}?error=login_required&state={state}")
     
-    user_data = await validate_session_token(access_token)
+    with stage("session"):
+        user_data = await validate_session_token(access_token, session_validator)
     user_id = user_data["id"]
-    
-    # Validar scopes permitidos desde Supabase
-    allowed_scopes = await get_allowed_scopes(user_id, client_id)
-    requested_scopes = requested_scope.split(" ")
-    
-    unauthorized_scopes = [
-        scope for scope in requested_scopes 
-        if scope not in allowed_scopes
-    ]
-    
-    if unauthorized_scopes:
+    rate_limiter.check_user(client_id, user_id)
+    
+    # Consentimiento ya concedido para estos scopes: sin consultar Supabase
+    with stage("scopes"):
+        requested = scope_registry.compile(requested_scope)
+        consented = await consent_grants.covers(user_id, client_id, requested.scopes)
+        if not consented:
+            # Validar scopes permitidos desde Supabase
+            granted = await get_granted_scopes(user_id, client_id)
+            # Compilar después de cargar los grants: pueden internar scopes fuera de MCP_KNOWN_SCOPES
+            requested = scope_registry.compile(requested_scope)
+    requested_scopes = list(requested.scopes)
+    
+    if not consented and scope_registry.denied(requested, granted):
         # Registrar intento no autorizado
         await log_audit_event(
             user_id=user_id,
             client_id=client_id,
             requested_scopes=requested_scopes,
             status="denied",
+            action="oauth_consent",
             reason="unauthorized_scopes"
         )
         raise HTTPException(status_code=403, detail="Scopes no autorizados")
     
     # Generar authorization_code
-    auth_code = generate_authorization_code(user_id, client_id, requested_scopes)
+    auth_code = await generate_authorization_code_async(
+        user_id, client_id, requested_scopes, code_store
+    )
     
     # Registrar consentimiento
+    if not consented:
+        await consent_grants.put(user_id, client_id, requested.scopes)
     await log_audit_event(
         user_id=user_id,
         client_id=client_id,
@@ -144,92 +189,6 @@ async def oauth_consent(request: Request):
     redirect_url = f"{redirect_uri}?code={auth_code}&state={state}"
     return RedirectResponse(redirect_url)
 
-# === ENDPOINT DE EXCHANGE (TOKEN) ===
-@app.post("/oauth/token")
-async def exchange_code_for_token(
-    code: str,
-    client_id: str,
-    client_secret: str = None,  # Opcional según configuración
-    grant_type: str = "authorization_code"
-):
-    if grant_type != "authorization_code":
-        raise HTTPException(status_code=400, detail="Invalid grant_type")
-    
-    # Verificar el authorization_code
-    code_payload = verify_authorization_code(code, client_id)
-    
-    # Generar access_token y refresh_token
-    access_token = generate_access_token(
-        user_id=code_payload["user_id"],
-        scopes=code_payload["scopes"],
-        client_id=client_id
-    )
-    
-    refresh_token = generate_refresh_token(
-        user_id=code_payload["user_id"],
-        client_id=client_id
-    )
-    
-    # Registrar token exchange
-    await log_audit_event(
-        user_id=code_payload["user_id"],
-        client_id=client_id,
-        requested_scopes=code_payload["scopes"],
-        status="granted",
-        action="token_exchange"
-    )
-    
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "Bearer",
-        "expires_in": 3600,
-        "scope": " ".join(code_payload["scopes"])
-    }
-
-def generate_access_token(user_id: str, scopes: list, client_id: str) -> str:
-    payload = {
-        "sub": user_id,
-        "client_id": client_id,
-        "scopes": scopes,
-        "exp": datetime.utcnow() + timedelta(hours=1),
-        "type": "access_token"
-    }
-    return jwt.encode(payload, MCP_ACCESS_TOKEN_SECRET, algorithm="HS256")
-
-def generate_refresh_token(user_id: str, client_id: str) -> str:
-    payload = {
-        "sub": user_id,
-        "client_id": client_id,
-        "exp": datetime.utcnow() + timedelta(days=30),
-        "type": "refresh_token"
-    }
-    return jwt.encode(payload, MCP_REFRESH_TOKEN_SECRET, algorithm="HS256")
-
-# === LOGGING DE AUDITORÍA ===
-async def log_audit_event(user_id: str, client_id: str, requested_scopes: list, 
-                        status: str, action: str, reason: str = None):
-    """Registra evento en audit_log"""
-    
-    audit_entry = {
-        "id": str(uuid.uuid4()),
-        "timestamp": datetime.utcnow().isoformat(),
-        "request_id": str(uuid.uuid4()),
-        "service_account_id": user_id,
-        "scope": " ".join(requested_scopes),
-        "action": action,
-        "mcp_endpoint": f"/oauth/{'consent' if 'consent' in action else 'token'}",
-        "status": status,
-        "http_status": 200 if status == "granted" else 403,
-        "latency_ms": 0,  # Calcular si es necesario
-        "error_code": reason,
-        "error_message": reason
-    }
-    
-    # Aquí iría la lógica para insertar en Supabase audit_log
-    # await insert_audit_log(audit_entry)
-    print(f"Audit event: {audit_entry}")
-
 # === TEST DE END-TO-END ===
 def test_oauth_flow():
     """Test de flujo completo"""
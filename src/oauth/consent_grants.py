@@ -0,0 +1,140 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from redis.exceptions import RedisError
+
+from .metrics import Counter, registry
+from .revocation import revocation_list
+
+# Configuración
+CONSENT_GRANT_TTL_SECONDS = int(os.getenv("CONSENT_GRANT_TTL_SECONDS", "3600"))
+CONSENT_GRANT_LOCAL_TTL_SECONDS = float(os.getenv("CONSENT_GRANT_LOCAL_TTL_SECONDS", "30"))
+CONSENT_GRANT_MAX_ENTRIES = int(os.getenv("CONSENT_GRANT_MAX_ENTRIES", "10000"))
+
+consent_grant_lookups = registry.register(Counter(
+    "mcp_consent_grant_lookups_total", "Consultas al registro de consentimientos por resultado", ("result",)
+))
+
+class ConsentGrant(NamedTuple):
+    """Consentimiento vigente de un usuario a un cliente"""
+    scopes: frozenset
+    created_at: float
+    expires_at: float
+
+    def covers(self, scopes) -> bool:
+        return self.scopes.issuperset(scopes)
+
+
+# === REGISTRO DE CONSENTIMIENTOS POR (user, client) ===
+class ConsentGrantStore:
+    """Consentimientos ya concedidos: Redis como registro persistente, LRU local delante.
+
+    Un re-consent cubierto por un grant vigente no vuelve a consultar los
+    scopes permitidos: basta una lectura local (y el Bloom filter de
+    revocaciones). Un grant emitido antes de revocar al sujeto deja de valer en
+    todos los workers en cuanto les llega la revocación; la invalidación
+    explícita borra el registro en Redis y los demás workers la ven al vencer
+    su copia local (CONSENT_GRANT_LOCAL_TTL_SECONDS). Sin Redis es por proceso.
+    """
+
+    KEY_PREFIX = "consent:"
+
+    def __init__(self, ttl: int = CONSENT_GRANT_TTL_SECONDS, local_ttl: float = CONSENT_GRANT_LOCAL_TTL_SECONDS,
+                 max_entries: int = CONSENT_GRANT_MAX_ENTRIES, clock=time.time):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.client = None
+        self._entries = OrderedDict()  # (user, client) -> (grant, válido en local hasta)
+
+    def _cache(self, key: tuple, grant: ConsentGrant, now: float) -> None:
+        # Sin Redis la copia local es el registro: vale hasta que vence el grant
+        until = grant.expires_at if self.client is None else min(grant.expires_at, now + self.local_ttl)
+        self._entries[key] = (grant, until)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: str, client_id: str):
+        now = self.clock()
+        key = (user_id, client_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            grant, until = entry
+            if now < until:
+                self._entries.move_to_end(key)
+                return grant
+            del self._entries[key]
+        if self.client is None:
+            return None
+        try:
+            raw = await self.client.hget(f"{self.KEY_PREFIX}{user_id}", client_id)
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        grant = ConsentGrant(frozenset(data["scopes"]), data["created_at"], data["expires_at"])
+        if grant.expires_at <= now:
+            return None
+        self._cache(key, grant, now)
+        return grant
+
+    async def covers(self, user_id: str, client_id: str, scopes) -> bool:
+        """True si un grant vigente y no revocado cubre `scopes`"""
+        grant = await self.get(user_id, client_id)
+        if grant is None or not grant.covers(scopes):
+            consent_grant_lookups.inc("miss")
+            return False
+        if await revocation_list.is_revoked({"sub": user_id, "iat": grant.created_at}):
+            consent_grant_lookups.inc("revoked")
+            await self.invalidate(user_id, client_id)
+            return False
+        consent_grant_lookups.inc("hit")
+        return True
+
+    async def put(self, user_id: str, client_id: str, scopes) -> ConsentGrant:
+        """Registra el consentimiento recién concedido (reemplaza el anterior)"""
+        now = self.clock()
+        grant = ConsentGrant(frozenset(scopes), now, now + self.ttl)
+        self._cache((user_id, client_id), grant, now)
+        if self.client is not None:
+            data = {"scopes": sorted(grant.scopes), "created_at": grant.created_at, "expires_at": grant.expires_at}
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                pipe.hset(f"{self.KEY_PREFIX}{user_id}", client_id, json.dumps(data))
+                # Los campos vencidos se ignoran al leer; la clave cae con el grant más reciente
+                pipe.expire(f"{self.KEY_PREFIX}{user_id}", self.ttl)
+                await pipe.execute()
+            except RedisError as e:
+                print(f"Consent grants: no se pudo persistir ({e}); solo local")
+        return grant
+
+    async def invalidate(self, user_id: str, client_id: str = None) -> None:
+        """Olvida el consentimiento de un (user, client) o todos los del usuario"""
+        if client_id is not None:
+            self._entries.pop((user_id, client_id), None)
+        else:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+        if self.client is None:
+            return
+        try:
+            if client_id is not None:
+                await self.client.hdel(f"{self.KEY_PREFIX}{user_id}", client_id)
+            else:
+                await self.client.delete(f"{self.KEY_PREFIX}{user_id}")
+        except RedisError as e:
+            # Como en put: se degrada a local; el registro en Redis vence con su TTL
+            print(f"Consent grants: no se pudo invalidar en Redis ({e}); solo local")
+
+    async def start(self, client=None) -> None:
+        self.client = client
+        self._entries.clear()
+
+
+consent_grants = ConsentGrantStore()
@@ -0,0 +1,182 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+import jwt
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from .admin import check_admin_token
+from .code_store import CodeStore, get_code_store
+from .consent_grants import consent_grants
+from .keys import signing_keys
+from .revocation import revocation_list
+from .token import MCP_ACCESS_TOKEN_SECRET, MCP_REFRESH_TOKEN_SECRET
+
+# Configuración
+MCP_INTROSPECTION_TOKEN = os.getenv("MCP_INTROSPECTION_TOKEN")
+INTROSPECTION_MAX_BATCH = int(os.getenv("INTROSPECTION_MAX_BATCH", "100"))
+VERIFIED_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("VERIFIED_TOKEN_CACHE_MAX_ENTRIES", "50000"))
+
+TOKEN_SECRETS = {
+    "access_token": MCP_ACCESS_TOKEN_SECRET,
+    "refresh_token": MCP_REFRESH_TOKEN_SECRET,
+}
+
+router = APIRouter()
+
+# === CACHE DE FIRMAS YA VERIFICADAS ===
+class VerifiedTokenCache:
+    """Cache LRU acotada: sha256(token) -> claims con firma ya verificada"""
+
+    def __init__(self, max_entries: int = VERIFIED_TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, token: str):
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self._entries.get(key)
+        if claims is None:
+            return None
+        if claims["exp"] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        key = hashlib.sha256(token.encode()).digest()
+        self._entries[key] = claims
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+verified_token_cache = VerifiedTokenCache()
+
+def _decode(token: str, token_type: str) -> dict:
+    if token_type == "access_token" and signing_keys is not None:
+        return signing_keys.verify(token, options={"require": ["exp"]})
+    return jwt.decode(token, TOKEN_SECRETS[token_type], algorithms=["HS256"],
+                      options={"require": ["exp"]})
+
+def _verify(token: str, token_type_hint: str = None):
+    """Verifica firma/exp probando primero el tipo indicado y luego el resto (RFC 7662 §2.1); None si no es válido"""
+    token_types = list(TOKEN_SECRETS)
+    if token_type_hint in TOKEN_SECRETS:
+        # La pista solo ordena la búsqueda: con una pista errónea el token sigue siendo válido
+        token_types.sort(key=lambda token_type: token_type != token_type_hint)
+    for token_type in token_types:
+        try:
+            claims = _decode(token, token_type)
+        except jwt.InvalidTokenError:
+            continue
+        if claims.get("type") == token_type:
+            return claims
+    return None
+
+def verified_claims(token: str, token_type_hint: str = None):
+    """Claims con firma y exp válidos (cache de firmas verificadas); None si no"""
+    claims = verified_token_cache.get(token)
+    if claims is None:
+        claims = _verify(token, token_type_hint)
+        if claims is not None:
+            verified_token_cache.put(token, claims)
+    return claims
+
+def introspect_token(token: str, token_type_hint: str = None) -> dict:
+    """Respuesta RFC 7662 para un token según firma y exp (sin consultar revocaciones)"""
+    claims = verified_claims(token, token_type_hint)
+    return _introspection_response(claims) if claims is not None else {"active": False}
+
+async def introspect_active_token(token: str, token_type_hint: str = None) -> dict:
+    """Respuesta RFC 7662 que además descarta tokens revocados"""
+    claims = verified_claims(token, token_type_hint)
+    if claims is None or await revocation_list.is_revoked(claims):
+        return {"active": False}
+    return _introspection_response(claims)
+
+def _introspection_response(claims: dict) -> dict:
+    result = {
+        "active": True,
+        "token_type": claims["type"],
+        "client_id": claims["client_id"],
+        "sub": claims["sub"],
+        "exp": claims["exp"],
+    }
+    if "scopes" in claims:
+        result["scope"] = " ".join(claims["scopes"])
+    return result
+
+# === ENDPOINT DE INTROSPECCIÓN ===
+def _check_caller(request: Request) -> None:
+    """El resource server debe presentar MCP_INTROSPECTION_TOKEN (RFC 7662 §2.1); sin configurar, cerrado"""
+    if not MCP_INTROSPECTION_TOKEN:
+        raise HTTPException(status_code=403, detail="Introspección no configurada")
+    presented = request.headers.get("Authorization", "").replace("Bearer ", "")
+    if not hmac.compare_digest(presented.encode(), MCP_INTROSPECTION_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Introspección no autorizada")
+
+async def _read_body(request: Request) -> dict:
+    """Acepta application/x-www-form-urlencoded (RFC 7662) o JSON (lotes)"""
+    raw = await request.body()
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        return body
+    return {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+
+@router.post("/oauth/introspect")
+async def introspect(request: Request):
+    """Introspección RFC 7662; con {"tokens": [...]} valida un lote en una sola llamada"""
+    _check_caller(request)
+    body = await _read_body(request)
+    token_type_hint = body.get("token_type_hint")
+
+    tokens = body.get("tokens")
+    if tokens is not None:
+        if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+            raise HTTPException(status_code=400, detail="tokens debe ser una lista de strings")
+        if len(tokens) > INTROSPECTION_MAX_BATCH:
+            raise HTTPException(status_code=400, detail="Lote demasiado grande")
+        return {"results": [await introspect_active_token(token, token_type_hint) for token in tokens]}
+
+    token = body.get("token")
+    if not isinstance(token, str) or not token:
+        raise HTTPException(status_code=400, detail="Parámetro token requerido")
+    return await introspect_active_token(token, token_type_hint)
+
+# === ENDPOINT DE REVOCACIÓN (RFC 7009) ===
+@router.post("/oauth/revoke")
+async def revoke(request: Request, code_store: CodeStore = Depends(get_code_store)):
+    """Revoca un token (`token`); con MCP_ADMIN_TOKEN, todo lo emitido a un sujeto (`sub`)"""
+    body = await _read_body(request)
+
+    if "sub" in body:
+        check_admin_token(request)
+        await revocation_list.revoke_subject(body["sub"])
+        await consent_grants.invalidate(body["sub"])
+        return {}
+
+    token = body.get("token")
+    if not isinstance(token, str) or not token:
+        raise HTTPException(status_code=400, detail="Parámetro token requerido")
+    claims = verified_claims(token, body.get("token_type_hint"))
+    # RFC 7009: un token inválido o ya expirado también responde 200
+    if claims is not None and "jti" in claims:
+        await revocation_list.revoke_jti(claims["jti"], claims["exp"])
+        if claims["type"] == "refresh_token":
+            # Revocar el refresh token retira también el consentimiento que lo originó
+            await code_store.revoke_family(claims["fam"])
+            await consent_grants.invalidate(claims["sub"], claims["client_id"])
+    return {}
@@ -1,59 +1,100 @@
 import jwt
 import os
 import redis
+import time
 from datetime import datetime, timedelta
-import uuid
+from fastapi import HTTPException
+
+from .code_store import (
+    LEGACY_JTI_PREFIX,
+    REDIS_URL,
+    CodeState,
+    CodeStore,
+    code_state,
+    queue_issue,
+    queue_redeem,
+    redeemed_state,
+)
+from .metrics import stage
+from .token_codec import encode_authorization_code
 
 # Config
-SECRET = os.getenv("MCP_JWT_SECRET")
+SECRET = os.getenv("MCP_JWT_SECRET", "dev-secret-change-in-production")
+CODE_TTL_SECONDS = 120
 
-def generate_authorization_code(user_id: str, client_id: str, scopes: list) -> str:
-    """Genera un authorization_code firmado con todas las validaciones"""
-    payload = {
-        "user_id": user_id,
-        "client_id": client_id,
-        "scopes": scopes,
-        "exp": datetime.utcnow() + timedelta(minutes=2),  # 2 min
-        "iat": datetime.utcnow(),
-        "type": "authorization_code",
-        "jti": os.urandom(16).hex(),  # Anti-replay
-        "aud": client_id  # Audience validation
-    }
-    
-    code = jwt.encode(payload, SECRET, algorithm="HS256")
-    
-    # Registrar jti para one-time use
-    redis_client = redis.Redis(host='localhost', port=6379, db=0)
-    redis_client.setex(f"used_jti:{payload['jti']}", 120, "1")
-    
-    return code
+# Pool compartido para las variantes síncronas (no abrir una conexión por llamada)
+redis_pool = redis.ConnectionPool.from_url(REDIS_URL)
 
-def verify_authorization_code(code: str, expected_client_id: str) -> dict:
-    """Verifica y decodifica un authorization_code"""
+def _decode_code(code: str, expected_client_id: str) -> dict:
+    """Valida firma, expiración y audience de un authorization_code"""
     try:
-        payload = jwt.decode(
+        return jwt.decode(
             code,
             SECRET,
             algorithms=["HS256"],
             audience=expected_client_id  # Validar audience
         )
-        
-        # Verificar que no haya sido usado
-        redis_client = redis.Redis(host='localhost', port=6379, db=0)
-        jti = payload["jti"]
-        if redis_client.exists(f"used_jti:{jti}"):
-            from fastapi import HTTPException
-            raise HTTPException(status_code=400, detail="Code already used")
-        
-        return payload
-        
     except jwt.ExpiredSignatureError:
-        from fastapi import HTTPException
         raise HTTPException(status_code=400, detail="Authorization code expired")
     except jwt.InvalidTokenError:
-        from fastapi import HTTPException
         raise HTTPException(status_code=400, detail="Invalid authorization code")
 
+def _check_redeemed(previous: CodeState) -> None:
+    """Solo un code en estado issued puede canjearse"""
+    if previous is CodeState.REDEEMED:
+        raise HTTPException(status_code=400, detail="Code already used")
+    if previous is CodeState.EXPIRED:
+        raise HTTPException(status_code=400, detail="Authorization code expired")
+
+def generate_authorization_code(user_id: str, client_id: str, scopes: list) -> str:
+    """Genera un authorization_code firmado con todas las validaciones"""
+    code, payload = encode_authorization_code(SECRET, user_id, client_id, scopes, CODE_TTL_SECONDS)
+
+    # Registrar jti para one-time use
+    pipe = redis.Redis(connection_pool=redis_pool).pipeline(transaction=False)
+    queue_issue(pipe, payload["jti"], payload["exp"], time.time())
+    pipe.execute()
+
+    return code
+
+def verify_authorization_code(code: str, expected_client_id: str) -> dict:
+    """Verifica y decodifica un authorization_code"""
+    payload = _decode_code(code, expected_client_id)
+
+    # Canje atómico: issued → redeemed en un solo round trip
+    redis_client = redis.Redis(connection_pool=redis_pool)
+    pipe = redis_client.pipeline(transaction=False)
+    queue_redeem(pipe, payload["jti"], payload["exp"], time.time())
+    previous = redeemed_state(pipe.execute())
+    if previous is None:
+        previous = code_state(redis_client.set(
+            f"{LEGACY_JTI_PREFIX}{payload['jti']}", CodeState.REDEEMED.value,
+            xx=True, keepttl=True, get=True
+        ))
+    _check_redeemed(previous)
+
+    return payload
+
+# === VARIANTES ASYNC (code store compartido) ===
+async def generate_authorization_code_async(user_id: str, client_id: str, scopes: list,
+                                            store: CodeStore) -> str:
+    """Genera un authorization_code y registra su jti en el code store"""
+    with stage("sign"):
+        code, payload = encode_authorization_code(SECRET, user_id, client_id, scopes, CODE_TTL_SECONDS)
+    with stage("code_store"):
+        await store.issue(payload["jti"], CODE_TTL_SECONDS, exp=payload["exp"])
+    return code
+
+async def verify_authorization_code_async(code: str, expected_client_id: str,
+                                          store: CodeStore) -> dict:
+    """Verifica un authorization_code y consume su jti (one-time use)"""
+    with stage("decode"):
+        payload = _decode_code(code, expected_client_id)
+    with stage("code_store"):
+        previous = await store.redeem(payload["jti"], payload["exp"])
+    _check_redeemed(previous)
+    return payload
+
 def generate_expired_code(user_id: str, client_id: str, scopes: list) -> str:
     """Helper para tests - genera código ya expirado"""
     payload = {
@@ -66,4 +107,4 @@ def generate_expired_code(user_id: str, client_id: str, scopes: list) -> str:
         "jti": "expired-jti",
         "aud": client_id
     }
-    return jwt.encode(payload, SECRET, algorithm="HS256")
\ No newline at end of file
+    return jwt.encode(payload, SECRET, algorithm="HS256")
@@ -0,0 +1,141 @@
+import logging
+import os
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+# Configuración
+MCP_SIGNING_ALG = os.getenv("MCP_SIGNING_ALG", "HS256")  # HS256 | ES256 | EdDSA
+MCP_SIGNING_KEYS_DIR = os.getenv("MCP_SIGNING_KEYS_DIR")  # un <kid>.pem privado por clave
+MCP_SIGNING_ACTIVE_KID = os.getenv("MCP_SIGNING_ACTIVE_KID")
+# Solo desarrollo: sin claves en MCP_SIGNING_KEYS_DIR, generar una efímera por worker
+MCP_SIGNING_DEV_KEY = os.getenv("MCP_SIGNING_DEV_KEY", "false").lower() == "true"
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "300"))
+
+ASYMMETRIC_ALGORITHMS = ("ES256", "EdDSA")
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _generate_private_key(alg: str):
+    if alg == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    return ed25519.Ed25519PrivateKey.generate()
+
+def _check_key_type(alg: str, private_key) -> None:
+    if alg == "ES256":
+        valid = isinstance(private_key, ec.EllipticCurvePrivateKey) and private_key.curve.name == "secp256r1"
+    else:
+        valid = isinstance(private_key, ed25519.Ed25519PrivateKey)
+    if not valid:
+        raise ValueError(f"La clave no corresponde a {alg}")
+
+# === LLAVERO DE FIRMA ASIMÉTRICA ===
+class KeyRing:
+    """Claves privadas indexadas por kid: firma con la activa, verifica con cualquiera.
+
+    Todas las claves cargadas se publican en el JWKS, así que una clave nueva
+    puede publicarse antes de activarla y la anterior seguir verificando
+    tokens emitidos hasta que expiren.
+    """
+
+    def __init__(self, alg: str):
+        if alg not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Algoritmo de firma no soportado: {alg}")
+        self.alg = alg
+        self.active_kid = None
+        self._private_keys = {}
+        self._public_keys = {}
+        self._algorithm = jwt.get_algorithm_by_name(alg)
+        self._jwks = None
+
+    def add(self, kid: str, private_key) -> None:
+        _check_key_type(self.alg, private_key)
+        self._private_keys[kid] = private_key
+        self._public_keys[kid] = private_key.public_key()
+        self._jwks = None
+        if self.active_kid is None:
+            self.active_kid = kid
+
+    def generate(self, kid: str) -> None:
+        """Genera una clave nueva (desarrollo y tests)"""
+        self.add(kid, _generate_private_key(self.alg))
+
+    def activate(self, kid: str) -> None:
+        if kid not in self._private_keys:
+            raise KeyError(f"kid desconocido: {kid}")
+        self.active_kid = kid
+
+    def retire(self, kid: str) -> None:
+        """Retira una clave: deja de publicarse y de verificar"""
+        if kid == self.active_kid:
+            raise ValueError("No se puede retirar la clave activa")
+        self._private_keys.pop(kid, None)
+        self._public_keys.pop(kid, None)
+        self._jwks = None
+
+    def load_dir(self, path: str) -> None:
+        """Carga <kid>.pem (PKCS8 sin cifrar) de un directorio"""
+        for pem in sorted(Path(path).glob("*.pem")):
+            self.add(pem.stem, serialization.load_pem_private_key(pem.read_bytes(), password=None))
+
+    @property
+    def kids(self) -> list:
+        return list(self._private_keys)
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(claims, self._private_keys[self.active_kid], algorithm=self.alg,
+                          headers={"kid": self.active_kid})
+
+    def verify(self, token: str, **options) -> dict:
+        """Verifica con la clave pública del kid del header; lanza jwt.InvalidTokenError"""
+        kid = jwt.get_unverified_header(token).get("kid")
+        public_key = self._public_keys.get(kid)
+        if public_key is None:
+            raise jwt.InvalidTokenError("kid desconocido")
+        return jwt.decode(token, public_key, algorithms=[self.alg], **options)
+
+    def jwks(self) -> dict:
+        """JWK Set público (se recalcula solo al cambiar las claves)"""
+        if self._jwks is None:
+            keys = []
+            for kid, public_key in self._public_keys.items():
+                jwk = self._algorithm.to_jwk(public_key, as_dict=True)
+                jwk.update({"kid": kid, "alg": self.alg, "use": "sig"})
+                keys.append(jwk)
+            self._jwks = {"keys": keys}
+        return self._jwks
+
+
+def create_key_ring(alg: str = MCP_SIGNING_ALG, keys_dir: str = MCP_SIGNING_KEYS_DIR,
+                    dev_key: bool = MCP_SIGNING_DEV_KEY):
+    """KeyRing según MCP_SIGNING_ALG; None con HS256 (secretos compartidos)"""
+    if alg == "HS256":
+        return None
+    key_ring = KeyRing(alg)
+    if keys_dir:
+        key_ring.load_dir(keys_dir)
+    if not key_ring.kids:
+        # Una clave por worker: lo firmado en uno no verifica en otro, así que no es un fallback silencioso
+        if not dev_key:
+            raise ValueError(f"MCP_SIGNING_ALG={alg} requiere claves en MCP_SIGNING_KEYS_DIR "
+                             "(MCP_SIGNING_DEV_KEY=true para una clave efímera de desarrollo)")
+        logger.warning("MCP_SIGNING_KEYS_DIR sin claves: usando una clave %s efímera (solo desarrollo)", alg)
+        key_ring.generate("dev")
+    if MCP_SIGNING_ACTIVE_KID:
+        key_ring.activate(MCP_SIGNING_ACTIVE_KID)
+    return key_ring
+
+signing_keys = create_key_ring()
+
+# === ENDPOINT JWKS ===
+@router.get("/.well-known/jwks.json")
+async def jwks():
+    """Claves públicas para verificar access tokens localmente"""
+    body = signing_keys.jwks() if signing_keys is not None else {"keys": []}
+    return JSONResponse(body, headers={"Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}"})
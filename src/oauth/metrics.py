@@ -0,0 +1,188 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+# Buckets en segundos: del sub-milisegundo (firma, cache) a varios segundos (Supabase lento)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+router = APIRouter()
+
+# === MÉTRICAS (formato de exposición Prometheus) ===
+class Histogram:
+    """Histograma con etiquetas; observe() es O(log buckets) y thread-safe"""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labelvalues -> [conteos por bucket (+Inf al final), suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labelvalues: str) -> int:
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labelvalues, counts, total, observations in sorted(snapshot):
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labelnames, labelvalues))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {observations}")
+        return lines
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labelvalues, value in snapshot:
+            labels = ",".join(f'{name}="{v}"' for name, v in zip(self.labelnames, labelvalues))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Valor instantáneo con etiquetas"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+stage_duration = registry.register(Histogram(
+    "mcp_stage_duration_seconds", "Duración de cada etapa del hot path", ("endpoint", "stage")
+))
+request_duration = registry.register(Histogram(
+    "mcp_request_duration_seconds", "Duración end-to-end de cada request HTTP", ("path", "status")
+))
+
+# === TIMERS POR REQUEST ===
+_current_timer = ContextVar("mcp_request_timer", default=None)
+
+class RequestTimer:
+    """Inicio del request y endpoint al que se atribuyen las etapas"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+
+def start_request(endpoint: str) -> RequestTimer:
+    """Abre el timer del request actual (vive en el contexto de la tarea del request)"""
+    timer = RequestTimer(endpoint)
+    _current_timer.set(timer)
+    return timer
+
+def current_latency_ms():
+    """Latencia transcurrida del request actual; None fuera de un request"""
+    timer = _current_timer.get()
+    return timer.elapsed_ms() if timer is not None else None
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa del request actual; no-op fuera de un request"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(time.perf_counter() - started, timer.endpoint, name)
+
+# === MIDDLEWARE ASGI (sin BaseHTTPMiddleware: no añade tareas ni copias del body) ===
+class MetricsMiddleware:
+    """Registra la duración end-to-end por ruta (plantilla, no path concreto) y status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            request_duration.observe(time.perf_counter() - started, path, str(status))
+
+# === ENDPOINT /metrics ===
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
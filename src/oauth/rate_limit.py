@@ -0,0 +1,150 @@
+import asyncio
+import math
+import os
+import time
+from typing import NamedTuple
+
+from fastapi import HTTPException
+
+# Configuración
+RATE_LIMIT_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+RATE_LIMIT_CLIENT = int(os.getenv("RATE_LIMIT_CLIENT", "600"))  # por client_id y ventana
+RATE_LIMIT_USER = int(os.getenv("RATE_LIMIT_USER", "60"))  # por (client_id, usuario) y ventana
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.5"))  # segundos
+
+class RateDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int  # segundos (0 si se admite)
+
+
+# === LIMITADOR DE VENTANA DESLIZANTE CON PRE-AGREGACIÓN LOCAL ===
+class RateLimiter:
+    """Ventana deslizante aproximada (ventana actual + anterior ponderada) por clave.
+
+    Cada worker decide en memoria con el último total global conocido más sus
+    propios hits aún no sincronizados; un worker en segundo plano suma esos hits
+    en Redis (INCRBY en pipeline) y trae los totales de todos los workers. El
+    request nunca espera a Redis; el exceso posible está acotado por
+    workers × intervalo de sync × tasa. Sin Redis el límite es por proceso.
+    """
+
+    KEY_PREFIX = "rl:"
+
+    def __init__(self, window: float = RATE_LIMIT_WINDOW_SECONDS, client_limit: int = RATE_LIMIT_CLIENT,
+                 user_limit: int = RATE_LIMIT_USER, sync_interval: float = RATE_LIMIT_SYNC_INTERVAL,
+                 clock=time.time):
+        self.window = window
+        self.client_limit = client_limit
+        self.user_limit = user_limit
+        self.sync_interval = sync_interval
+        self.clock = clock
+        self.client = None
+        self._synced = {}  # (clave, ventana) -> total global en el último sync
+        self._in_flight = {}  # hits enviados en el sync en curso
+        self._pending = {}  # hits locales aún no enviados
+        self._worker = None
+
+    def _count(self, slot: tuple) -> int:
+        return self._synced.get(slot, 0) + self._in_flight.get(slot, 0) + self._pending.get(slot, 0)
+
+    def hit(self, key: str, limit: int) -> RateDecision:
+        """Decide y, si se admite, cuenta un hit para `key` (sin I/O)"""
+        now = self.clock()
+        index = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        previous = self._count((key, index - 1))
+        current = self._count((key, index))
+        estimate = previous * (1 - elapsed) + current
+
+        if estimate + 1 > limit:
+            if current + 1 > limit or previous == 0:
+                # Hay que esperar a la siguiente ventana
+                wait = self.window - now % self.window
+            else:
+                # Esperar a que la ventana anterior pese lo suficiente menos
+                needed = 1 - (limit - 1 - current) / previous
+                wait = (needed - elapsed) * self.window
+            return RateDecision(False, limit, 0, max(1, math.ceil(wait)))
+
+        slot = (key, index)
+        self._pending[slot] = self._pending.get(slot, 0) + 1
+        return RateDecision(True, limit, max(0, int(limit - estimate - 1)), 0)
+
+    def check(self, key: str, limit: int) -> None:
+        """Lanza 429 con cabeceras de reintento si `key` excede `limit`"""
+        decision = self.hit(key, limit)
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Demasiadas solicitudes",
+                headers={
+                    "Retry-After": str(decision.retry_after),
+                    "RateLimit-Limit": str(decision.limit),
+                    "RateLimit-Remaining": "0",
+                    "RateLimit-Reset": str(decision.retry_after),
+                },
+            )
+
+    def check_client(self, client_id: str) -> None:
+        self.check(f"client:{client_id}", self.client_limit)
+
+    def check_user(self, client_id: str, user_id: str) -> None:
+        self.check(f"user:{client_id}:{user_id}", self.user_limit)
+
+    async def sync(self) -> None:
+        """Envía los hits locales y trae los totales globales de las claves activas"""
+        batch, self._pending = self._pending, {}
+        self._in_flight = batch
+        current = int(self.clock() // self.window)
+        # Claves vistas en la ventana actual o la anterior: también se refrescan sin hits propios
+        slots = [slot for slot in set(self._synced) | set(batch) if slot[1] >= current - 1]
+        try:
+            if self.client is None:
+                totals = [self._synced.get(slot, 0) + batch.get(slot, 0) for slot in slots]
+            else:
+                pipe = self.client.pipeline(transaction=False)
+                for key, index in slots:
+                    redis_key = f"{self.KEY_PREFIX}{key}:{index}"
+                    pipe.incrby(redis_key, batch.get((key, index), 0))
+                    pipe.expire(redis_key, int(self.window * 2) + 1)
+                totals = (await pipe.execute())[::2]
+        except Exception:
+            # Redis no disponible: conservar los hits para el siguiente sync
+            for slot, hits in batch.items():
+                self._pending[slot] = self._pending.get(slot, 0) + hits
+            raise
+        finally:
+            self._in_flight = {}
+        self._synced = dict(zip(slots, (int(total) for total in totals)))
+
+    async def start(self, client=None) -> None:
+        """Arranca el sync periódico; `client` es un redis.asyncio.Redis o None"""
+        self.client = client
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        try:
+            await self.sync()
+        except Exception as e:
+            print(f"Rate limiter: último sync fallido ({e})")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Rate limiter: sync con Redis fallido ({e}); decidiendo con totales locales")
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,184 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+import httpx
+
+from .metrics import Counter, Gauge, registry
+
+# Configuración
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "2.0"))  # deadline por llamada
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))  # fallos seguidos
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))  # abierto antes de sondear
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "false").lower() == "true"
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.05"))
+HEDGE_MIN_SAMPLES = 20  # sin suficientes muestras no hay p95 fiable: no se cubre
+
+circuit_state = registry.register(Gauge(
+    "mcp_circuit_state", "Estado del circuit breaker (0 cerrado, 1 semiabierto, 2 abierto)", ("upstream",)
+))
+circuit_transitions = registry.register(Counter(
+    "mcp_circuit_transitions_total", "Cambios de estado del circuit breaker", ("upstream", "state")
+))
+upstream_calls = registry.register(Counter(
+    "mcp_upstream_calls_total", "Llamadas salientes por resultado", ("upstream", "outcome")
+))
+
+
+class UpstreamUnavailable(Exception):
+    """El upstream no respondió a tiempo o el circuito está abierto"""
+
+
+# === CIRCUIT BREAKER ===
+class CircuitBreaker:
+    """closed → open tras N fallos seguidos; open → half_open tras reset_seconds.
+
+    En half_open pasa una sola llamada de prueba: si va bien se cierra, si falla
+    se vuelve a abrir. Mientras está abierto se falla rápido sin tocar la red.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        circuit_state.set(0, name)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        circuit_state.set(self._GAUGE[state], self.name)
+        circuit_transitions.inc(self.name, state)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self.clock() - self._opened_at < self.reset_seconds:
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def release(self) -> None:
+        """La llamada no llegó a evaluar al upstream (p. ej. cancelada): liberar la prueba"""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = self.clock()
+            if self.state != self.OPEN:
+                self._transition(self.OPEN)
+
+
+# === LATENCIAS RECIENTES (para el retardo del hedge) ===
+class LatencyWindow:
+    """Ventana de las últimas N latencias exitosas"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float):
+        if len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+# === LLAMADAS SALIENTES RESILIENTES ===
+class ResilientCaller:
+    """Deadline por llamada + circuit breaker + hedge opcional tras el p95.
+
+    `fn` debe ser idempotente (p. ej. GET /auth/v1/user): con hedge se puede
+    ejecutar dos veces y se usa la primera respuesta. Cuenta como fallo del
+    upstream un timeout, un error de transporte o un 5xx; un 4xx es una
+    respuesta válida (p. ej. token rechazado).
+    """
+
+    def __init__(self, name: str, timeout: float = UPSTREAM_TIMEOUT_SECONDS,
+                 breaker: CircuitBreaker = None, hedge: bool = UPSTREAM_HEDGE,
+                 hedge_min_delay: float = HEDGE_MIN_DELAY_SECONDS):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker(name)
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.latencies = LatencyWindow()
+
+    def hedge_delay(self):
+        p95 = self.latencies.percentile(0.95)
+        return None if p95 is None else max(p95, self.hedge_min_delay)
+
+    async def call(self, fn) -> httpx.Response:
+        if not self.breaker.allow():
+            upstream_calls.inc(self.name, "rejected")
+            raise UpstreamUnavailable(f"{self.name}: circuito abierto")
+
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._attempt(fn), self.timeout)
+        except asyncio.TimeoutError:
+            self._failed("timeout")
+            raise UpstreamUnavailable(f"{self.name}: timeout ({self.timeout}s)")
+        except httpx.TransportError as e:
+            self._failed("error")
+            raise UpstreamUnavailable(f"{self.name}: {e}")
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        if response.status_code >= 500:
+            self._failed("error")
+            raise UpstreamUnavailable(f"{self.name}: HTTP {response.status_code}")
+        self.breaker.record_success()
+        self.latencies.add(time.perf_counter() - started)
+        upstream_calls.inc(self.name, "success")
+        return response
+
+    def _failed(self, outcome: str) -> None:
+        self.breaker.record_failure()
+        upstream_calls.inc(self.name, outcome)
+
+    async def _attempt(self, fn) -> httpx.Response:
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None:
+            return await fn()
+
+        primary = asyncio.ensure_future(fn())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                # La primaria supera el p95: lanzar una segunda y quedarse con la primera que acabe
+                upstream_calls.inc(self.name, "hedged")
+                tasks.add(asyncio.ensure_future(fn()))
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None or not tasks:
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
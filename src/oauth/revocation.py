@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+
+from .metrics import Counter, registry
+
+# Configuración
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+REVOCATION_RESYNC_SECONDS = float(os.getenv("REVOCATION_RESYNC_SECONDS", "60"))
+SUBJECT_REVOCATION_TTL_SECONDS = 30 * 24 * 3600  # el token más largo (refresh) que puede seguir vivo
+
+revocation_checks = registry.register(Counter(
+    "mcp_revocation_checks_total", "Comprobaciones de revocación por resultado", ("result",)
+))
+
+# === BLOOM FILTER ===
+class BloomFilter:
+    """Bloom filter sobre un bytearray: sin falsos negativos, falsos positivos ~error_rate"""
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY,
+                 error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Doble hashing (Kirsch–Mitzenmacher) a partir de un solo digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+# === LISTA DE REVOCACIÓN ===
+class RevocationList:
+    """Denylist de jti y sujetos: Redis como fuente de verdad, Bloom filter por worker.
+
+    Un token sin coincidencias en el Bloom filter no está revocado (caso común,
+    solo memoria); con coincidencia se confirma en Redis. Cada worker aplica las
+    revocaciones nuevas al recibirlas por pub/sub y reconstruye el filtro desde
+    Redis cada REVOCATION_RESYNC_SECONDS, lo que acota el retraso aunque se
+    pierdan mensajes y descarta entradas ya expiradas. Sin Redis es por proceso.
+    """
+
+    KEY_PREFIX = "revoked:"
+    CHANNEL = "mcp:revocations"
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY,
+                 resync_seconds: float = REVOCATION_RESYNC_SECONDS, clock=time.time):
+        self.capacity = capacity
+        self.resync_seconds = resync_seconds
+        self.clock = clock
+        self.client = None
+        self.bloom = BloomFilter(capacity)
+        self._local = {}  # sin Redis: entrada -> (valor, expira)
+        self._worker = None
+
+    # --- escritura ---
+    async def revoke_jti(self, jti: str, exp: float) -> None:
+        """Revoca un token concreto hasta su exp"""
+        await self._revoke(f"jti:{jti}", "1", max(1, math.ceil(exp - self.clock())))
+
+    async def revoke_subject(self, sub: str) -> None:
+        """Revoca todo lo emitido a `sub` hasta ahora (iat <= ahora)"""
+        await self._revoke(f"sub:{sub}", str(self.clock()), SUBJECT_REVOCATION_TTL_SECONDS)
+
+    async def _revoke(self, entry: str, value: str, ttl: int) -> None:
+        self.bloom.add(entry)
+        if self.client is None:
+            self._local[entry] = (value, self.clock() + ttl)
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(f"{self.KEY_PREFIX}{entry}", value, ex=ttl)
+        pipe.publish(self.CHANNEL, entry)
+        await pipe.execute()
+
+    # --- lectura ---
+    async def is_revoked(self, claims: dict) -> bool:
+        entries = [f"sub:{claims.get('sub')}"]
+        if "jti" in claims:
+            entries.append(f"jti:{claims['jti']}")
+        candidates = [entry for entry in entries if entry in self.bloom]
+        if not candidates:
+            revocation_checks.inc("bloom_miss")
+            return False
+
+        values = await self._lookup(candidates)
+        revoked = False
+        for entry, value in zip(candidates, values):
+            if value is None:
+                continue
+            if isinstance(value, bytes):
+                value = value.decode()
+            if entry.startswith("jti:") or claims.get("iat", 0) <= float(value):
+                revoked = True
+        revocation_checks.inc("revoked" if revoked else "bloom_false_positive")
+        return revoked
+
+    async def _lookup(self, entries: list) -> list:
+        if self.client is None:
+            now = self.clock()
+            values = []
+            for entry in entries:
+                value, expires_at = self._local.get(entry, (None, 0))
+                values.append(value if expires_at > now else None)
+            return values
+        return await self.client.mget([f"{self.KEY_PREFIX}{entry}" for entry in entries])
+
+    # --- sincronización entre workers ---
+    async def resync(self) -> None:
+        """Reconstruye el Bloom filter con las revocaciones vigentes en Redis"""
+        if self.client is None:
+            now = self.clock()
+            self._local = {e: v for e, v in self._local.items() if v[1] > now}
+            entries = list(self._local)
+        else:
+            entries = []
+            async for key in self.client.scan_iter(match=f"{self.KEY_PREFIX}*", count=1000):
+                key = key.decode() if isinstance(key, bytes) else key
+                entries.append(key[len(self.KEY_PREFIX):])
+        bloom = BloomFilter(max(self.capacity, 2 * len(entries)))
+        for entry in entries:
+            bloom.add(entry)
+        self.bloom = bloom
+
+    async def start(self, client=None) -> None:
+        self.client = client
+        try:
+            await self.resync()
+        except Exception as e:
+            # No impedir el arranque: el worker reintenta la sincronización
+            print(f"Revocation sync inicial fallido ({e}); reintentando en segundo plano")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.client is None:
+                    await asyncio.sleep(self.resync_seconds)
+                    await self.resync()
+                else:
+                    await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Revocation sync fallido ({e}); reintentando")
+                await asyncio.sleep(1)
+
+    async def _listen(self) -> None:
+        """Aplica revocaciones publicadas hasta que toque la resincronización completa"""
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            # Ya suscritos: lo publicado durante el escaneo queda en cola y se aplica después
+            await self.resync()
+            deadline = asyncio.get_running_loop().time() + self.resync_seconds
+            while True:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    return
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+                if message is not None:
+                    data = message["data"]
+                    self.bloom.add(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            await pubsub.aclose()
+
+
+revocation_list = RevocationList()
@@ -0,0 +1,264 @@
+import asyncio
+import operator
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import yaml
+from fastapi import APIRouter, HTTPException, Request
+
+from .admin import check_admin_token
+
+# Configuración
+RULES_RUNTIME_DIR = os.getenv("RULES_RUNTIME_DIR", "runtime")  # *.active = specs activos
+RULES_SPECS_DIR = os.getenv("RULES_SPECS_DIR", "specs")  # specs de los markers vacíos
+RULES_RELOAD_SECONDS = float(os.getenv("RULES_RELOAD_SECONDS", "2.0"))
+
+
+class RuleSpecError(ValueError):
+    """Spec de reglas inválido (YAML o condición que no se puede compilar)"""
+
+
+class CompiledRule(NamedTuple):
+    name: str
+    trigger: str
+    condition: Callable  # contexto -> bool
+    action: dict
+    source: str  # archivo del que se cargó
+
+
+# === COMPILACIÓN DE CONDICIONES ===
+# `<campo> <op> <literal>`: campo con puntos (`result.updatesAvailable`), literal
+# true/false, número, duración (`24h`), string con comillas o palabra suelta
+_CONDITION = re.compile(r"^\s*([A-Za-z_][\w.]*)\s+(==|!=|>=|<=|>|<|contains)\s+(.+?)\s*$")
+_DURATION = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+_DURATION_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_COMPARISONS = {
+    "==": operator.eq, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+}
+_MISSING = object()
+
+router = APIRouter()
+
+@lru_cache(maxsize=4096)
+def normalize_text(text: str) -> str:
+    """Minúsculas y sin tildes: `Código` y `codigo` son la misma keyword"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def _literal(raw: str):
+    if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in "\"'":
+        return raw[1:-1]
+    lowered = raw.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    duration = _DURATION.match(lowered)
+    if duration:
+        return float(duration.group(1)) * _DURATION_SECONDS[duration.group(2)]
+    try:
+        return float(raw) if "." in raw else int(raw)
+    except ValueError:
+        return raw
+
+def _getter(path: str) -> Callable:
+    keys = path.split(".")
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda context: context.get(key, _MISSING)
+
+    def get(context):
+        value = context
+        for key in keys:
+            if not isinstance(value, dict):
+                return _MISSING
+            value = value.get(key, _MISSING)
+        return value
+    return get
+
+def compile_condition(condition) -> Callable:
+    """Compila una condición del spec a un closure `contexto -> bool` (una sola vez)"""
+    if condition is None:
+        return lambda context: True
+    match = _CONDITION.match(str(condition))
+    if match is None:
+        raise RuleSpecError(f"Condición no soportada: {condition!r}")
+    path, op, raw = match.groups()
+    get = _getter(path)
+    expected = _literal(raw)
+
+    if op == "contains":
+        # Alternativas separadas por `|`, como palabras completas, sin tildes ni mayúsculas
+        words = [re.escape(normalize_text(word)) for word in str(expected).split("|") if word]
+        pattern = re.compile(r"\b(?:" + "|".join(words) + r")\b")
+
+        def contains(context):
+            value = get(context)
+            return isinstance(value, str) and pattern.search(normalize_text(value)) is not None
+        return contains
+
+    compare = _COMPARISONS[op]
+    if op in ("==", "!=") and isinstance(expected, bool):
+        def compare_bool(context):
+            value = get(context)
+            return value is not _MISSING and compare(value is True or value == "true", expected)
+        return compare_bool
+
+    def compare_value(context):
+        value = get(context)
+        if value is _MISSING:
+            return False
+        try:
+            return compare(value, expected)
+        except TypeError:
+            return False
+    return compare_value
+
+
+# === CARGA DE SPECS ===
+def compile_spec(spec: dict, source: str) -> list:
+    if not isinstance(spec, dict) or not isinstance(spec.get("rules"), list):
+        raise RuleSpecError(f"{source}: falta la lista `rules`")
+    compiled = []
+    for rule in spec["rules"]:
+        if not isinstance(rule, dict) or "trigger" not in rule:
+            raise RuleSpecError(f"{source}: regla sin `trigger`")
+        try:
+            condition = compile_condition(rule.get("condition"))
+        except RuleSpecError as e:
+            raise RuleSpecError(f"{source}: {rule.get('name')}: {e}") from None
+        compiled.append(CompiledRule(rule.get("name", ""), rule["trigger"], condition,
+                                     rule.get("action") or {}, source))
+    return compiled
+
+
+class RuleSet(NamedTuple):
+    """Reglas activas indexadas por (tenant, trigger); inmutable, se reemplaza al recargar"""
+    index: dict
+    signature: tuple
+
+
+# === MOTOR DE REGLAS ===
+class RuleEngine:
+    """Evalúa eventos contra los specs activos en runtime/*.active.
+
+    Cada `*.active` contiene el spec a activar o, si está vacío, marca como
+    activo `specs/<nombre>.yaml`. Los specs se parsean y sus condiciones se
+    compilan a closures una sola vez; un evento solo evalúa las reglas de su
+    (tenant, trigger). La recarga compara mtime/tamaño de markers y specs: un
+    cambio reconstruye el índice completo y lo publica de una vez; si el
+    nuevo spec es inválido se mantiene el anterior.
+    """
+
+    def __init__(self, runtime_dir: str = RULES_RUNTIME_DIR, specs_dir: str = RULES_SPECS_DIR,
+                 reload_seconds: float = RULES_RELOAD_SECONDS):
+        self.runtime_dir = Path(runtime_dir)
+        self.specs_dir = Path(specs_dir)
+        self.reload_seconds = reload_seconds
+        self.rules = RuleSet({}, ())
+        self._rejected = None  # firma del último intento inválido: no se reintenta sin cambios
+        self._worker = None
+
+    def _sources(self) -> list:
+        """(marker, archivo con el spec) por cada spec activo, en orden de nombre"""
+        sources = []
+        for marker in sorted(self.runtime_dir.glob("*.active")):
+            if marker.stat().st_size:
+                sources.append((marker, marker))
+            else:
+                sources.append((marker, self.specs_dir / f"{marker.stem}.yaml"))
+        return sources
+
+    def _signature(self, sources: list) -> tuple:
+        signature = []
+        for marker, path in sources:
+            for watched in {marker, path}:
+                try:
+                    stat = watched.stat()
+                except FileNotFoundError:
+                    signature.append((str(watched), None, None))
+                    continue
+                signature.append((str(watched), stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(signature))
+
+    def reload(self, force: bool = False) -> bool:
+        """Recarga si cambió algún marker o spec; True si se publicó un índice nuevo"""
+        sources = self._sources() if self.runtime_dir.is_dir() else []
+        signature = self._signature(sources)
+        if signature in (self.rules.signature, self._rejected) and not force:
+            return False
+        try:
+            index = self._build_index(sources)
+        except RuleSpecError:
+            self._rejected = signature
+            raise
+        self.rules = RuleSet({key: tuple(rules) for key, rules in index.items()}, signature)
+        return True
+
+    def _build_index(self, sources: list) -> dict:
+        index = {}
+        for _, path in sources:
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    spec = yaml.safe_load(fh)
+            except (OSError, yaml.YAMLError) as e:
+                raise RuleSpecError(f"{path}: {e}") from None
+            tenant = str(spec.get("tenant", "")) if isinstance(spec, dict) else ""
+            for rule in compile_spec(spec, str(path)):
+                index.setdefault((tenant, rule.trigger), []).append(rule)
+        return index
+
+    def evaluate(self, tenant: str, trigger: str, context: dict) -> list:
+        """Reglas del tenant para `trigger` cuya condición se cumple, en orden de declaración"""
+        rules = self.rules.index.get((tenant, trigger), ())
+        return [rule for rule in rules if rule.condition(context)]
+
+    # --- ciclo de vida ---
+    async def start(self) -> None:
+        try:
+            self.reload()
+        except RuleSpecError as e:
+            print(f"Rules: specs activos inválidos ({e}); sin reglas hasta corregirlos")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_seconds)
+            try:
+                if self.reload():
+                    print(f"Rules: recargadas {sum(len(r) for r in self.rules.index.values())} reglas")
+            except RuleSpecError as e:
+                print(f"Rules: recarga fallida ({e}); se mantienen las reglas anteriores")
+
+
+rule_engine = RuleEngine()
+
+# === ENDPOINT DE EVALUACIÓN ===
+@router.post("/rules/evaluate")
+async def evaluate_rules(request: Request):
+    """Acciones de las reglas activas que aplican a un evento {tenant, trigger, context}"""
+    check_admin_token(request)
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if not isinstance(body, dict) or not isinstance(body.get("context", {}), dict):
+        raise HTTPException(status_code=400, detail="Se espera {tenant, trigger, context}")
+    tenant, trigger = body.get("tenant"), body.get("trigger")
+    if not tenant or not trigger:
+        raise HTTPException(status_code=400, detail="tenant y trigger son requeridos")
+    matched = rule_engine.evaluate(str(tenant), str(trigger), body.get("context", {}))
+    return {"matches": [{"rule": rule.name, "action": rule.action} for rule in matched]}
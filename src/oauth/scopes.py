@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+# Configuración
+MCP_KNOWN_SCOPES = os.getenv("MCP_KNOWN_SCOPES", "invoices.read,payments.read,partners.read")
+ALLOWED_SCOPES_CACHE_MAX_ENTRIES = int(os.getenv("ALLOWED_SCOPES_CACHE_MAX_ENTRIES", "10000"))
+# Cota de lo que otro worker puede seguir usando tras un cambio de grants en Supabase
+ALLOWED_SCOPES_CACHE_TTL_SECONDS = float(os.getenv("ALLOWED_SCOPES_CACHE_TTL_SECONDS", "60"))
+COMPILED_SCOPES_MAX_ENTRIES = 4096
+COMPILED_PATTERNS_MAX_ENTRIES = 1024
+
+# Bit 0 reservado: marca scopes desconocidos, nunca se concede
+UNKNOWN_SCOPE_BIT = 1
+WILDCARD = "*"
+
+class CompiledScopes(NamedTuple):
+    """Scope string ya parseado: bitmask + scopes en el orden de la petición"""
+    mask: int
+    scopes: tuple
+
+# === GRANTS CON COMODINES (trie por segmentos) ===
+class _TrieNode:
+    __slots__ = ("children", "wildcard", "terminal", "subtree")
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.terminal = False
+        self.subtree = False  # `*` final: cubre también los niveles inferiores
+
+
+class ScopeTrie:
+    """Patrones concedidos (`invoices.*`, `accounting.*.read`) compilados en un trie.
+
+    Los segmentos se separan por '.'. `*` equivale a exactamente un segmento;
+    como último segmento cubre además cualquier profundidad (`invoices.*`
+    concede `invoices.read` e `invoices.lines.read`). Un match recorre el scope
+    una sola vez con el conjunto de nodos activos, sin regex por patrón.
+    """
+
+    def __init__(self, patterns=()):
+        self._root = _TrieNode()
+        for pattern in patterns:
+            self.add(pattern)
+
+    def add(self, pattern: str) -> None:
+        segments = pattern.split(".")
+        if "" in segments:
+            return
+        node = self._root
+        for segment in segments:
+            if segment == WILDCARD:
+                if node.wildcard is None:
+                    node.wildcard = _TrieNode()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(segment, _TrieNode())
+        node.terminal = True
+        node.subtree = node.subtree or segments[-1] == WILDCARD
+
+    def matches(self, scope: str) -> bool:
+        segments = scope.split(".")
+        if "" in segments:
+            return False
+        nodes = [self._root]
+        for segment in segments:
+            following = []
+            for node in nodes:
+                if node.subtree:
+                    return True
+                child = node.children.get(segment)
+                if child is not None:
+                    following.append(child)
+                if node.wildcard is not None:
+                    following.append(node.wildcard)
+            if not following:
+                return False
+            nodes = following
+        return any(node.terminal for node in nodes)
+
+
+class GrantedScopes(NamedTuple):
+    """Grants de un (user, client): bitmask de scopes exactos + trie de comodines (o None)"""
+    mask: int
+    patterns: ScopeTrie = None
+
+# === REGISTRO DE SCOPES (interning a bits) ===
+class ScopeRegistry:
+    """Asigna a cada scope conocido una posición de bit estable dentro del proceso"""
+
+    def __init__(self, known_scopes=()):
+        self._bits = {}
+        self._names = [None]  # índice = posición de bit; 0 = desconocido
+        self._compiled = {}  # scope string -> CompiledScopes
+        self._patterns = {}  # frozenset de patrones -> ScopeTrie (compartido entre usuarios)
+        self._lock = threading.Lock()
+        for scope in known_scopes:
+            self.intern(scope)
+
+    def intern(self, scope: str) -> int:
+        """Devuelve el bit del scope, registrándolo si es nuevo"""
+        bit = self._bits.get(scope)
+        if bit is not None:
+            return bit
+        with self._lock:
+            bit = self._bits.get(scope)
+            if bit is None:
+                bit = 1 << len(self._names)
+                self._names.append(scope)
+                self._bits[scope] = bit
+                # Los scope strings cacheados pueden contener este scope como desconocido
+                self._compiled = {}
+        return bit
+
+    def mask(self, scopes) -> int:
+        """Bitmask de scopes concedidos (registra los que no existan)"""
+        mask = 0
+        for scope in scopes:
+            mask |= self.intern(scope)
+        return mask
+
+    def names(self, mask: int) -> list:
+        """Scopes contenidos en un bitmask, en orden de registro"""
+        names = []
+        position = 1
+        mask >>= 1
+        while mask:
+            if mask & 1:
+                names.append(self._names[position])
+            mask >>= 1
+            position += 1
+        return names
+
+    def compile(self, scope_string: str) -> CompiledScopes:
+        """Parsea un scope string de la petición; los desconocidos activan UNKNOWN_SCOPE_BIT"""
+        compiled = self._compiled.get(scope_string)
+        if compiled is not None:
+            return compiled
+        scopes = tuple(scope_string.split(" "))
+        mask = 0
+        for scope in scopes:
+            mask |= self._bits.get(scope, UNKNOWN_SCOPE_BIT)
+        compiled = CompiledScopes(mask, scopes)
+        if len(self._compiled) >= COMPILED_SCOPES_MAX_ENTRIES:
+            self._compiled = {}
+        self._compiled[scope_string] = compiled
+        return compiled
+
+    def grants(self, scopes) -> GrantedScopes:
+        """Compila los grants: scopes exactos al bitmask, patrones con `*` al trie"""
+        exact, patterns = [], []
+        for scope in scopes:
+            (patterns if WILDCARD in scope.split(".") else exact).append(scope)
+        if not patterns:
+            return GrantedScopes(self.mask(exact))
+        key = frozenset(patterns)
+        trie = self._patterns.get(key)
+        if trie is None:
+            trie = ScopeTrie(key)
+            if len(self._patterns) >= COMPILED_PATTERNS_MAX_ENTRIES:
+                self._patterns = {}
+            self._patterns[key] = trie
+        return GrantedScopes(self.mask(exact), trie)
+
+    def denied(self, requested: CompiledScopes, granted: GrantedScopes) -> int:
+        """Bits pedidos no cubiertos por los grants (0 = autorizado)"""
+        denied = denied_mask(requested.mask, granted.mask)
+        if not denied or granted.patterns is None:
+            return denied
+        # Solo los scopes fuera del bitmask pasan por el trie
+        denied = 0
+        for scope in requested.scopes:
+            bit = self._bits.get(scope, UNKNOWN_SCOPE_BIT)
+            if bit & ~granted.mask and not granted.patterns.matches(scope):
+                denied |= bit
+        return denied
+
+
+def denied_mask(requested_mask: int, allowed_mask: int) -> int:
+    """Bits pedidos que no están concedidos (0 = autorizado)"""
+    return requested_mask & ~allowed_mask
+
+
+# === CACHE DE SCOPES PERMITIDOS POR (user, client) ===
+class AllowedScopesCache:
+    """Cache LRU de grants compilados por (user_id, client_id) con TTL e invalidación explícita"""
+
+    def __init__(self, max_entries: int = ALLOWED_SCOPES_CACHE_MAX_ENTRIES,
+                 ttl: float = ALLOWED_SCOPES_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # (user, client) -> (grants, válido hasta)
+
+    def get(self, user_id: str, client_id: str):
+        key = (user_id, client_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        granted, until = entry
+        if self.clock() >= until:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return granted
+
+    def put(self, user_id: str, client_id: str, granted) -> None:
+        key = (user_id, client_id)
+        self._entries[key] = (granted, self.clock() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str, client_id: str = None) -> None:
+        """Invalida un (user, client) o todos los clientes de un usuario"""
+        if client_id is not None:
+            self._entries.pop((user_id, client_id), None)
+            return
+        for key in [key for key in self._entries if key[0] == user_id]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Catálogo configurado: fijo, a diferencia del registro que también interna los grants vistos
+KNOWN_SCOPES = frozenset(scope.strip() for scope in MCP_KNOWN_SCOPES.split(",") if scope.strip())
+
+scope_registry = ScopeRegistry(sorted(KNOWN_SCOPES))
+allowed_scopes_cache = AllowedScopesCache()
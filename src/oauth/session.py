@@ -0,0 +1,269 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+import jwt
+from fastapi import HTTPException, Request
+
+from .metrics import Counter, registry
+from .resilience import UPSTREAM_TIMEOUT_SECONDS, ResilientCaller, UpstreamUnavailable
+from .singleflight import SingleFlight
+
+# Configuración
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "60"))  # segundos
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+# "local": verifica el JWT de sesión con SUPABASE_JWT_SECRET o el JWKS del proyecto;
+# "remote": GET /auth/v1/user en cada sesión no cacheada. Vacío: local si hay secreto
+SESSION_VERIFY_MODE = os.getenv("SESSION_VERIFY_MODE", "")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_TTL_SECONDS = float(os.getenv("SUPABASE_JWKS_TTL_SECONDS", "600"))
+# Tokens a menos de esto de su exp se confirman con Supabase (p. ej. sesión cerrada)
+SESSION_REMOTE_CHECK_SECONDS = float(os.getenv("SESSION_REMOTE_CHECK_SECONDS", "60"))
+JWKS_MIN_REFRESH_SECONDS = 30  # kid desconocido: como mucho una descarga del JWKS por intervalo
+ASYMMETRIC_ALGORITHMS = ("ES256", "RS256", "EdDSA")
+
+session_validations = registry.register(Counter(
+    "mcp_session_validations_total", "Sesiones validadas por modo", ("mode",)
+))
+
+def _token_key(access_token: str) -> str:
+    """Clave de cache: nunca se guarda el bearer token en claro"""
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+def _token_expiry(access_token: str):
+    """Lee el claim exp del JWT de sesión (sin verificar firma) o None"""
+    try:
+        claims = jwt.decode(access_token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return None
+    exp = claims.get("exp")
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+# === CACHE TTL/LRU DE SESIONES VALIDADAS ===
+class SessionCache:
+    """Cache LRU acotada de sesiones validadas, con TTL limitado por el exp del token"""
+
+    def __init__(self, ttl: float = SESSION_CACHE_TTL,
+                 max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, user_data)
+
+    def get(self, access_token: str):
+        key = _token_key(access_token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, user_data = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return user_data
+
+    def put(self, access_token: str, user_data: dict) -> None:
+        token_exp = _token_expiry(access_token)
+        if token_exp is None:
+            # Sin exp conocido no podemos garantizar no sobrevivir al token
+            return
+        expires_at = min(time.time() + self.ttl, token_exp)
+        if expires_at <= time.time():
+            return
+        key = _token_key(access_token)
+        self._entries[key] = (expires_at, user_data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, access_token: str) -> None:
+        self._entries.pop(_token_key(access_token), None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# === VERIFICACIÓN LOCAL DEL JWT DE SESIÓN ===
+class LocalSessionVerifier:
+    """Verifica firma, exp, aud e iss del JWT de sesión de Supabase sin llamar a /auth/v1/user.
+
+    HS256 se verifica con el JWT secret del proyecto; ES256/RS256/EdDSA con la
+    clave del JWKS del proyecto cuyo kid indica el token. El JWKS se cachea
+    SUPABASE_JWKS_TTL_SECONDS y se vuelve a descargar ante un kid desconocido
+    (rotación), una vez por JWKS_MIN_REFRESH_SECONDS como mucho.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, supabase_url: str, jwt_secret: str = None,
+                 audience: str = SUPABASE_JWT_AUDIENCE, jwks_ttl: float = SUPABASE_JWKS_TTL_SECONDS,
+                 caller: ResilientCaller = None, clock=time.time):
+        self.client = client
+        self.jwks_url = f"{supabase_url}/auth/v1/.well-known/jwks.json"
+        self.issuer = f"{supabase_url}/auth/v1"
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.jwks_ttl = jwks_ttl
+        self.caller = caller if caller is not None else ResilientCaller("supabase_jwks")
+        self.clock = clock
+        self._keys = {}  # kid -> PyJWK
+        self._fetched_at = None
+        self._inflight = SingleFlight()
+
+    async def verify(self, access_token: str) -> dict:
+        """Claims verificados; jwt.InvalidTokenError si el token no es válido"""
+        header = jwt.get_unverified_header(access_token)
+        algorithm = header.get("alg")
+        if algorithm == "HS256" and self.jwt_secret:
+            key = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            jwk = await self._signing_key(header.get("kid"))
+            if jwk is None or jwk.algorithm_name != algorithm:
+                raise jwt.InvalidTokenError("kid desconocido")
+            key = jwk.key
+        else:
+            raise jwt.InvalidTokenError(f"alg no admitido: {algorithm}")
+        return jwt.decode(access_token, key, algorithms=[algorithm], audience=self.audience,
+                          issuer=self.issuer, options={"require": ["exp", "sub"]})
+
+    async def _signing_key(self, kid: str):
+        now = self.clock()
+        expired = self._fetched_at is None or now - self._fetched_at >= self.jwks_ttl
+        unknown = kid not in self._keys and (
+            self._fetched_at is None or now - self._fetched_at >= JWKS_MIN_REFRESH_SECONDS
+        )
+        if expired or unknown:
+            await self._inflight.do("jwks", self._refresh)
+        return self._keys.get(kid)
+
+    async def _refresh(self) -> None:
+        response = await self.caller.call(lambda: self.client.get(self.jwks_url))
+        response.raise_for_status()
+        keys = {}
+        for jwk in jwt.PyJWKSet.from_dict(response.json()).keys:
+            keys[jwk.key_id] = jwk
+        self._keys = keys
+        self._fetched_at = self.clock()
+
+
+def _user_from_claims(claims: dict) -> dict:
+    """Forma del usuario de /auth/v1/user a partir de los claims de sesión"""
+    return {
+        "id": claims["sub"],
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+        "session_id": claims.get("session_id"),
+        "is_anonymous": claims.get("is_anonymous", False),
+    }
+
+
+# === VALIDADOR DE SESIONES SUPABASE ===
+class SessionValidator:
+    """Valida sesiones contra {SUPABASE_URL}/auth/v1/user con un cliente HTTP compartido.
+
+    Con `verifier` la sesión se valida localmente y la llamada a Supabase queda
+    para tokens a menos de `remote_check_seconds` de su exp o si el JWKS no
+    está disponible.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, supabase_url: str, anon_key: str,
+                 cache: SessionCache = None, caller: ResilientCaller = None,
+                 verifier: LocalSessionVerifier = None,
+                 remote_check_seconds: float = SESSION_REMOTE_CHECK_SECONDS):
+        self.client = client
+        self.supabase_url = supabase_url
+        self.anon_key = anon_key
+        self.cache = cache if cache is not None else SessionCache()
+        self.inflight = SingleFlight()
+        self.caller = caller if caller is not None else ResilientCaller("supabase_auth")
+        self.verifier = verifier
+        self.remote_check_seconds = remote_check_seconds
+
+    async def validate(self, access_token: str) -> dict:
+        cached = self.cache.get(access_token)
+        if cached is not None:
+            return cached
+        if self.verifier is not None:
+            user_data = await self._verify_locally(access_token)
+            if user_data is not None:
+                return user_data
+        # Pestañas/reintentos concurrentes con el mismo token: una sola llamada a Supabase
+        return await self.inflight.do(_token_key(access_token), lambda: self._fetch(access_token))
+
+    async def _verify_locally(self, access_token: str):
+        """Usuario verificado localmente, o None si hay que confirmar con Supabase"""
+        try:
+            claims = await self.verifier.verify(access_token)
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Token inválido")
+        except (UpstreamUnavailable, httpx.HTTPError, jwt.PyJWKSetError, ValueError) as e:
+            print(f"⚠️ JWKS no disponible ({e}); validando la sesión con Supabase")
+            return None
+        if claims["exp"] - self.verifier.clock() < self.remote_check_seconds:
+            return None
+        user_data = _user_from_claims(claims)
+        session_validations.inc("local")
+        self.cache.put(access_token, user_data)
+        return user_data
+
+    async def _fetch(self, access_token: str) -> dict:
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "apikey": self.anon_key
+        }
+        try:
+            response = await self.caller.call(lambda: self.client.get(
+                f"{self.supabase_url}/auth/v1/user",
+                headers=headers
+            ))
+        except UpstreamUnavailable as e:
+            # Fail closed y rápido: sin Supabase no se puede validar la sesión
+            print(f"⚠️ Validación de sesión no disponible: {e}")
+            raise HTTPException(status_code=503, detail="Servicio de identidad no disponible")
+
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Token inválido")
+
+        user_data = response.json()
+        session_validations.inc("remote")
+        self.cache.put(access_token, user_data)
+        return user_data
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+# === FACTORY Y DEPENDENCIA FASTAPI ===
+def create_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP de vida del proceso: keep-alive y HTTP/2 hacia Supabase"""
+    limits = httpx.Limits(
+        max_connections=SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_MAX_CONNECTIONS,
+    )
+    # Red de seguridad a nivel de transporte; el deadline real lo impone ResilientCaller
+    timeout = httpx.Timeout(UPSTREAM_TIMEOUT_SECONDS)
+    return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+
+def create_session_validator() -> SessionValidator:
+    """Crea el validador de sesiones (una vez por proceso, en el lifespan)"""
+    client = create_http_client()
+    supabase_url = os.getenv("SUPABASE_URL")
+    mode = SESSION_VERIFY_MODE or ("local" if SUPABASE_JWT_SECRET else "remote")
+    verifier = None
+    if mode == "local":
+        verifier = LocalSessionVerifier(client, supabase_url, jwt_secret=SUPABASE_JWT_SECRET)
+    return SessionValidator(
+        client=client,
+        supabase_url=supabase_url,
+        anon_key=os.getenv("SUPABASE_ANON_KEY"),
+        verifier=verifier,
+    )
+
+def get_session_validator(request: Request) -> SessionValidator:
+    """Dependencia FastAPI: devuelve el validador creado en el lifespan"""
+    return request.app.state.session_validator
@@ -0,0 +1,30 @@
+import asyncio
+
+# === SINGLE-FLIGHT ===
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución.
+
+    La primera llamada lanza la tarea; las siguientes con la misma clave, mientras
+    siga en vuelo, esperan esa misma tarea y reciben su resultado o su excepción.
+    No es una cache: al terminar la tarea, la clave se libera.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, fn):
+        """Ejecuta `fn()` (corrutina) una sola vez por clave en vuelo"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # shield: si un llamante se cancela (cliente desconectado), los demás siguen esperando
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,69 @@
+import math
+
+# === TIMING WHEEL JERÁRQUICO ===
+class TimingWheel:
+    """Timing wheel jerárquico: programar y expirar en O(1) amortizado por clave.
+
+    El nivel 0 tiene `slots` ranuras de un tick; cada nivel superior cubre
+    `slots` veces el rango del anterior. Al dar la vuelta un nivel, la ranura
+    correspondiente del nivel superior se redistribuye hacia abajo (cascada).
+    No es thread-safe: quien lo use debe serializar el acceso.
+    """
+
+    def __init__(self, tick: float = 1.0, slot_bits: int = 6, levels: int = 4, now: float = 0.0):
+        self.tick = tick
+        self.slot_bits = slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.current_tick = self.to_tick(now)
+        self._wheels = [[{} for _ in range(1 << slot_bits)] for _ in range(levels)]
+
+    def to_tick(self, timestamp: float) -> int:
+        """Tick en el que vence un instante (redondeo hacia arriba)"""
+        return math.ceil(timestamp / self.tick)
+
+    def schedule(self, key, deadline_tick: int) -> bool:
+        """Programa `key` para `deadline_tick`; False si ya venció"""
+        delta = deadline_tick - self.current_tick
+        if delta <= 0:
+            return False
+        level = 0
+        while level < self.levels - 1 and delta >= 1 << (self.slot_bits * (level + 1)):
+            level += 1
+        # Más allá del rango del último nivel: se aparca en su ranura y se re-cascadea
+        slot = (deadline_tick >> (self.slot_bits * level)) & self.slot_mask
+        self._wheels[level][slot][key] = deadline_tick
+        return True
+
+    def advance(self, now: float) -> list:
+        """Avanza hasta `now` y devuelve las (key, deadline_tick) vencidas"""
+        target = math.floor(now / self.tick)
+        expired = []
+        while self.current_tick < target:
+            self.current_tick += 1
+            self._cascade()
+            slot = self._wheels[0][self.current_tick & self.slot_mask]
+            if slot:
+                due = [(k, d) for k, d in slot.items() if d <= self.current_tick]
+                for key, deadline in due:
+                    del slot[key]
+                expired.extend(due)
+        return expired
+
+    def _cascade(self) -> None:
+        top = 0
+        while top + 1 < self.levels and not self.current_tick & ((1 << (self.slot_bits * (top + 1))) - 1):
+            top += 1
+        # De arriba hacia abajo, para que lo que baja de nivel se redistribuya en este mismo tick
+        for level in range(top, 0, -1):
+            shift = self.slot_bits * level
+            slot_index = (self.current_tick >> shift) & self.slot_mask
+            entries = self._wheels[level][slot_index]
+            self._wheels[level][slot_index] = {}
+            for key, deadline in entries.items():
+                if not self.schedule(key, deadline):
+                    # Vence justo en este tick: al nivel 0 para el barrido actual
+                    self._wheels[0][self.current_tick & self.slot_mask][key] = deadline
+
+    def __len__(self) -> int:
+        return sum(len(slot) for wheel in self._wheels for slot in wheel)
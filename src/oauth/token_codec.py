@@ -0,0 +1,94 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from functools import lru_cache
+
+# Header HS256 tal como lo serializa PyJWT (sort_keys, separadores compactos)
+_HS256_HEADER = json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":"), sort_keys=True)
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+HS256_HEADER_SEGMENT = _b64url(_HS256_HEADER.encode())
+
+# === CODEC HS256 ===
+class HS256Codec:
+    """Firma JWT HS256 con header pre-codificado y HMAC con la clave ya derivada.
+
+    La salida es byte a byte la misma que jwt.encode(claims, secret, "HS256")
+    para claims con valores JSON nativos, así que se verifica con PyJWT.
+    """
+
+    def __init__(self, secret: str):
+        self._mac = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+    def encode(self, claims: dict) -> str:
+        payload = json.dumps(claims, separators=(",", ":")).encode()
+        signing_input = HS256_HEADER_SEGMENT + b"." + _b64url(payload)
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return (signing_input + b"." + _b64url(mac.digest())).decode()
+
+
+@lru_cache(maxsize=16)
+def get_codec(secret: str) -> HS256Codec:
+    """Un codec (y un objeto HMAC) por secreto"""
+    return HS256Codec(secret)
+
+def now_ts() -> int:
+    """Timestamp único por emisión (segundos, como lo trunca PyJWT)"""
+    return int(time.time())
+
+def new_token_id() -> str:
+    """Identificador aleatorio de 128 bits (jti / familia)"""
+    return os.urandom(16).hex()
+
+# === LAYOUTS FIJOS DE CLAIMS ===
+def encode_authorization_code(secret: str, user_id: str, client_id: str, scopes: list,
+                              ttl: int, now: int = None) -> tuple:
+    """Firma un authorization_code; devuelve (code, claims)"""
+    now = now_ts() if now is None else now
+    claims = {
+        "user_id": user_id,
+        "client_id": client_id,
+        "scopes": scopes,
+        "exp": now + ttl,
+        "iat": now,
+        "type": "authorization_code",
+        "jti": new_token_id(),  # Anti-replay
+        "aud": client_id  # Audience validation
+    }
+    return get_codec(secret).encode(claims), claims
+
+def access_token_claims(user_id: str, scopes: list, client_id: str, ttl: int, now: int = None) -> dict:
+    now = now_ts() if now is None else now
+    return {
+        "sub": user_id,
+        "client_id": client_id,
+        "scopes": scopes,
+        "exp": now + ttl,
+        "iat": now,  # Revocación por sujeto: tokens emitidos antes del corte
+        "type": "access_token",
+        "jti": new_token_id()  # Revocación individual
+    }
+
+def encode_access_token(secret: str, user_id: str, scopes: list, client_id: str,
+                        ttl: int, now: int = None) -> str:
+    return get_codec(secret).encode(access_token_claims(user_id, scopes, client_id, ttl, now))
+
+def encode_refresh_token(secret: str, user_id: str, client_id: str, ttl: int, now: int = None,
+                         scopes: list = (), jti: str = None, family_id: str = None) -> str:
+    now = now_ts() if now is None else now
+    return get_codec(secret).encode({
+        "sub": user_id,
+        "client_id": client_id,
+        "scopes": list(scopes),
+        "exp": now + ttl,
+        "iat": now,
+        "type": "refresh_token",
+        "jti": jti or new_token_id(),  # Rotación / detección de reuso
+        "fam": family_id or new_token_id()
+    })
@@ -0,0 +1,14 @@
+import pytest
+
+class FakeClock:
+    """Reloj controlable para inyectar como `clock=`; los tests avanzan `now` a mano"""
+
+    def __init__(self, now: float = 1_000_020.0):  # múltiplo de 60: inicio de ventana/minuto
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
@@ -0,0 +1,127 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import admission
+from src.oauth.admission import AdmissionController, AdmissionQueue, AdmissionRejected
+from src.oauth.consent import app
+
+TOKEN, CONSENT = 0, 1
+
+async def test_freed_slot_goes_to_token_exchange_first():
+    """Test que un hueco liberado pasa antes al canje de code que a un consent nuevo"""
+    controller = AdmissionController("test", initial_limit=1, min_limit=1)
+    deadline = time.monotonic() + 5
+    await controller.acquire(CONSENT, deadline)
+    order = []
+
+    async def request(priority: int, name: str):
+        await controller.acquire(priority, deadline)
+        order.append(name)
+        controller.release(0.001)
+
+    waiting = [asyncio.create_task(request(CONSENT, "consent")), asyncio.create_task(request(TOKEN, "token"))]
+    await asyncio.sleep(0)
+    controller.release(0.001)
+    await asyncio.gather(*waiting)
+    assert order == ["token", "consent"]
+
+async def test_waiter_rejected_once_it_cannot_meet_its_deadline():
+    """Test que la espera termina con rechazo antes del deadline, no después"""
+    controller = AdmissionController("test", initial_limit=1, min_limit=1)
+    await controller.acquire(TOKEN, time.monotonic() + 5)
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as exc:
+        await controller.acquire(TOKEN, started + 0.05)
+    assert exc.value.reason == "deadline"
+    assert time.monotonic() - started < 0.5
+    assert controller._waiting == 0
+
+async def test_full_queue_evicts_lower_priority():
+    """Test que con la cola llena un canje desplaza a un consent y un consent se rechaza"""
+    controller = AdmissionController("test", initial_limit=1, min_limit=1, queue_size=1)
+    deadline = time.monotonic() + 5
+    await controller.acquire(TOKEN, deadline)
+    consent = asyncio.create_task(controller.acquire(CONSENT, deadline))
+    await asyncio.sleep(0)
+
+    token = asyncio.create_task(controller.acquire(TOKEN, deadline))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as exc:
+        await consent
+    assert exc.value.reason == "evicted"
+    with pytest.raises(AdmissionRejected) as exc:
+        await controller.acquire(CONSENT, deadline)
+    assert exc.value.reason == "queue_full"
+
+    controller.release(0.001)
+    await token
+    assert controller.inflight == 1
+
+def test_limit_backs_off_on_slow_requests_and_grows_when_healthy():
+    """Test del ajuste AIMD: baja ante latencia alta y crece despacio si va bien"""
+    clock = [0.0]
+    controller = AdmissionController("test", initial_limit=20, clock=lambda: clock[0])
+    controller.inflight = 20
+    for _ in range(20):
+        controller.release(0.010)
+        controller.inflight += 1
+    healthy = controller.limit
+    assert 20 < healthy < 21
+
+    clock[0] = 10.0
+    for _ in range(5):
+        controller.release(0.200)  # misma ráfaga: una sola reducción
+        controller.inflight += 1
+    assert controller.limit == pytest.approx(healthy * 0.9)
+
+def test_mixed_fast_and_slow_endpoints_keep_their_limits():
+    """Test que consents lentos (Supabase) no hunden el límite del canje rápido ni el propio"""
+    clock = [0.0]
+    queue = AdmissionQueue()
+    token = AdmissionController("token", initial_limit=32, clock=lambda: clock[0], queue=queue)
+    consent = AdmissionController("consent", initial_limit=32, clock=lambda: clock[0], queue=queue)
+    token.inflight = consent.inflight = 4  # ~8 en curso: tráfico sano
+    for _ in range(500):
+        clock[0] += 0.01
+        token.release(0.002)
+        token.inflight += 1
+        consent.release(0.080)
+        consent.inflight += 1
+    assert token.limit == consent.limit == 32
+
+async def test_shared_queue_prioritizes_token_across_endpoints():
+    """Test que con la cola común llena un canje desplaza a un consent de otro endpoint"""
+    queue = AdmissionQueue(queue_size=1)
+    token = AdmissionController("token", initial_limit=1, min_limit=1, queue=queue)
+    consent = AdmissionController("consent", initial_limit=1, min_limit=1, queue=queue)
+    deadline = time.monotonic() + 5
+    await token.acquire(TOKEN, deadline)
+    await consent.acquire(CONSENT, deadline)
+    waiting_consent = asyncio.create_task(consent.acquire(CONSENT, deadline))
+    await asyncio.sleep(0)
+
+    waiting_token = asyncio.create_task(token.acquire(TOKEN, deadline))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as exc:
+        await waiting_consent
+    assert exc.value.reason == "evicted"
+
+    consent.release(0.001)  # el hueco del consent no es del canje: límites separados
+    await asyncio.sleep(0)
+    assert not waiting_token.done()
+    token.release(0.001)
+    await waiting_token
+    assert (token.inflight, consent.inflight, consent._waiting) == (1, 0, 0)
+
+def test_overloaded_endpoint_returns_503(monkeypatch):
+    """Test que sin hueco ni cola el endpoint responde 503 con Retry-After"""
+    controller = AdmissionController("test", initial_limit=1, min_limit=1, queue_size=0)
+    controller.inflight = 1
+    monkeypatch.setitem(admission.admission_controllers, "/oauth/token", controller)
+
+    response = TestClient(app).post("/oauth/token", params={"client_id": "busy", "code": "x"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert TestClient(app).get("/metrics").status_code == 200  # fuera del control de admisión
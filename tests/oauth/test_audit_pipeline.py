@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+import pytest
+from src.oauth.audit import AuditPipeline, AuditSink
+
+class CollectingSink(AuditSink):
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.batches = []
+
+    async def write_batch(self, entries: list) -> None:
+        if self.fail:
+            raise ConnectionError("sink down")
+        self.batches.append(list(entries))
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / "audit_spill.ndjson")
+
+async def test_entries_flushed_in_batches(spill_path):
+    """Test que las entradas se escriben en lotes de tamaño acotado"""
+    sink = CollectingSink()
+    pipeline = AuditPipeline(batch_size=10, flush_interval=0.05, spill_path=spill_path)
+    await pipeline.start(sink)
+
+    for i in range(25):
+        await pipeline.enqueue({"id": i})
+    await pipeline.stop()
+
+    assert [len(batch) for batch in sink.batches] == [10, 10, 5]
+
+async def test_spill_and_replay_on_restart(spill_path):
+    """Test que si el sink falla nada se pierde: se derrama y se reenvía al reiniciar"""
+    pipeline = AuditPipeline(batch_size=5, flush_interval=0.05, spill_path=spill_path)
+    await pipeline.start(CollectingSink(fail=True))
+    for i in range(3):
+        await pipeline.enqueue({"id": i})
+    await pipeline.stop()
+
+    sink = CollectingSink()
+    restarted = AuditPipeline(batch_size=5, flush_interval=0.05, spill_path=spill_path)
+    await restarted.start(sink)
+    await restarted.stop()
+
+    assert sink.batches == [[{"id": 0}, {"id": 1}, {"id": 2}]]
+
+async def test_partial_replay_keeps_only_unsent_batches(spill_path):
+    """Test que un reenvío cortado a medias no vuelve a enviar los lotes ya escritos"""
+    class FlakySink(CollectingSink):
+        async def write_batch(self, entries: list) -> None:
+            if len(self.batches) == 1 and not self.fail:
+                self.fail = True
+                raise ConnectionError("sink down")
+            self.batches.append(list(entries))
+
+    pipeline = AuditPipeline(batch_size=2, spill_path=spill_path)
+    pipeline._spill([{"id": i} for i in range(5)])
+
+    sink = FlakySink()
+    pipeline.sink = sink
+    assert not await pipeline._replay_spill()
+    assert await pipeline._replay_spill()
+    assert [entry["id"] for batch in sink.batches for entry in batch] == [0, 1, 2, 3, 4]
+
+async def test_workers_sharing_a_spill_file_replay_it_once(spill_path):
+    """Test que dos workers con el mismo archivo de derrame lo reenvían una sola vez"""
+    AuditPipeline(spill_path=spill_path)._spill([{"id": i} for i in range(10)])
+    sinks = [CollectingSink(), CollectingSink()]
+    pipelines = [AuditPipeline(batch_size=5, flush_interval=0.05, spill_path=spill_path) for _ in sinks]
+
+    await asyncio.gather(*(pipeline.start(sink) for pipeline, sink in zip(pipelines, sinks)))
+    await asyncio.gather(*(pipeline.stop() for pipeline in pipelines))
+
+    replayed = [entry["id"] for sink in sinks for batch in sink.batches for entry in batch]
+    assert sorted(replayed) == list(range(10))
+    assert not os.path.exists(spill_path)
+
+async def test_orphaned_claim_is_recovered_on_start(spill_path):
+    """Test que lo reclamado por un worker caído a mitad del reenvío no se pierde"""
+    with open(f"{spill_path}.replay-999999999", "w", encoding="utf-8") as fh:
+        fh.write(json.dumps({"id": 7}) + "\n")
+    sink = CollectingSink()
+    pipeline = AuditPipeline(spill_path=spill_path)
+    await pipeline.start(sink)
+    await pipeline.stop()
+    assert sink.batches == [[{"id": 7}]]
+
+async def test_backpressure_when_queue_full(spill_path):
+    """Test que enqueue espera cuando la cola está llena"""
+    pipeline = AuditPipeline(max_size=1, batch_size=1, flush_interval=0.05, spill_path=spill_path)
+    pipeline._queue = asyncio.Queue(maxsize=1)  # sin worker: nadie consume
+    await pipeline.enqueue({"id": 0})
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(pipeline.enqueue({"id": 1}), timeout=0.05)
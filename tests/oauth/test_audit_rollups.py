@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta, timezone
+import fakeredis.aioredis
+from fastapi.testclient import TestClient
+from src.oauth import admin
+from src.oauth.audit import build_audit_entry
+from src.oauth.audit_rollups import AuditRollups, audit_rollups
+from src.oauth.consent import app
+
+ADMIN_TOKEN = "rollup-admin-token"
+BASE = datetime(2026, 1, 1)
+
+def epoch(moment: datetime) -> float:
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+def make_entry(minute: int, client_id: str = "odoo", status: str = "granted",
+               scopes=("invoices.read",)) -> dict:
+    entry = build_audit_entry("user-1", client_id, list(scopes), status, "oauth_consent", latency_ms=1.0)
+    entry["timestamp"] = (BASE + timedelta(minutes=minute)).isoformat()
+    return entry
+
+async def test_counts_by_dimension_across_resolutions():
+    """Test que un rango mixto (días, horas, minutos) suma cada evento una sola vez"""
+    rollups = AuditRollups(clock=lambda: epoch(BASE + timedelta(days=2, hours=1)))
+    minutes = range(0, 2 * 24 * 60 + 60, 7)
+    for minute in minutes:
+        rollups.record(make_entry(minute, status="granted" if minute % 2 else "denied"))
+    rollups.record(make_entry(90, client_id="n8n", scopes=("invoices.read", "customers.read")))
+    await rollups.flush()
+
+    start, end = BASE + timedelta(hours=1), BASE + timedelta(days=2, minutes=30)
+    in_range = [m for m in minutes if 60 <= m < 2 * 24 * 60 + 30]
+    rows = await rollups.query(epoch(start), epoch(end), group_by=("client_id",))
+    assert rows == [{"client_id": "n8n", "count": 2}, {"client_id": "odoo", "count": len(in_range)}]
+
+    plan = rollups.plan(epoch(start), epoch(end))
+    assert ("day", epoch(BASE + timedelta(days=1))) in plan
+    assert len(plan) == 23 + 1 + 30  # horas del primer día, un día, minutos del borde final
+
+    denied = await rollups.query(epoch(start), epoch(end), group_by=("scope",), client_id="odoo",
+                                 status="denied")
+    assert denied == [{"scope": "invoices.read", "count": sum(1 for m in in_range if m % 2 == 0)}]
+
+async def test_expired_resolution_is_read_from_coarser_bucket():
+    """Test que tras la retención por minuto el borde se lee del bucket por hora"""
+    now = [epoch(BASE)]
+    rollups = AuditRollups(clock=lambda: now[0])
+    rollups.record(make_entry(5))
+    rollups.record(make_entry(50))
+    await rollups.flush()
+
+    start, end = epoch(BASE + timedelta(minutes=40)), epoch(BASE + timedelta(minutes=55))
+    assert [row["count"] for row in await rollups.query(start, end)] == [1]
+
+    now[0] = epoch(BASE + timedelta(days=2))
+    await rollups.flush()
+    assert rollups.plan(start, end) == [("hour", epoch(BASE))]
+    assert [row["count"] for row in await rollups.query(start, end)] == [2]
+
+async def test_flush_to_redis_and_pending_counts():
+    """Test que los conteos se suman en Redis entre workers y lo pendiente también cuenta"""
+    client = fakeredis.aioredis.FakeRedis()
+    clock = lambda: epoch(BASE + timedelta(hours=1))
+    first, second = AuditRollups(clock=clock), AuditRollups(clock=clock)
+    first.client = second.client = client
+    first.record(make_entry(1))
+    second.record(make_entry(2))
+    await first.flush()
+    await second.flush()
+    second.record(make_entry(3))
+
+    rows = await second.query(epoch(BASE), epoch(BASE + timedelta(hours=1)), group_by=("status",))
+    assert rows == [{"status": "granted", "count": 3}]
+    assert 0 < await client.ttl(f"rollup:hour:{int(epoch(BASE))}") <= 15 * 86400
+
+async def test_pending_counters_are_bounded_without_flush():
+    """Test que sin volcado los contadores pendientes no crecen sin límite"""
+    rollups = AuditRollups(max_pending=6)
+    rollups.record(make_entry(1, client_id="odoo"))
+    rollups.record(make_entry(1, client_id="n8n"))
+    rollups.record(make_entry(1, client_id="zapier"))  # tres resoluciones por campo: ya no cabe
+    rollups.record(make_entry(2, client_id="odoo"))  # campos existentes siguen sumando
+    assert rollups._pending_count == 6
+    assert not rollups.running
+
+    await rollups.flush()
+    rows = await rollups.query(epoch(BASE), epoch(BASE + timedelta(hours=1)), group_by=("client_id",))
+    assert rows == [{"client_id": "n8n", "count": 1}, {"client_id": "odoo", "count": 2}]
+    assert rollups._pending_count == 0
+
+def test_rollups_endpoint_requires_admin(monkeypatch):
+    """Test del endpoint: token de admin y consulta desde los rollups"""
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", ADMIN_TOKEN)
+    monkeypatch.setattr(audit_rollups, "_pending", {})
+    monkeypatch.setattr(audit_rollups, "_local", {})
+    audit_rollups.record(make_entry(10, client_id="odoo"))
+    client = TestClient(app)
+    params = {"start": BASE.isoformat(), "end": (BASE + timedelta(hours=1)).isoformat(), "group_by": "client_id"}
+
+    assert client.get("/audit/rollups", params=params).status_code == 401
+    response = client.get("/audit/rollups", params=params, headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+    assert response.status_code == 200
+    assert response.json()["rows"] == [{"client_id": "odoo", "count": 1}]
+
+    params["group_by"] = "user"
+    response = client.get("/audit/rollups", params=params, headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+    assert response.status_code == 400
+
+def test_rollups_endpoint_honours_utc_offsets(monkeypatch):
+    """Test que un rango con offset (hora de Chile) se lee en UTC y no como hora UTC"""
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", ADMIN_TOKEN)
+    monkeypatch.setattr(audit_rollups, "_pending", {})
+    monkeypatch.setattr(audit_rollups, "_local", {})
+    # Reciente: dentro de la retención por minuto
+    moment = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=20)
+    entry = make_entry(0)
+    entry["timestamp"] = moment.isoformat()
+    audit_rollups.record(entry)
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+    chile = timezone(timedelta(hours=-3))
+    local = moment.replace(tzinfo=timezone.utc).astimezone(chile)
+    offset = {"start": (local - timedelta(minutes=5)).isoformat(), "end": (local + timedelta(minutes=5)).isoformat()}
+    assert client.get("/audit/rollups", params=offset, headers=headers).json()["rows"][0]["count"] == 1
+    # Misma hora de reloj sin offset: es UTC, tres horas antes del evento
+    naive = {key: value[:-len("-03:00")] for key, value in offset.items()}
+    assert client.get("/audit/rollups", params=naive, headers=headers).json()["rows"] == []
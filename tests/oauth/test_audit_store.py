@@ -0,0 +1,99 @@
+import json
+import os
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import admin
+from src.oauth.audit import build_audit_entry
+from src.oauth.audit_store import AuditStore, decode_record, encode_record, timestamp_us
+from src.oauth.consent import app
+
+ADMIN_TOKEN = "audit-admin-token"
+BASE = datetime(2026, 1, 1)
+
+def make_entries(n: int, start: int = 0) -> list:
+    entries = []
+    for i in range(start, start + n):
+        entry = build_audit_entry(f"user-{i}", "odoo" if i % 2 else "n8n", ["invoices.read"],
+                                  "granted" if i % 3 else "denied", "oauth_consent", latency_ms=1.5)
+        entry["timestamp"] = (BASE + timedelta(minutes=i)).isoformat()
+        entries.append(entry)
+    return entries
+
+@pytest.fixture
+def store(tmp_path):
+    store = AuditStore(str(tmp_path), segment_bytes=4096, index_every=8)
+    store.open()
+    yield store
+    store.close()
+
+def test_record_roundtrip():
+    """Test que el layout fijo conserva la entrada completa"""
+    [entry] = make_entries(1)
+    entry["error_code"] = None
+    assert decode_record(encode_record(entry), 0) == entry
+
+def test_timestamps_with_offset_are_normalized_to_utc():
+    """Test que un start/end con offset se convierte a UTC en vez de perder el offset"""
+    assert timestamp_us("2026-10-17T10:00:00-03:00") == timestamp_us("2026-10-17T13:00:00")
+    assert timestamp_us("2026-10-17T13:00:00+00:00") == timestamp_us("2026-10-17T13:00:00")
+
+def test_range_query_across_rotated_segments(store):
+    """Test que una consulta por cliente y rango cruza segmentos rotados"""
+    entries = make_entries(200)
+    for i in range(0, 200, 25):
+        store.append_batch(entries[i:i + 25])
+    assert len(list(store.directory.glob("stream-*/*.seg"))) > 1
+
+    start, end = timestamp_us(entries[40]["timestamp"]), timestamp_us(entries[120]["timestamp"])
+    found = [entry for _, entry in store.query(client_id="odoo", start_us=start, end_us=end)]
+
+    expected = [e for e in entries[40:120] if e["client_id"] == "odoo"]
+    assert found == expected
+
+def test_streams_merge_and_truncated_tail(tmp_path):
+    """Test que dos escritores usan streams distintos y una cola truncada se ignora"""
+    first, second = AuditStore(str(tmp_path)), AuditStore(str(tmp_path))
+    first.open()
+    second.open()
+    entries = make_entries(10)
+    first.append_batch(entries[0::2])
+    second.append_batch(entries[1::2])
+    os.write(second._data_fd, b"\x40\x00\x00\x00partial")  # caída a mitad de registro
+    first.close()
+    second.close()
+
+    assert first._stream != second._stream
+    assert [entry for _, entry in first.query()] == entries
+
+def test_export_paginates_with_cursor(store, monkeypatch):
+    """Test que el export NDJSON pagina con cursor sin repetir ni perder entradas"""
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", ADMIN_TOKEN)
+    entries = make_entries(30)
+    store.append_batch(entries)
+    app.state.audit_store = store
+    client = TestClient(app)
+
+    exported, cursor = [], None
+    try:
+        while True:
+            params = {"client_id": "n8n", "limit": 4, **({"cursor": cursor} if cursor else {})}
+            response = client.get("/audit/export", params=params,
+                                  headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+            assert response.status_code == 200
+            *lines, trailer = [json.loads(line) for line in response.text.splitlines()]
+            exported.extend(lines)
+            cursor = trailer["next_cursor"]
+            if cursor is None:
+                break
+    finally:
+        del app.state.audit_store
+
+    assert exported == [e for e in entries if e["client_id"] == "n8n"]
+
+def test_export_checks_credentials_before_store(monkeypatch):
+    """Test que sin credencial la respuesta no depende de si hay almacén configurado"""
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", ADMIN_TOKEN)
+    client = TestClient(app)
+    assert client.get("/audit/export").status_code == 401
+    assert client.get("/audit/export", headers={"Authorization": f"Bearer {ADMIN_TOKEN}"}).status_code == 404
@@ -0,0 +1,58 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import admin, bulk
+from src.oauth.code_store import MemoryCodeStore, get_code_store
+from src.oauth.consent import app
+from src.oauth.introspect import introspect_token
+from src.oauth.scopes import scope_registry
+
+ADMIN_TOKEN = "provisioning-admin-token"
+
+@pytest.fixture
+def store():
+    return MemoryCodeStore()
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", ADMIN_TOKEN)
+    monkeypatch.setattr(bulk, "BULK_CHUNK_SIZE", 4)
+    app.dependency_overrides[get_code_store] = lambda: store
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def items(n: int) -> list:
+    return [{"user_id": f"sa-{i}", "client_id": "n8n", "scopes": ["invoices.read"]} for i in range(n)]
+
+def test_bulk_issues_streamed_pairs(client, store):
+    """Test que se emiten N pares válidos, en orden, con su familia registrada"""
+    response = client.post("/oauth/token/bulk", json={"items": items(10)},
+                           headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == list(range(10))
+    assert [line["user_id"] for line in lines] == [f"sa-{i}" for i in range(10)]
+    assert all(introspect_token(line["access_token"])["active"] for line in lines)
+    assert len(store) == 10  # una familia de refresh por par
+
+def test_bulk_requires_admin_token(client):
+    """Test que sin credencial de provisioning no se emite nada"""
+    response = client.post("/oauth/token/bulk", json={"items": items(1)},
+                           headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401
+
+def test_bulk_rejects_unknown_scopes(client):
+    """Test que scopes no registrados invalidan el lote completo"""
+    payload = {"items": [{"user_id": "sa", "client_id": "n8n", "scopes": ["admin.write"]}]}
+    response = client.post("/oauth/token/bulk", json=payload,
+                           headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+    assert response.status_code == 400
+
+def test_bulk_scope_check_ignores_interned_grants(client):
+    """Test que un scope internado por un consent no pasa a ser válido para bulk"""
+    scope_registry.grants(["accounting.read"])
+    payload = {"items": [{"user_id": "sa", "client_id": "n8n", "scopes": ["accounting.read"]}]}
+    response = client.post("/oauth/token/bulk", json=payload,
+                           headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+    assert response.status_code == 400
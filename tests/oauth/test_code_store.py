@@ -0,0 +1,103 @@
+import asyncio
+import time
+import pytest
+import fakeredis.aioredis
+from fastapi import HTTPException
+from src.oauth.code_store import CodeState, MemoryCodeStore, RedisCodeStore, RotationResult, jti_bucket
+from src.oauth.jwt_handler import (
+    generate_authorization_code_async,
+    verify_authorization_code_async,
+)
+
+@pytest.fixture(params=["redis", "memory"])
+def store(request):
+    if request.param == "memory":
+        return MemoryCodeStore()
+    return RedisCodeStore(fakeredis.aioredis.FakeRedis())
+
+@pytest.fixture
+def redis_store():
+    return RedisCodeStore(fakeredis.aioredis.FakeRedis())
+
+JTI = "0123456789abcdef0123456789abcdef"
+
+async def test_redeem_only_once(store):
+    """Test que un jti emitido solo se puede canjear una vez"""
+    exp = time.time() + 120
+    await store.issue("abc", 120, exp=exp)
+
+    assert await store.redeem("abc", exp) is CodeState.ISSUED
+    assert await store.redeem("abc", exp) is CodeState.REDEEMED
+
+async def test_redeem_unknown_jti(store):
+    """Test que un jti nunca emitido (o expirado) no se puede canjear"""
+    assert await store.redeem("never-issued", time.time() + 120) is CodeState.EXPIRED
+
+async def test_redeemed_outlives_code_in_minute_bucket(redis_store):
+    """Test que los jti se guardan en binario en el set del minuto de su exp y sobreviven al code"""
+    exp = time.time() + 120
+    bucket = jti_bucket(exp)
+    await redis_store.issue(JTI, 120, exp=exp)
+    await redis_store.issue("f" * 32, 120, exp=exp)
+    assert await redis_store.client.smembers(f"jti:i:{bucket}") == {bytes.fromhex(JTI), bytes.fromhex("f" * 32)}
+
+    assert await redis_store.redeem(JTI, exp) is CodeState.ISSUED
+    assert await redis_store.client.smembers(f"jti:r:{bucket}") == {bytes.fromhex(JTI)}
+    for key in (f"jti:i:{bucket}", f"jti:r:{bucket}"):
+        assert exp - time.time() <= await redis_store.client.ttl(key) <= 120 + 60 + 30
+
+async def test_legacy_per_code_keys_still_redeem_once(redis_store):
+    """Test que un code emitido con clave propia (antes de los buckets) se canjea una sola vez"""
+    await redis_store.client.set(f"used_jti:{JTI}", "issued", ex=120)
+    exp = time.time() + 120
+
+    assert await redis_store.redeem(JTI, exp) is CodeState.ISSUED
+    assert await redis_store.redeem(JTI, exp) is CodeState.REDEEMED
+
+async def test_memory_store_expires_with_timing_wheel(clock):
+    """Test que el backend en memoria expira los jti al cumplirse su TTL"""
+    store = MemoryCodeStore(clock=clock)
+    await store.issue("short", 120)
+    await store.issue("long", 3600)
+    await store.redeem("long", None)  # en memoria el exp no se usa: expira por TTL
+
+    clock.now += 119
+    assert await store.redeem("short", None) is CodeState.ISSUED
+
+    clock.now += 2
+    assert await store.redeem("short", None) is CodeState.EXPIRED
+    assert await store.redeem("long", None) is CodeState.REDEEMED
+
+    clock.now += 3600
+    assert await store.redeem("long", None) is CodeState.EXPIRED
+    assert len(store) == 0
+
+async def test_concurrent_redemption_single_winner(store):
+    """Test que bajo canjes paralelos solo uno gana"""
+    exp = time.time() + 120
+    await store.issue(JTI, 120, exp=exp)
+    results = await asyncio.gather(*(store.redeem(JTI, exp) for _ in range(20)))
+
+    assert results.count(CodeState.ISSUED) == 1
+    assert results.count(CodeState.REDEEMED) == 19
+
+async def test_async_code_roundtrip(store):
+    """Test que el flujo async genera, verifica y bloquea el replay"""
+    code = await generate_authorization_code_async("user", "client", ["invoices.read"], store)
+    payload = await verify_authorization_code_async(code, "client", store)
+
+    assert payload["user_id"] == "user"
+    assert payload["scopes"] == ["invoices.read"]
+
+    with pytest.raises(HTTPException) as exc:
+        await verify_authorization_code_async(code, "client", store)
+    assert exc.value.detail == "Code already used"
+
+async def test_family_rotation_and_reuse(store):
+    """Test que la familia rota una vez por jti y se revoca ante un reuso"""
+    await store.start_family("fam", "jti-1", 3600)
+
+    assert await store.rotate_family("fam", "jti-1", "jti-2", 3600) is RotationResult.ROTATED
+    assert await store.rotate_family("fam", "jti-1", "jti-x", 3600) is RotationResult.REUSED
+    assert await store.rotate_family("fam", "jti-2", "jti-3", 3600) is RotationResult.REVOKED
+    assert await store.rotate_family("unknown", "jti-1", "jti-2", 3600) is RotationResult.EXPIRED
@@ -0,0 +1,143 @@
+import asyncio
+from collections import OrderedDict
+import fakeredis.aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from fastapi.testclient import TestClient
+from src.oauth import admin, consent
+from src.oauth.code_store import MemoryCodeStore, get_code_store
+from src.oauth.consent import app
+from src.oauth.consent_grants import ConsentGrantStore
+from src.oauth.revocation import RevocationList
+from src.oauth.session import get_session_validator
+
+async def test_grant_covers_subsets_until_it_expires(clock):
+    """Test que un grant cubre subconjuntos de sus scopes mientras está vigente"""
+    grants = ConsentGrantStore(ttl=60, clock=clock)
+    await grants.put("user", "odoo", ("invoices.read", "payments.read"))
+
+    assert await grants.covers("user", "odoo", ("payments.read",))
+    assert not await grants.covers("user", "odoo", ("partners.read",))
+    assert not await grants.covers("user", "n8n", ("payments.read",))
+    clock.now += 61
+    assert not await grants.covers("user", "odoo", ("payments.read",))
+
+async def test_subject_revocation_voids_earlier_grants(monkeypatch, clock):
+    """Test que revocar al sujeto anula los grants previos pero no los posteriores"""
+    revocations = RevocationList(clock=clock)
+    monkeypatch.setattr("src.oauth.consent_grants.revocation_list", revocations)
+    grants = ConsentGrantStore(clock=clock)
+    await grants.put("user", "odoo", ("invoices.read",))
+
+    clock.now += 1
+    await revocations.revoke_subject("user")
+    assert not await grants.covers("user", "odoo", ("invoices.read",))
+
+    clock.now += 1
+    await grants.put("user", "odoo", ("invoices.read",))
+    assert await grants.covers("user", "odoo", ("invoices.read",))
+
+async def test_grants_are_shared_and_invalidated_through_redis():
+    """Test que otro worker lee el grant desde Redis y la invalidación lo borra"""
+    client = fakeredis.aioredis.FakeRedis()
+    first, second = ConsentGrantStore(), ConsentGrantStore()
+    await first.start(client)
+    await second.start(client)
+    await first.put("user", "odoo", ("invoices.read",))
+    await first.put("user", "n8n", ("payments.read",))
+
+    assert await second.covers("user", "odoo", ("invoices.read",))
+    await first.invalidate("user", "n8n")
+    assert not await second.covers("user", "n8n", ("payments.read",))
+    await first.invalidate("user")
+    assert await client.exists("consent:user") == 0
+
+async def test_invalidate_degrades_when_redis_fails():
+    """Test que invalidar con Redis caído no propaga el error y olvida la copia local"""
+    class DownRedis:
+        async def hdel(self, *args):
+            raise RedisConnectionError("down")
+
+    grants = ConsentGrantStore()
+    await grants.put("user", "odoo", ("invoices.read",))
+    grants.client = DownRedis()
+    await grants.invalidate("user", "odoo")
+    assert ("user", "odoo") not in grants._entries
+
+def test_reconsent_skips_allowed_scopes_lookup(monkeypatch):
+    """Test que un re-consent cubierto no consulta los scopes permitidos hasta invalidarlo"""
+    class FakeValidator:
+        async def validate(self, access_token: str) -> dict:
+            return {"id": "user-grant"}
+
+    lookups = []
+
+    async def fake_allowed_scopes(user_id: str, client_id: str) -> list:
+        lookups.append((user_id, client_id))
+        return ["invoices.read", "payments.read"]
+
+    monkeypatch.setattr(consent, "get_allowed_scopes", fake_allowed_scopes)
+    monkeypatch.setattr(consent.consent_grants, "_entries", OrderedDict())
+    consent.allowed_scopes_cache.invalidate("user-grant")
+    store = MemoryCodeStore()
+    app.dependency_overrides[get_code_store] = lambda: store
+    app.dependency_overrides[get_session_validator] = lambda: FakeValidator()
+    client = TestClient(app)
+    params = {"client_id": "grant-client", "redirect_uri": "https://app.test/cb", "scope": "invoices.read"}
+
+    def consent_status(**overrides) -> int:
+        response = client.get("/oauth/consent", params={**params, **overrides},
+                              headers={"Authorization": "Bearer session"}, follow_redirects=False)
+        return response.status_code
+
+    try:
+        assert consent_status() == 307
+        consent.allowed_scopes_cache.invalidate("user-grant")
+        assert consent_status() == 307
+        assert lookups == [("user-grant", "grant-client")]
+
+        # Scopes fuera del grant: vuelve al chequeo completo
+        assert consent_status(scope="invoices.read payments.read") == 307
+        assert len(lookups) == 2
+
+        # Cambio de grants: la siguiente petición vuelve a consultar
+        asyncio.run(consent.invalidate_grants("user-grant", "grant-client"))
+        assert consent_status() == 307
+        assert len(lookups) == 3
+    finally:
+        app.dependency_overrides.clear()
+
+def test_invalidate_endpoint_drops_cached_grants(monkeypatch):
+    """Test que el aviso de cambio de grants olvida scopes cacheados y consentimientos"""
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", "grants-admin-token")
+    monkeypatch.setattr(consent.consent_grants, "_entries", OrderedDict())
+    asyncio.run(consent.consent_grants.put("user-changed", "odoo", ("invoices.read",)))
+    consent.allowed_scopes_cache.put("user-changed", "odoo", consent.scope_registry.grants(["invoices.read"]))
+    client = TestClient(app)
+
+    assert client.post("/oauth/grants/invalidate", json={"user_id": "user-changed"}).status_code == 401
+    response = client.post("/oauth/grants/invalidate", json={"user_id": "user-changed"},
+                           headers={"Authorization": "Bearer grants-admin-token"})
+    assert response.status_code == 200
+    assert consent.allowed_scopes_cache.get("user-changed", "odoo") is None
+    assert not asyncio.run(consent.consent_grants.covers("user-changed", "odoo", ("invoices.read",)))
+
+def test_first_consent_for_granted_scope_outside_catalogue(monkeypatch):
+    """Test que un scope concedido en Supabase pero fuera de MCP_KNOWN_SCOPES pasa al primer intento"""
+    class FakeValidator:
+        async def validate(self, access_token: str) -> dict:
+            return {"id": "user-ledger"}
+
+    async def fake_allowed_scopes(user_id: str, client_id: str) -> list:
+        return ["ledger.export"]
+
+    monkeypatch.setattr(consent, "get_allowed_scopes", fake_allowed_scopes)
+    consent.allowed_scopes_cache.invalidate("user-ledger")
+    app.dependency_overrides[get_code_store] = lambda: MemoryCodeStore()
+    app.dependency_overrides[get_session_validator] = lambda: FakeValidator()
+    params = {"client_id": "ledger-client", "redirect_uri": "https://app.test/cb", "scope": "ledger.export"}
+    try:
+        response = TestClient(app).get("/oauth/consent", params=params,
+                                       headers={"Authorization": "Bearer session"}, follow_redirects=False)
+        assert response.status_code == 307
+    finally:
+        app.dependency_overrides.clear()
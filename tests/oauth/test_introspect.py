@@ -0,0 +1,81 @@
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import introspect
+from src.oauth.consent import app
+from src.oauth.introspect import introspect_token, verified_token_cache
+from src.oauth.token import generate_access_token, generate_refresh_token
+from src.oauth.token_codec import now_ts
+
+INTROSPECTION_TOKEN = "introspection-token"
+
+@pytest.fixture
+def client(monkeypatch):
+    # Sin lifespan: la introspección no usa Redis ni Supabase
+    monkeypatch.setattr(introspect, "MCP_INTROSPECTION_TOKEN", INTROSPECTION_TOKEN)
+    return TestClient(app, headers={"Authorization": f"Bearer {INTROSPECTION_TOKEN}"})
+
+def test_active_access_token():
+    """Test que un access_token válido es activo y expone sus claims"""
+    token = generate_access_token("user", ["invoices.read", "payments.read"], "client")
+    result = introspect_token(token)
+
+    assert result["active"] is True
+    assert result["sub"] == "user"
+    assert result["client_id"] == "client"
+    assert result["scope"] == "invoices.read payments.read"
+    assert result["token_type"] == "access_token"
+
+def test_inactive_tokens():
+    """Test que tokens expirados, manipulados o basura no son activos"""
+    expired = generate_access_token("user", ["read"], "client", now=now_ts() - 7200)
+    tampered = generate_access_token("user", ["read"], "client")[:-2] + "xx"
+
+    assert introspect_token(expired) == {"active": False}
+    assert introspect_token(tampered) == {"active": False}
+    assert introspect_token("not-a-jwt") == {"active": False}
+
+def test_verified_signature_is_cached():
+    """Test que una firma verificada queda en la cache acotada"""
+    token = generate_refresh_token("user", "client")
+    before = len(verified_token_cache)
+
+    assert introspect_token(token, "refresh_token")["active"] is True
+    assert len(verified_token_cache) == before + 1
+    assert verified_token_cache.get(token)["type"] == "refresh_token"
+
+def test_wrong_hint_falls_back_to_other_token_types(client):
+    """Test que un refresh token con token_type_hint=access_token sigue siendo activo"""
+    token = generate_refresh_token("user", "client")
+    response = client.post("/oauth/introspect", data={"token": token, "token_type_hint": "access_token"})
+
+    assert response.json()["active"] is True
+    assert response.json()["token_type"] == "refresh_token"
+
+def test_form_encoded_single_token(client):
+    """Test del formato RFC 7662 (form-urlencoded)"""
+    token = generate_access_token("user", ["read"], "client")
+    response = client.post("/oauth/introspect", data={"token": token})
+
+    assert response.status_code == 200
+    assert response.json()["active"] is True
+
+def test_batch_introspection(client):
+    """Test que un lote devuelve un resultado por token, en orden"""
+    tokens = [generate_access_token(f"user-{i}", ["read"], "client") for i in range(3)]
+    response = client.post("/oauth/introspect", json={"tokens": tokens + ["garbage"]})
+
+    results = response.json()["results"]
+    assert [r["active"] for r in results] == [True, True, True, False]
+    assert [r.get("sub") for r in results[:3]] == ["user-0", "user-1", "user-2"]
+
+def test_caller_must_be_authorized(monkeypatch):
+    """Test que la introspección exige el token del resource server y sin configurar queda cerrada"""
+    token = generate_access_token("user", ["read"], "client")
+    monkeypatch.setattr(introspect, "MCP_INTROSPECTION_TOKEN", INTROSPECTION_TOKEN)
+    assert TestClient(app).post("/oauth/introspect", data={"token": token}).status_code == 401
+
+    monkeypatch.setattr(introspect, "MCP_INTROSPECTION_TOKEN", None)
+    response = TestClient(app).post("/oauth/introspect", data={"token": token},
+                                    headers={"Authorization": "Bearer anything"})
+    assert response.status_code == 403
+    assert "sub" not in response.json()
@@ -0,0 +1,45 @@
+import asyncio
+from fastapi.testclient import TestClient
+from src.oauth.audit import build_audit_entry
+from src.oauth.code_store import MemoryCodeStore, get_code_store
+from src.oauth.consent import app
+from src.oauth.jwt_handler import generate_authorization_code_async
+from src.oauth.metrics import Histogram, request_duration, stage_duration
+
+def test_histogram_renders_cumulative_buckets():
+    """Test que el histograma expone buckets acumulados, suma y total"""
+    histogram = Histogram("test_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "sign")
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="sign",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="sign",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="sign",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="sign"} 3' in lines
+
+def test_token_exchange_records_stages_and_latency():
+    """Test que el exchange mide cada etapa y la ruta end-to-end"""
+    store = MemoryCodeStore()
+    app.dependency_overrides[get_code_store] = lambda: store
+    try:
+        code = asyncio.run(generate_authorization_code_async("user", "client", ["invoices.read"], store))
+        before = {name: stage_duration.count("token_exchange", name) for name in ("decode", "sign", "code_store")}
+        requests_before = request_duration.count("/oauth/token", "200")
+
+        client = TestClient(app)
+        assert client.post("/oauth/token", params={"client_id": "client", "code": code}).status_code == 200
+    finally:
+        app.dependency_overrides.clear()
+
+    for name, count in before.items():
+        assert stage_duration.count("token_exchange", name) > count
+    assert request_duration.count("/oauth/token", "200") == requests_before + 1
+
+    body = client.get("/metrics").text
+    assert 'mcp_stage_duration_seconds_count{endpoint="token_exchange",stage="sign"}' in body
+
+def test_audit_entry_latency_outside_request():
+    """Test que fuera de un request la latencia explícita se respeta"""
+    entry = build_audit_entry("user", "client", ["read"], "granted", "token_exchange", latency_ms=12.5)
+    assert entry["latency_ms"] == 12.5
@@ -0,0 +1,64 @@
+import fakeredis.aioredis
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from src.oauth import rate_limit
+from src.oauth.code_store import MemoryCodeStore, get_code_store
+from src.oauth.consent import app
+from src.oauth.rate_limit import RateLimiter
+
+def test_throttles_with_retry_headers(clock):
+    """Test que al exceder el límite se responde 429 con Retry-After"""
+    limiter = RateLimiter(window=60, client_limit=3, clock=clock)
+    for _ in range(3):
+        limiter.check_client("n8n")
+    with pytest.raises(HTTPException) as exc:
+        limiter.check_client("n8n")
+
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) >= 1
+    assert exc.value.headers["RateLimit-Remaining"] == "0"
+    limiter.check_client("odoo")  # otras claves no se ven afectadas
+
+def test_previous_window_weight_decays(clock):
+    """Test que la ventana anterior pesa cada vez menos"""
+    clock.now = 600.0
+    limiter = RateLimiter(window=60, clock=clock)
+    for _ in range(10):
+        assert limiter.hit("k", 10).allowed
+    clock.now = 660.0 + 6  # 10% de la nueva ventana: la anterior pesa 9
+    assert limiter.hit("k", 10).allowed
+    assert not limiter.hit("k", 10).allowed
+    clock.now = 660.0 + 30  # a mitad de ventana: pesa 5
+    assert limiter.hit("k", 10).allowed
+
+async def test_workers_share_counts_through_redis(clock):
+    """Test que dos workers ven los hits del otro tras sincronizar en lote"""
+    redis_client = fakeredis.aioredis.FakeRedis()
+    workers = [RateLimiter(window=60, client_limit=4, clock=clock) for _ in range(2)]
+    for worker in workers:
+        worker.client = redis_client
+
+    for worker in workers:
+        worker.check_client("n8n")
+        worker.check_client("n8n")
+    for worker in workers:
+        await worker.sync()
+    await workers[0].sync()  # trae los totales que subió el segundo
+
+    for worker in workers:
+        with pytest.raises(HTTPException):
+            worker.check_client("n8n")
+    assert int(await redis_client.get("rl:client:n8n:16667")) == 4
+
+def test_token_endpoint_is_rate_limited(monkeypatch):
+    """Test que /oauth/token aplica el límite por client_id antes de verificar el code"""
+    monkeypatch.setattr(rate_limit.rate_limiter, "client_limit", 0)
+    app.dependency_overrides[get_code_store] = lambda: MemoryCodeStore()
+    try:
+        response = TestClient(app).post("/oauth/token", params={"client_id": "noisy", "code": "x"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 429
+    assert "retry-after" in response.headers
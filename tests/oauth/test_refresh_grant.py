@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth.code_store import MemoryCodeStore, get_code_store
+from src.oauth.consent import app
+from src.oauth.jwt_handler import generate_authorization_code_async
+
+CLIENT_ID = "n8n-client"
+
+@pytest.fixture
+def store():
+    return MemoryCodeStore()
+
+@pytest.fixture
+def client(store):
+    app.dependency_overrides[get_code_store] = lambda: store
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def exchange_code(client, store) -> dict:
+    code = asyncio.run(generate_authorization_code_async("user", CLIENT_ID, ["invoices.read"], store))
+    response = client.post("/oauth/token", params={"code": code, "client_id": CLIENT_ID})
+    assert response.status_code == 200
+    return response.json()
+
+def refresh(client, refresh_token: str, client_id: str = CLIENT_ID):
+    return client.post("/oauth/token", params={
+        "grant_type": "refresh_token", "refresh_token": refresh_token, "client_id": client_id
+    })
+
+def test_refresh_rotates_token(client, store):
+    """Test que el grant refresh_token emite un par nuevo con los mismos scopes"""
+    tokens = exchange_code(client, store)
+    response = refresh(client, tokens["refresh_token"])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["scope"] == "invoices.read"
+    assert body["refresh_token"] != tokens["refresh_token"]
+    assert refresh(client, body["refresh_token"]).status_code == 200
+
+def test_reuse_revokes_family(client, store):
+    """Test que reusar un refresh token rotado revoca toda la familia"""
+    tokens = exchange_code(client, store)
+    rotated = refresh(client, tokens["refresh_token"]).json()
+
+    reused = refresh(client, tokens["refresh_token"])
+    assert reused.status_code == 400
+    assert reused.json()["detail"] == "Refresh token reuse detected"
+
+    # El token legítimo más reciente también queda invalidado
+    assert refresh(client, rotated["refresh_token"]).status_code == 400
+
+def test_refresh_rejects_other_client(client, store):
+    """Test que un refresh token no sirve para otro client_id"""
+    tokens = exchange_code(client, store)
+    assert refresh(client, tokens["refresh_token"], client_id="other-client").status_code == 400
@@ -0,0 +1,75 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from src.oauth.resilience import CircuitBreaker, ResilientCaller, UpstreamUnavailable, circuit_state
+from src.oauth.session import SessionValidator
+
+def test_breaker_opens_probes_and_closes(clock):
+    """Test closed → open tras N fallos, half_open con una sola prueba, y cierre"""
+    breaker = CircuitBreaker("test_upstream", failure_threshold=3, reset_seconds=10, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert circuit_state.value("test_upstream") == 2
+    assert not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow()  # prueba
+    assert not breaker.allow()  # solo una en vuelo
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert circuit_state.value("test_upstream") == 0
+
+async def test_slow_upstream_fails_fast_with_503():
+    """Test que un Supabase lento corta en el deadline y luego abre el circuito"""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"id": "user-1"})
+
+    caller = ResilientCaller("slow_supabase", timeout=0.05,
+                             breaker=CircuitBreaker("slow_supabase", failure_threshold=2))
+    validator = SessionValidator(httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+                                 "https://supabase.test", "anon", caller=caller)
+
+    for token in ("a", "b", "c"):
+        with pytest.raises(HTTPException) as exc:
+            await validator.validate(token)
+        assert exc.value.status_code == 503
+    assert len(calls) == 2  # la tercera se rechaza sin tocar la red
+
+async def test_hedge_returns_first_response():
+    """Test que tras el p95 se lanza una segunda llamada y gana la más rápida"""
+    caller = ResilientCaller("hedged", timeout=1.0, hedge=True, hedge_min_delay=0.01)
+    for _ in range(50):
+        caller.latencies.add(0.01)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        await asyncio.sleep(0.5 if len(attempts) == 1 else 0)
+        return httpx.Response(200, json={"attempt": len(attempts)})
+
+    response = await caller.call(fn)
+    assert response.json() == {"attempt": 2}
+    assert len(attempts) == 2
+
+async def test_server_errors_count_as_failures():
+    """Test que un 5xx es fallo del upstream y un 4xx no"""
+    caller = ResilientCaller("flaky", breaker=CircuitBreaker("flaky", failure_threshold=1))
+
+    async def unauthorized():
+        return httpx.Response(401)
+
+    async def unavailable():
+        return httpx.Response(503)
+
+    assert (await caller.call(unauthorized)).status_code == 401
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(UpstreamUnavailable):
+        await caller.call(unavailable)
+    assert caller.breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,66 @@
+import asyncio
+import fakeredis.aioredis
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import introspect
+from src.oauth.code_store import MemoryCodeStore, get_code_store
+from src.oauth.consent import app
+from src.oauth.revocation import BloomFilter, RevocationList
+from src.oauth.token import generate_access_token
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test que todo lo añadido se encuentra y los falsos positivos quedan acotados"""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"jti:{i}")
+
+    assert all(f"jti:{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other:{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+async def test_subject_revocation_cuts_by_iat(clock):
+    """Test que revocar un sujeto invalida lo emitido antes y no lo posterior"""
+    revocations = RevocationList(capacity=100, clock=clock)
+    await revocations.revoke_subject("user")
+
+    assert await revocations.is_revoked({"sub": "user", "iat": clock.now - 10})
+    assert not await revocations.is_revoked({"sub": "user", "iat": clock.now + 10})
+    assert not await revocations.is_revoked({"sub": "other", "iat": clock.now - 10})
+
+async def test_revocation_reaches_other_workers():
+    """Test que una revocación llega por pub/sub al Bloom filter de otro worker"""
+    redis_client = fakeredis.aioredis.FakeRedis()
+    issuer, follower = RevocationList(capacity=100), RevocationList(capacity=100)
+    await follower.start(redis_client)
+    try:
+        await asyncio.sleep(0.05)  # suscripción activa
+        issuer.client = redis_client
+        await issuer.revoke_jti("abc", exp=issuer.clock() + 60)
+
+        for _ in range(50):
+            if "jti:abc" in follower.bloom:
+                break
+            await asyncio.sleep(0.01)
+        assert await follower.is_revoked({"sub": "user", "jti": "abc"})
+        assert not await follower.is_revoked({"sub": "user", "jti": "xyz"})
+    finally:
+        await follower.stop()
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(introspect, "revocation_list", RevocationList(capacity=100))
+    monkeypatch.setattr(introspect, "MCP_INTROSPECTION_TOKEN", "introspection-token")
+    app.dependency_overrides[get_code_store] = lambda: MemoryCodeStore()
+    yield TestClient(app, headers={"Authorization": "Bearer introspection-token"})
+    app.dependency_overrides.clear()
+
+def test_revoked_token_is_inactive(client):
+    """Test que tras /oauth/revoke la introspección devuelve inactive"""
+    token = generate_access_token("user", ["invoices.read"], "client")
+    other = generate_access_token("user", ["invoices.read"], "client")
+
+    assert client.post("/oauth/revoke", data={"token": token}).status_code == 200
+    assert client.post("/oauth/introspect", data={"token": token}).json() == {"active": False}
+    assert client.post("/oauth/introspect", data={"token": other}).json()["active"] is True
+    # RFC 7009: tokens inválidos también responden 200
+    assert client.post("/oauth/revoke", data={"token": "garbage"}).status_code == 200
@@ -0,0 +1,86 @@
+import shutil
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import admin, rules
+from src.oauth.consent import app
+from src.oauth.rules import RuleEngine, RuleSpecError, compile_condition
+
+REPO = Path(__file__).resolve().parents[2]
+ADMIN_TOKEN = "rules-admin-token"
+
+@pytest.fixture
+def engine(tmp_path):
+    runtime = tmp_path / "runtime"
+    runtime.mkdir()
+    for name in ("base-rules.active", "ventas.active"):
+        shutil.copy(REPO / "runtime" / name, runtime / name)
+    engine = RuleEngine(str(runtime), str(REPO / "specs"))
+    engine.reload()
+    return engine
+
+def names(matched) -> list:
+    return [rule.name for rule in matched]
+
+def test_conditions_compile_to_closures():
+    """Test de los operadores usados en los specs"""
+    assert compile_condition("first_contact == true")({"first_contact": True})
+    assert not compile_condition("business_hours == false")({"business_hours": True})
+    assert not compile_condition("business_hours == false")({})
+    assert compile_condition("stage == welcome")({"stage": "welcome"})
+    assert compile_condition("no_response_for > 24h")({"no_response_for": 25 * 3600})
+    assert compile_condition("result.updatesAvailable > 0")({"result": {"updatesAvailable": 2}})
+    assert compile_condition("schedule == '0 9 * * *'")({"schedule": "0 9 * * *"})
+    with pytest.raises(RuleSpecError):
+        compile_condition("stage in (a, b)")
+
+def test_keywords_match_whole_words_without_accents():
+    """Test que `contains` compara palabras completas, sin tildes ni mayúsculas"""
+    condition = compile_condition('text contains "codigo|clave|acceso"')
+    assert condition({"text": "Necesito mi CÓDIGO"})
+    assert not condition({"text": "codigos postales"})
+    assert not condition({"text": 42})
+
+def test_events_only_evaluate_their_trigger(engine):
+    """Test que un evento evalúa solo las reglas de su (tenant, trigger)"""
+    assert names(engine.evaluate("smarter-demo", "keyword", {"text": "¿Cuánto es el precio? Es urgente"})) == [
+        "cierre_directo", "urgente"
+    ]
+    assert names(engine.evaluate("smarter-demo", "inbound_message",
+                                 {"first_contact": True, "business_hours": False})) == ["welcome", "horario_fuera"]
+    assert engine.evaluate("otro-tenant", "keyword", {"text": "precio"}) == []
+
+def test_hot_reload_on_marker_change(engine):
+    """Test que quitar un marker o activar uno vacío recarga; un spec inválido no reemplaza al vigente"""
+    runtime = engine.runtime_dir
+    assert not engine.reload()
+
+    (runtime / "ventas.active").unlink()
+    assert engine.reload()
+    assert engine.evaluate("smarter-demo", "keyword", {"text": "precio"}) == []
+
+    # Marker vacío: activa specs/ventas.yaml
+    (runtime / "ventas.active").write_text("")
+    assert engine.reload()
+    assert names(engine.evaluate("smarter-demo", "keyword", {"text": "precio"})) == ["cierre_directo"]
+
+    (runtime / "broken.active").write_text("rules:\n  - trigger: keyword\n    condition: text ~ x\n")
+    with pytest.raises(RuleSpecError):
+        engine.reload()
+    assert not engine.reload()  # sin cambios no se reintenta
+    assert names(engine.evaluate("smarter-demo", "keyword", {"text": "precio"})) == ["cierre_directo"]
+
+def test_evaluate_endpoint(monkeypatch, engine):
+    """Test del endpoint de evaluación (requiere token de admin)"""
+    monkeypatch.setattr(admin, "MCP_ADMIN_TOKEN", ADMIN_TOKEN)
+    monkeypatch.setattr(rules, "rule_engine", engine)
+    client = TestClient(app)
+    event = {"tenant": "smarter-demo", "trigger": "stage_change", "context": {"stage": "qualified"}}
+
+    assert client.post("/rules/evaluate", json=event).status_code == 401
+    response = client.post("/rules/evaluate", json=event, headers={"Authorization": f"Bearer {ADMIN_TOKEN}"})
+    assert response.status_code == 200
+    assert response.json()["matches"] == [{
+        "rule": "agenda",
+        "action": {"type": "redirect", "url": "https://flow.smarterbot.cl/t/smarter-demo/agenda"},
+    }]
@@ -0,0 +1,95 @@
+from src.oauth.scopes import (
+    UNKNOWN_SCOPE_BIT,
+    AllowedScopesCache,
+    ScopeRegistry,
+    ScopeTrie,
+    denied_mask,
+)
+
+def test_granted_scopes_have_no_denied_bits():
+    """Test que scopes pedidos dentro de lo permitido no generan denegación"""
+    registry = ScopeRegistry(["invoices.read", "payments.read", "partners.read"])
+    allowed = registry.mask(["invoices.read", "payments.read"])
+    requested = registry.compile("payments.read invoices.read")
+
+    assert denied_mask(requested.mask, allowed) == 0
+    assert requested.scopes == ("payments.read", "invoices.read")
+
+def test_denied_scopes_are_reported_by_name():
+    """Test que el bitmask de denegación identifica los scopes no permitidos"""
+    registry = ScopeRegistry(["invoices.read", "payments.read", "partners.read"])
+    allowed = registry.mask(["invoices.read"])
+    requested = registry.compile("invoices.read partners.read")
+
+    assert registry.names(denied_mask(requested.mask, allowed)) == ["partners.read"]
+
+def test_unknown_and_empty_scopes_are_denied():
+    """Test que scopes desconocidos o vacíos nunca se conceden"""
+    registry = ScopeRegistry(["invoices.read"])
+    allowed = registry.mask(["invoices.read"])
+
+    assert denied_mask(registry.compile("admin.write").mask, allowed) & UNKNOWN_SCOPE_BIT
+    assert denied_mask(registry.compile("").mask, allowed) & UNKNOWN_SCOPE_BIT
+
+def test_interning_refreshes_compiled_strings():
+    """Test que un scope registrado después deja de contar como desconocido"""
+    registry = ScopeRegistry()
+    assert registry.compile("reports.read").mask == UNKNOWN_SCOPE_BIT
+
+    allowed = registry.mask(["reports.read"])
+    assert denied_mask(registry.compile("reports.read").mask, allowed) == 0
+
+def test_allowed_cache_invalidation():
+    """Test que la invalidación explícita elimina los bitmasks cacheados"""
+    cache = AllowedScopesCache()
+    cache.put("user", "client-a", 0b110)
+    cache.put("user", "client-b", 0b010)
+    cache.put("other", "client-a", 0b100)
+
+    cache.invalidate("user", "client-a")
+    assert cache.get("user", "client-a") is None
+    assert cache.get("user", "client-b") == 0b010
+
+    cache.invalidate("user")
+    assert cache.get("user", "client-b") is None
+    assert cache.get("other", "client-a") == 0b100
+
+def test_allowed_cache_entries_expire():
+    """Test que los grants cacheados vencen aunque nadie los invalide"""
+    now = [0.0]
+    cache = AllowedScopesCache(ttl=60, clock=lambda: now[0])
+    cache.put("user", "client", 0b110)
+    now[0] = 59.0
+    assert cache.get("user", "client") == 0b110
+    now[0] = 60.0
+    assert cache.get("user", "client") is None
+    assert len(cache) == 0
+
+def test_wildcard_trie_matches_by_segment():
+    """Test que `*` cubre un segmento y, al final, cualquier profundidad"""
+    trie = ScopeTrie(["invoices.*", "accounting.*.read"])
+
+    assert trie.matches("invoices.read")
+    assert trie.matches("invoices.lines.write")
+    assert trie.matches("accounting.ledger.read")
+    assert not trie.matches("invoices")
+    assert not trie.matches("accounting.ledger.write")
+    assert not trie.matches("accounting.ledger.entries.read")
+    assert not trie.matches("payments.read")
+    assert not trie.matches("invoices.")
+
+def test_grants_combine_exact_scopes_and_patterns():
+    """Test que los grants con comodines autorizan scopes conocidos y desconocidos"""
+    registry = ScopeRegistry(["invoices.read", "payments.read", "partners.read"])
+    granted = registry.grants(["payments.read", "invoices.*", "accounting.*.read"])
+
+    assert registry.denied(registry.compile("payments.read invoices.read"), granted) == 0
+    assert registry.denied(registry.compile("invoices.write accounting.ventas.read"), granted) == 0
+    assert registry.names(registry.denied(registry.compile("invoices.read partners.read"), granted)) == [
+        "partners.read"
+    ]
+    assert registry.denied(registry.compile("accounting.ventas.write"), granted) & UNKNOWN_SCOPE_BIT
+    assert registry.denied(registry.compile(""), granted) & UNKNOWN_SCOPE_BIT
+    # Los patrones no se registran como scopes y el trie se comparte entre grants iguales
+    assert "invoices.*" not in registry.names(granted.mask)
+    assert registry.grants(["invoices.*", "accounting.*.read"]).patterns is granted.patterns
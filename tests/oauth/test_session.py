@@ -0,0 +1,147 @@
+import asyncio
+import json
+import time
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+from src.oauth.session import LocalSessionVerifier, SessionCache, SessionValidator
+
+def make_session_token(exp_offset: int, sub: str = "user-1") -> str:
+    return jwt.encode({"sub": sub, "exp": int(time.time()) + exp_offset}, "supabase-secret")
+
+def make_validator(status_code: int = 200):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(status_code, json={"id": "user-1"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return SessionValidator(client, "https://supabase.test", "anon"), calls
+
+async def test_repeat_validation_skips_network():
+    """Test que una sesión ya validada se sirve desde cache"""
+    validator, calls = make_validator()
+    token = make_session_token(3600)
+
+    assert (await validator.validate(token))["id"] == "user-1"
+    assert (await validator.validate(token))["id"] == "user-1"
+    assert len(calls) == 1
+
+async def test_invalid_session_not_cached():
+    """Test que un token rechazado por Supabase devuelve 401 y no se cachea"""
+    validator, calls = make_validator(status_code=401)
+    token = make_session_token(3600)
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            await validator.validate(token)
+        assert exc.value.status_code == 401
+    assert len(calls) == 2
+
+def test_entry_capped_by_token_expiry():
+    """Test que la entrada no sobrevive al exp del token"""
+    cache = SessionCache(ttl=3600)
+    token = make_session_token(1)
+    cache.put(token, {"id": "user-1"})
+    assert cache.get(token) == {"id": "user-1"}
+
+    time.sleep(1.1)
+    assert cache.get(token) is None
+
+def test_lru_eviction_and_hashed_keys():
+    """Test que la cache es acotada y no guarda tokens en claro"""
+    cache = SessionCache(ttl=60, max_entries=2)
+    tokens = [make_session_token(3600, sub=f"u{i}") for i in range(3)]
+    for token in tokens:
+        cache.put(token, {"id": token})
+
+    assert len(cache) == 2
+    assert cache.get(tokens[0]) is None
+    assert all(token not in cache._entries for token in tokens)
+
+async def test_concurrent_validations_share_one_request():
+    """Test que N validaciones concurrentes del mismo token hacen una sola llamada"""
+    release = asyncio.Event()
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await release.wait()
+        return httpx.Response(200, json={"id": "user-1"})
+
+    validator = SessionValidator(httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+                                 "https://supabase.test", "anon")
+    token = make_session_token(3600)
+
+    pending = [asyncio.ensure_future(validator.validate(token)) for _ in range(20)]
+    await asyncio.sleep(0.01)
+    release.set()
+    results = await asyncio.gather(*pending)
+
+    assert len(calls) == 1
+    assert all(result["id"] == "user-1" for result in results)
+    assert len(validator.inflight) == 0
+
+def make_supabase_token(key, exp_offset: int, algorithm: str = "HS256", kid: str = None, **claims) -> str:
+    payload = {"sub": "user-local", "aud": "authenticated", "iss": "https://supabase.test/auth/v1",
+               "email": "ana@example.com", "exp": int(time.time()) + exp_offset, **claims}
+    return jwt.encode(payload, key, algorithm=algorithm, headers={"kid": kid} if kid else None)
+
+def make_local_validator(jwks: dict = None):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path.endswith("jwks.json"):
+            return httpx.Response(200, json=jwks or {"keys": []})
+        return httpx.Response(200, json={"id": "user-remote"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    verifier = LocalSessionVerifier(client, "https://supabase.test", jwt_secret="supabase-jwt-secret-0123456789abcdef")
+    return SessionValidator(client, "https://supabase.test", "anon", verifier=verifier), calls
+
+async def test_hs256_session_verified_locally():
+    """Test que con el JWT secret no se llama a /auth/v1/user y se validan aud e iss"""
+    validator, calls = make_local_validator()
+    secret = validator.verifier.jwt_secret
+
+    user = await validator.validate(make_supabase_token(secret, 3600))
+    assert (user["id"], user["email"]) == ("user-local", "ana@example.com")
+    assert calls == []
+
+    for token in (make_supabase_token(secret, 3600, aud="anon"),
+                  make_supabase_token(secret, 3600, iss="https://otro.test/auth/v1"),
+                  make_supabase_token("otro-secreto-0123456789abcdef0123", 3600),
+                  make_supabase_token(secret, -10)):
+        with pytest.raises(HTTPException) as exc:
+            await validator.validate(token)
+        assert exc.value.status_code == 401
+    assert calls == []
+
+async def test_near_expiry_session_confirmed_remotely():
+    """Test que un token a punto de vencer se confirma con Supabase"""
+    validator, calls = make_local_validator()
+    token = make_supabase_token(validator.verifier.jwt_secret, 30)
+
+    assert (await validator.validate(token))["id"] == "user-remote"
+    assert calls == ["/auth/v1/user"]
+
+async def test_asymmetric_session_verified_with_cached_jwks():
+    """Test que ES256 se verifica con el JWKS cacheado y un kid desconocido no pasa"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid="key-1", alg="ES256", use="sig")
+    validator, calls = make_local_validator({"keys": [jwk]})
+
+    for sub in ("a", "b"):
+        user = await validator.validate(make_supabase_token(private_key, 3600, "ES256", "key-1", sub=sub))
+        assert user["id"] == sub
+    assert calls == ["/auth/v1/.well-known/jwks.json"]
+
+    with pytest.raises(HTTPException) as exc:
+        await validator.validate(make_supabase_token(private_key, 3600, "ES256", "key-2"))
+    assert exc.value.status_code == 401
+    assert calls == ["/auth/v1/.well-known/jwks.json"]  # sin nueva descarga dentro del intervalo mínimo
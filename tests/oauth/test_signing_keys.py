@@ -0,0 +1,64 @@
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+from src.oauth import introspect, keys, token
+from src.oauth.consent import app
+from src.oauth.introspect import introspect_token
+from src.oauth.keys import KeyRing, create_key_ring
+from src.oauth.token import generate_access_token
+
+@pytest.fixture(params=["ES256", "EdDSA"])
+def key_ring(request, monkeypatch):
+    ring = KeyRing(request.param)
+    ring.generate("k1")
+    for module in (keys, token, introspect):
+        monkeypatch.setattr(module, "signing_keys", ring)
+    return ring
+
+def test_access_token_verifies_with_published_jwks(key_ring):
+    """Test que un gateway verifica el access_token solo con el JWKS (sin secreto)"""
+    access_token = generate_access_token("user", ["invoices.read"], "client")
+    kid = jwt.get_unverified_header(access_token)["kid"]
+    jwk = next(k for k in key_ring.jwks()["keys"] if k["kid"] == kid)
+
+    claims = jwt.decode(access_token, jwt.PyJWK(jwk).key, algorithms=[key_ring.alg])
+    assert claims["sub"] == "user"
+    assert introspect_token(access_token)["active"] is True
+
+def test_rotation_keeps_old_tokens_valid(key_ring):
+    """Test que tras rotar el kid los tokens previos siguen verificando"""
+    old_token = generate_access_token("user", ["invoices.read"], "client")
+    key_ring.generate("k2")
+    key_ring.activate("k2")
+    new_token = generate_access_token("user", ["invoices.read"], "client")
+
+    assert jwt.get_unverified_header(new_token)["kid"] == "k2"
+    assert key_ring.verify(old_token)["sub"] == "user"
+    assert {k["kid"] for k in key_ring.jwks()["keys"]} == {"k1", "k2"}
+
+    key_ring.retire("k1")
+    with pytest.raises(jwt.InvalidTokenError):
+        key_ring.verify(old_token)
+
+def test_hs256_token_rejected_by_key_ring(key_ring):
+    """Test que un token HS256 no se acepta cuando la firma es asimétrica"""
+    forged = jwt.encode({"sub": "user", "exp": 2**31, "type": "access_token"},
+                        token.MCP_ACCESS_TOKEN_SECRET, algorithm="HS256")
+    assert introspect_token(forged, "access_token") == {"active": False}
+
+def test_jwks_endpoint(key_ring):
+    """Test que /.well-known/jwks.json publica las claves públicas cacheables"""
+    response = TestClient(app).get("/.well-known/jwks.json")
+
+    assert response.status_code == 200
+    assert "max-age" in response.headers["cache-control"]
+    [jwk] = response.json()["keys"]
+    assert jwk["kid"] == "k1" and jwk["alg"] == key_ring.alg
+    assert "d" not in jwk  # nunca la parte privada
+
+def test_missing_keys_fail_at_startup_unless_dev_key(tmp_path):
+    """Test que sin claves no se genera en silencio una clave distinta por worker"""
+    with pytest.raises(ValueError):
+        create_key_ring("ES256", str(tmp_path), dev_key=False)
+    assert create_key_ring("ES256", str(tmp_path), dev_key=True).kids == ["dev"]
+    assert create_key_ring("HS256", None, dev_key=False) is None
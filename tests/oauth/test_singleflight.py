@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from src.oauth.singleflight import SingleFlight
+
+async def test_errors_are_shared_and_key_released():
+    """Test que el error se entrega a todos los que esperaban y la clave se libera"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*[flight.do("key", failing) for _ in range(5)], return_exceptions=True)
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(flight) == 0
+
+    # Tras terminar, una nueva llamada vuelve a ejecutar
+    with pytest.raises(RuntimeError):
+        await flight.do("key", failing)
+    assert calls == 2
+
+async def test_cancelled_caller_does_not_cancel_others():
+    """Test que cancelar al primer llamante no cancela a los demás"""
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    first = asyncio.ensure_future(flight.do("key", slow))
+    second = asyncio.ensure_future(flight.do("key", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "ok"
@@ -0,0 +1,48 @@
+import warnings
+import jwt
+from src.oauth.token_codec import (
+    encode_access_token,
+    encode_authorization_code,
+    encode_refresh_token,
+    get_codec,
+)
+
+SECRET = "codec-test-secret-with-at-least-32-bytes"
+
+def test_codec_output_matches_pyjwt():
+    """Test que el codec produce exactamente los mismos bytes que jwt.encode"""
+    claims = {"sub": "user", "client_id": "client", "scopes": ["invoices.read"],
+              "exp": 1900000000, "type": "access_token"}
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = jwt.encode(claims, SECRET, algorithm="HS256")
+
+    assert get_codec(SECRET).encode(claims) == expected
+
+def test_tokens_verify_with_pyjwt():
+    """Test que los tokens emitidos se verifican con PyJWT"""
+    now = 1700000000
+    access = encode_access_token(SECRET, "user", ["invoices.read"], "client", 3600, now)
+    refresh = encode_refresh_token(SECRET, "user", "client", 86400, now)
+    options = {"verify_exp": False}
+
+    access_claims = jwt.decode(access, SECRET, algorithms=["HS256"], options=options)
+    refresh_claims = jwt.decode(refresh, SECRET, algorithms=["HS256"], options=options)
+
+    assert access_claims["exp"] == now + 3600
+    assert refresh_claims["exp"] == now + 86400
+    assert access_claims["type"] == "access_token"
+
+def test_authorization_code_single_timestamp():
+    """Test que iat y exp del code salen del mismo instante"""
+    code, claims = encode_authorization_code(SECRET, "user", "client", ["read"], 120)
+    decoded = jwt.decode(code, SECRET, algorithms=["HS256"], audience="client")
+
+    assert decoded == claims
+    assert decoded["exp"] - decoded["iat"] == 120
+
+def test_codec_cached_per_secret():
+    """Test que se reutiliza un codec (y su HMAC) por secreto"""
+    assert get_codec(SECRET) is get_codec(SECRET)
+    assert get_codec(SECRET) is not get_codec(SECRET + "-other")